@@ -3,7 +3,12 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 import os
 
-from database import init_db
+from database import init_db, SessionLocal
+from document_parser import document_parser
+from llm_service import llm_service
+from match_jobs import match_job_manager
+from categorizer import local_categorizer
+import category_counts
 from routes import upload, database, matching
 
 # Initialize FastAPI app
@@ -33,6 +38,19 @@ async def startup_event():
     # Initialize database
     init_db()
     
+    # Jobs left running by a dead process will never finish; live workers' jobs keep running
+    db = SessionLocal()
+    try:
+        match_job_manager.mark_interrupted(db)
+        category_counts.ensure_seeded(db)
+        local_categorizer.ensure_trained(db)
+    finally:
+        db.close()
+    match_job_manager.start()
+    
+    # Open pooled LLM HTTP connections
+    await llm_service.startup()
+    
     # Create upload directories
     os.makedirs("uploads/cvs", exist_ok=True)
     os.makedirs("uploads/jds", exist_ok=True)
@@ -41,6 +59,14 @@ async def startup_event():
     print("✅ Upload directories created")
     print("🚀 Server is ready!")
 
+# Shutdown event
+@app.on_event("shutdown")
+async def shutdown_event():
+    # Stop the job heartbeat and document parsing workers, close LLM connections
+    match_job_manager.stop()
+    document_parser.shutdown()
+    await llm_service.shutdown()
+
 @app.get("/")
 async def root():
     return {
@@ -51,7 +77,7 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy"}
+    return {"status": "healthy", "llm": llm_service.backend_status()}
 
 if __name__ == "__main__":
     import uvicorn
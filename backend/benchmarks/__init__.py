@@ -0,0 +1 @@
+# Local performance benchmarks; see README.md ("Benchmarks")
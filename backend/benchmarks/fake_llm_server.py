@@ -0,0 +1,152 @@
+"""
+Local stand-in for Ollama's /api/generate and OpenAI's chat-completions endpoint,
+with configurable latency, jitter and error injection.
+
+    python -m benchmarks.fake_llm_server --port 9000 --latency 0.3 --jitter 0.1 --error-rate 0.05
+
+Point the backend at it with OLLAMA_URL=http://127.0.0.1:9000 and
+OPENAI_BASE_URL=http://127.0.0.1:9000/v1 (any OPENAI_API_KEY value works).
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+import time
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+CATEGORIES = [
+    "Software Engineering",
+    "Artificial Intelligence / Machine Learning",
+    "Cybersecurity",
+    "Sales & Marketing",
+    "Finance & Accounting",
+    "Data Science",
+    "Product Management",
+]
+
+SKILLS = ["python", "java", "sql", "aws", "docker", "kubernetes", "react", "excel", "salesforce", "tableau", "spark", "terraform"]
+
+
+def create_app(latency: float = 0.2, jitter: float = 0.05, error_rate: float = 0.0, retry_after: float = 0.5, seed: int = None) -> FastAPI:
+    """
+    Build the fake server. Each call sleeps `latency` +/- `jitter` seconds; a
+    fraction `error_rate` of calls fail, alternating 429 (with Retry-After) and 503.
+    """
+    app = FastAPI(title="Fake LLM server")
+    rng = random.Random(seed)
+    stats = {"requests": 0, "errors": 0}
+
+    async def simulate() -> JSONResponse:
+        stats["requests"] += 1
+        await asyncio.sleep(max(0.0, rng.uniform(latency - jitter, latency + jitter)))
+        if rng.random() < error_rate:
+            stats["errors"] += 1
+            if stats["errors"] % 2:
+                return JSONResponse(
+                    status_code=429,
+                    content={"error": {"message": "Rate limit exceeded", "type": "rate_limit"}},
+                    headers={"Retry-After": str(retry_after)}
+                )
+            return JSONResponse(status_code=503, content={"error": {"message": "Overloaded"}})
+        return None
+
+    def match_result() -> dict:
+        score = rng.randint(20, 95)
+        level = "Excellent" if score >= 85 else "Good" if score >= 65 else "Fair" if score >= 45 else "Poor"
+        return {
+            "score": score,
+            "match_level": level,
+            "key_matches": ["Relevant experience", "Matching core skills"],
+            "gaps": ["Missing one preferred certification"],
+            "summary": "Synthetic assessment produced by the fake LLM server."
+        }
+
+    def completion_text(prompt: str) -> str:
+        if "categorize it into ONE" in prompt:
+            return rng.choice(CATEGORIES)
+        if "Extract a structured profile" in prompt:
+            return json.dumps({
+                "skills": rng.sample(SKILLS, 6),
+                "titles": ["Software Engineer"],
+                "years_experience": rng.randint(0, 15),
+                "education": ["BSc Computer Science"],
+                "certifications": []
+            })
+        pack_ids = re.findall(r"=== CV (C\d+) ===", prompt)
+        if pack_ids:
+            return json.dumps({"results": [{"id": cv_id, **match_result()} for cv_id in pack_ids]})
+        return json.dumps(match_result())
+
+    @app.get("/stats")
+    async def get_stats():
+        return stats
+
+    @app.post("/api/generate")
+    async def ollama_generate(request: Request):
+        body = await request.json()
+        error = await simulate()
+        if error is not None:
+            return error
+        text = completion_text(body.get("prompt", ""))
+        if not body.get("stream", True):
+            return {"model": body.get("model"), "response": text, "done": True}
+
+        async def chunks():
+            for start in range(0, len(text), 16):
+                yield json.dumps({"response": text[start:start + 16], "done": False}) + "\n"
+            yield json.dumps({"response": "", "done": True}) + "\n"
+
+        return StreamingResponse(chunks(), media_type="application/x-ndjson")
+
+    @app.post("/v1/chat/completions")
+    async def openai_chat(request: Request):
+        body = await request.json()
+        error = await simulate()
+        if error is not None:
+            return error
+        prompt = "\n".join(message.get("content", "") for message in body.get("messages", []))
+        text = completion_text(prompt)
+        prompt_tokens = len(prompt) // 4
+        completion_tokens = len(text) // 4
+        return {
+            "id": f"chatcmpl-{stats['requests']}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": text},
+                "finish_reason": "stop"
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens
+            }
+        }
+
+    return app
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency", type=float, default=0.2, help="Mean seconds per call")
+    parser.add_argument("--jitter", type=float, default=0.05, help="Uniform +/- seconds around the mean")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of calls answered with 429/503")
+    parser.add_argument("--retry-after", type=float, default=0.5, help="Retry-After seconds sent with 429s")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    app = create_app(args.latency, args.jitter, args.error_rate, args.retry_after, args.seed)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Concurrent write/read load test for the SQLite storage layer.
+
+Runs the backend with several uvicorn workers against the fake LLM server and,
+for a fixed duration, keeps uploads, matches and listing/history reads in flight
+at the same time. Fails (exit code 1) if any request errors, and reports
+how many of those were "database is locked".
+
+    cd backend
+    python -m benchmarks.load_test_sqlite --workers 4 --duration 30
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+
+import httpx
+
+from benchmarks.run_benchmark import Backend, FakeLLMServer, _files_payload, free_port, percentile
+from benchmarks.synthetic_docs import generate_documents
+
+
+async def run_load(base_url: str, args, docs_dir: str) -> dict:
+    cv_paths = generate_documents(os.path.join(docs_dir, "cvs"), args.upload_batch * 20, "cv", seed=1)
+    jd_paths = generate_documents(os.path.join(docs_dir, "jds"), 3, "jd", seed=2)
+    outcomes = Counter()
+    locked = Counter()
+    latencies = {"upload": [], "match": [], "list": [], "history": []}
+    deadline = time.monotonic() + args.duration
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.request_timeout) as client:
+        # Seed a few CVs so matches have candidates from the start
+        response = await client.post("/api/upload/cv", files=_files_payload(cv_paths[:args.upload_batch], "files"))
+        response.raise_for_status()
+
+        jd_ids = []
+        for path in jd_paths:
+            response = await client.post("/api/upload/jd", files=_files_payload([path], "file"))
+            response.raise_for_status()
+            jd_ids.append(response.json()["id"])
+
+        async def call(kind: str, send):
+            start = time.perf_counter()
+            try:
+                response = await send()
+                body = response.text
+                upload_failed = kind == "upload" and response.status_code == 200 and response.json()["failed"]
+                if response.status_code >= 400 or upload_failed:
+                    outcomes[f"{kind}_error"] += 1
+                    print(f"  {kind} failed: HTTP {response.status_code} {body[:200]}", file=sys.stderr)
+                    if "database is locked" in body:
+                        locked[kind] += 1
+                else:
+                    outcomes[f"{kind}_ok"] += 1
+                    latencies[kind].append(time.perf_counter() - start)
+            except httpx.HTTPError as e:
+                outcomes[f"{kind}_error"] += 1
+                print(f"  {kind} failed: {e}", file=sys.stderr)
+
+        async def uploader(worker: int):
+            batch = 0
+            while time.monotonic() < deadline:
+                offset = ((worker * 7 + batch) * args.upload_batch) % len(cv_paths)
+                paths = cv_paths[offset:offset + args.upload_batch]
+                await call("upload", lambda: client.post("/api/upload/cv", files=_files_payload(paths, "files")))
+                batch += 1
+
+        async def matcher(worker: int):
+            round_ = 0
+            while time.monotonic() < deadline:
+                jd_id = jd_ids[(worker + round_) % len(jd_ids)]
+                await call("match", lambda: client.post("/api/match", json={"jd_id": jd_id, "model": args.model, "top_k": 10, "force_refresh": True}))
+                round_ += 1
+
+        async def reader():
+            while time.monotonic() < deadline:
+                await call("list", lambda: client.get("/api/documents", params={"file_type": "cv", "limit": 50}))
+                await call("history", lambda: client.get("/api/match/history", params={"limit": 50}))
+                await call("list", lambda: client.get("/api/documents/categories"))
+
+        await asyncio.gather(
+            *(uploader(i) for i in range(args.uploaders)),
+            *(matcher(i) for i in range(args.matchers)),
+            *(reader() for _ in range(args.readers)),
+        )
+
+    return {
+        "outcomes": dict(outcomes),
+        "database_locked_errors": dict(locked),
+        "latency_ms": {
+            kind: {
+                "p50": round(percentile(values, 50) * 1000, 1) if values else None,
+                "p95": round(percentile(values, 95) * 1000, 1) if values else None,
+            }
+            for kind, values in latencies.items()
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4, help="uvicorn worker processes")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds of sustained load")
+    parser.add_argument("--uploaders", type=int, default=4)
+    parser.add_argument("--matchers", type=int, default=4)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--upload-batch", type=int, default=5)
+    parser.add_argument("--model", default="gpt-4o-mini")
+    parser.add_argument("--latency", type=float, default=0.05, help="Fake LLM mean latency (s)")
+    parser.add_argument("--request-timeout", type=float, default=120.0)
+    args = parser.parse_args()
+
+    llm_port = free_port()
+    with FakeLLMServer(llm_port, latency=args.latency, jitter=args.latency / 2, seed=0), \
+            tempfile.TemporaryDirectory(prefix="cvload_docs_") as docs_dir, \
+            Backend(free_port(), llm_port, {"LLM_BACKOFF_BASE": "0.2"}, workers=args.workers) as backend:
+        report = asyncio.run(run_load(backend.base_url, args, docs_dir))
+
+    report["config"] = vars(args)
+    print(json.dumps(report, indent=2))
+    failed = sum(count for key, count in report["outcomes"].items() if key.endswith("_error"))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
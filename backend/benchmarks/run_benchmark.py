@@ -0,0 +1,284 @@
+"""
+Upload and matching throughput benchmark against a fake LLM backend.
+
+For every corpus size, starts a fresh backend (clean database) in a subprocess
+wired to an in-process fake LLM server, then drives /api/upload/cv,
+/api/upload/jd and /api/match at each concurrency level. Prints a JSON report
+with throughput, p50/p95/p99 latency and the backend's peak RSS.
+
+    cd backend
+    python -m benchmarks.run_benchmark --sizes 20 100 --concurrency 1 4 --output bench.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional
+
+import httpx
+
+from benchmarks.fake_llm_server import create_app
+from benchmarks.synthetic_docs import generate_documents
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+def summarize(scenario: str, corpus_size: int, concurrency: int, latencies: List[float], errors: int, wall: float, items: int) -> Dict:
+    return {
+        "scenario": scenario,
+        "corpus_size": corpus_size,
+        "concurrency": concurrency,
+        "requests": len(latencies) + errors,
+        "errors": errors,
+        "items": items,
+        "wall_seconds": round(wall, 3),
+        "throughput_rps": round(len(latencies) / wall, 3) if wall else None,
+        "items_per_second": round(items / wall, 3) if wall else None,
+        "latency_ms": {
+            name: round(value * 1000, 1) if value is not None else None
+            for name, value in (
+                ("p50", percentile(latencies, 50)),
+                ("p95", percentile(latencies, 95)),
+                ("p99", percentile(latencies, 99)),
+            )
+        },
+    }
+
+
+def peak_rss_mb(pid: int) -> Optional[float]:
+    """Peak resident set size of a running process (Linux /proc only)."""
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        return None
+    return None
+
+
+class FakeLLMServer:
+    """Runs the fake LLM server in a background thread."""
+
+    def __init__(self, port: int, **options):
+        import uvicorn
+
+        config = uvicorn.Config(create_app(**options), host="127.0.0.1", port=port, log_level="warning")
+        self.server = uvicorn.Server(config)
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.05)
+        return self
+
+    def __exit__(self, *exc):
+        self.server.should_exit = True
+        self.thread.join(timeout=5)
+
+
+class Backend:
+    """Starts the API with uvicorn in a scratch directory so each run gets a clean database."""
+
+    def __init__(self, port: int, llm_port: int, env_overrides: Dict[str, str], workers: int = 1):
+        self.port = port
+        self.workers = workers
+        self.workdir = tempfile.mkdtemp(prefix="cvbench_")
+        self.env = {
+            **os.environ,
+            "PYTHONPATH": BACKEND_DIR + os.pathsep + os.environ.get("PYTHONPATH", ""),
+            "OLLAMA_URL": f"http://127.0.0.1:{llm_port}",
+            "OPENAI_BASE_URL": f"http://127.0.0.1:{llm_port}/v1",
+            "OPENAI_API_KEY": "benchmark",
+            **env_overrides,
+        }
+        self.process: Optional[subprocess.Popen] = None
+        self.base_url = f"http://127.0.0.1:{port}"
+
+    def __enter__(self):
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1", "--port", str(self.port),
+             "--workers", str(self.workers), "--log-level", "warning"],
+            cwd=self.workdir,
+            env=self.env,
+            stdout=subprocess.DEVNULL,
+        )
+        deadline = time.time() + 30
+        while time.time() < deadline:
+            try:
+                if httpx.get(f"{self.base_url}/health", timeout=1).status_code == 200:
+                    return self
+            except httpx.HTTPError:
+                time.sleep(0.2)
+        raise RuntimeError("Backend did not start within 30s")
+
+    def peak_rss_mb(self) -> Optional[float]:
+        return peak_rss_mb(self.process.pid)
+
+    def __exit__(self, *exc):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+async def run_concurrently(jobs, concurrency: int):
+    """Run async callables with at most `concurrency` in flight; returns (latencies, errors, wall seconds)."""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, errors = [], 0
+
+    async def run(job):
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await job()
+                latencies.append(time.perf_counter() - start)
+            except Exception as e:
+                errors += 1
+                print(f"  request failed: {e}", file=sys.stderr)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(run(job) for job in jobs))
+    return latencies, errors, time.perf_counter() - start
+
+
+def _files_payload(paths: List[str], field: str):
+    payload = []
+    for path in paths:
+        with open(path, "rb") as file:
+            payload.append((field, (os.path.basename(path), file.read(), "application/octet-stream")))
+    return payload
+
+
+async def bench_size(base_url: str, corpus_size: int, concurrency_levels: List[int], args, docs_dir: str) -> List[Dict]:
+    results = []
+    cv_paths = generate_documents(os.path.join(docs_dir, f"cvs_{corpus_size}"), corpus_size, "cv", seed=corpus_size)
+    jd_paths = generate_documents(os.path.join(docs_dir, f"jds_{corpus_size}"), max(concurrency_levels), "jd", seed=corpus_size + 1)
+    batches = [cv_paths[i:i + args.upload_batch] for i in range(0, len(cv_paths), args.upload_batch)]
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.request_timeout) as client:
+        # CVs are uploaded once per corpus, at the highest concurrency level
+        upload_concurrency = max(concurrency_levels)
+
+        async def upload_batch(batch):
+            response = await client.post("/api/upload/cv", files=_files_payload(batch, "files"))
+            response.raise_for_status()
+            if response.json()["failed"]:
+                raise RuntimeError(f"{response.json()['failed']} CVs failed to upload: {response.json()['errors'][0]['error']}")
+
+        latencies, errors, wall = await run_concurrently([lambda b=b: upload_batch(b) for b in batches], upload_concurrency)
+        results.append(summarize("upload_cv", corpus_size, upload_concurrency, latencies, errors, wall, corpus_size))
+
+        jd_ids = []
+
+        async def upload_jd(path):
+            response = await client.post("/api/upload/jd", files=_files_payload([path], "file"))
+            response.raise_for_status()
+            jd_ids.append(response.json()["id"])
+
+        latencies, errors, wall = await run_concurrently([lambda p=p: upload_jd(p) for p in jd_paths], upload_concurrency)
+        results.append(summarize("upload_jd", corpus_size, upload_concurrency, latencies, errors, wall, len(jd_paths)))
+
+        for concurrency in concurrency_levels:
+            async def match(jd_id):
+                response = await client.post("/api/match", json={
+                    "jd_id": jd_id,
+                    "model": args.model,
+                    "force_refresh": True,
+                    "packed": args.packed,
+                })
+                response.raise_for_status()
+
+            jobs = [lambda j=jd_ids[i % len(jd_ids)]: match(j) for i in range(args.match_requests)]
+            latencies, errors, wall = await run_concurrently(jobs, concurrency)
+            results.append(summarize("match", corpus_size, concurrency, latencies, errors, wall, args.match_requests * corpus_size))
+
+        # Every JD against the whole pool in one request, to compare with per-JD matches above
+        async def match_bulk():
+            response = await client.post("/api/match/bulk", json={
+                "jd_ids": jd_ids,
+                "model": args.model,
+                "force_refresh": True,
+                "same_category": False,
+                "packed": args.packed,
+            })
+            response.raise_for_status()
+
+        latencies, errors, wall = await run_concurrently([match_bulk], 1)
+        results.append(summarize("match_bulk", corpus_size, 1, latencies, errors, wall, len(jd_ids) * corpus_size))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[20, 60], help="CV corpus sizes")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4], help="Client concurrency levels for /api/match")
+    parser.add_argument("--match-requests", type=int, default=4, help="Match requests per concurrency level")
+    parser.add_argument("--upload-batch", type=int, default=10, help="CV files per upload request")
+    parser.add_argument("--model", default="gpt-4o-mini", help="Model passed to /api/match ('ollama' uses the fake Ollama endpoint)")
+    parser.add_argument("--packed", action="store_true", help="Use listwise matching (several CVs per LLM request)")
+    parser.add_argument("--latency", type=float, default=0.2, help="Fake LLM mean latency (s)")
+    parser.add_argument("--jitter", type=float, default=0.05, help="Fake LLM latency jitter (s)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fake LLM 429/503 rate")
+    parser.add_argument("--request-timeout", type=float, default=600.0)
+    parser.add_argument("--env", nargs="*", default=[], metavar="KEY=VALUE", help="Extra backend environment, e.g. OPENAI_MAX_CONCURRENCY=16")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    env_overrides = dict(item.split("=", 1) for item in args.env)
+    env_overrides.setdefault("LLM_BACKOFF_BASE", "0.2")
+    report = {
+        "config": {**vars(args), "python": platform.python_version(), "platform": platform.platform()},
+        "runs": [],
+    }
+
+    llm_port = free_port()
+    with FakeLLMServer(llm_port, latency=args.latency, jitter=args.jitter, error_rate=args.error_rate, seed=0), \
+            tempfile.TemporaryDirectory(prefix="cvbench_docs_") as docs_dir:
+        for size in args.sizes:
+            print(f"Benchmarking corpus of {size} CVs...", file=sys.stderr)
+            with Backend(free_port(), llm_port, env_overrides) as backend:
+                results = asyncio.run(bench_size(backend.base_url, size, args.concurrency, args, docs_dir))
+                report["runs"].append({
+                    "corpus_size": size,
+                    "peak_rss_mb": backend.peak_rss_mb(),
+                    "results": results,
+                })
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
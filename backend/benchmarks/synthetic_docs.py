@@ -0,0 +1,124 @@
+"""Synthetic CV and JD generators writing PDF or DOCX files."""
+import os
+import random
+from typing import List
+
+from docx import Document as DocxDocument
+
+SKILLS = [
+    "Python", "Java", "Go", "TypeScript", "React", "Django", "FastAPI", "Kubernetes", "Docker", "AWS",
+    "Azure", "GCP", "PostgreSQL", "MongoDB", "Kafka", "Spark", "PyTorch", "TensorFlow", "scikit-learn",
+    "Terraform", "CI/CD", "Linux", "SIEM", "Penetration testing", "Salesforce", "HubSpot", "SEO",
+    "Financial modelling", "Excel", "SQL", "Tableau", "Figma", "Product roadmaps", "Agile", "Scrum",
+]
+TITLES = [
+    "Software Engineer", "Senior Backend Engineer", "Machine Learning Engineer", "Data Scientist",
+    "Security Analyst", "DevOps Engineer", "Account Executive", "Financial Analyst", "Product Manager",
+    "UX Designer",
+]
+COMPANIES = ["Acme Corp", "Globex", "Initech", "Umbrella", "Hooli", "Stark Industries", "Wayne Enterprises"]
+DEGREES = ["BSc Computer Science", "MSc Data Science", "BA Economics", "MBA", "BEng Electrical Engineering"]
+
+
+def make_cv_text(rng: random.Random, index: int) -> str:
+    title = rng.choice(TITLES)
+    lines = [
+        f"Candidate {index}",
+        f"{title}",
+        f"Email: candidate{index}@example.com | Phone: +1 555 {index:04d}",
+        "",
+        "SUMMARY",
+        f"{title} with {rng.randint(1, 15)} years of experience delivering production systems.",
+        "",
+        "SKILLS",
+        ", ".join(rng.sample(SKILLS, rng.randint(5, 12))),
+        "",
+        "EXPERIENCE",
+    ]
+    for _ in range(rng.randint(2, 4)):
+        lines.append(f"{rng.choice(TITLES)} at {rng.choice(COMPANIES)} ({rng.randint(2008, 2020)} - {rng.randint(2021, 2025)})")
+        for _ in range(rng.randint(2, 4)):
+            lines.append(f"- Built and operated services using {rng.choice(SKILLS)} and {rng.choice(SKILLS)}.")
+    lines += ["", "EDUCATION", rng.choice(DEGREES)]
+    return "\n".join(lines)
+
+
+def make_jd_text(rng: random.Random, index: int) -> str:
+    title = rng.choice(TITLES)
+    lines = [
+        f"Job Description {index}: {title}",
+        "",
+        "ABOUT THE ROLE",
+        f"We are hiring a {title} to join a growing team.",
+        "",
+        "REQUIREMENTS",
+    ]
+    lines += [f"- {rng.randint(1, 5)}+ years with {skill}" for skill in rng.sample(SKILLS, rng.randint(4, 8))]
+    lines += ["", "NICE TO HAVE"]
+    lines += [f"- {skill}" for skill in rng.sample(SKILLS, 3)]
+    return "\n".join(lines)
+
+
+def write_docx(path: str, text: str):
+    doc = DocxDocument()
+    for line in text.splitlines():
+        doc.add_paragraph(line)
+    doc.save(path)
+
+
+def _pdf_escape(line: str) -> str:
+    return line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_pdf(path: str, text: str, lines_per_page: int = 55):
+    """Write a minimal single-font PDF that PyPDF2 can extract text from."""
+    lines = text.splitlines() or [""]
+    pages = [lines[i:i + lines_per_page] for i in range(0, len(lines), lines_per_page)]
+
+    objects = [b"", b"", b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]  # 1: catalog, 2: pages, 3: font
+    page_ids = []
+    for page_lines in pages:
+        body = ["BT", "/F1 10 Tf", "13 TL", "50 780 Td"]
+        body += [f"({_pdf_escape(line)}) Tj T*" for line in page_lines]
+        body.append("ET")
+        stream = "\n".join(body).encode("latin-1", "replace")
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        content_id = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents %d 0 R "
+            b"/Resources << /Font << /F1 3 0 R >> >> >>" % content_id
+        )
+        page_ids.append(len(objects))
+    objects[0] = b"<< /Type /Catalog /Pages 2 0 R >>"
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids).encode()
+    objects[1] = b"<< /Type /Pages /Kids [" + kids + b"] /Count %d >>" % len(page_ids)
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    with open(path, "wb") as file:
+        file.write(out)
+
+
+def generate_documents(directory: str, count: int, kind: str = "cv", seed: int = 0, pdf_ratio: float = 0.5) -> List[str]:
+    """Write `count` synthetic CVs or JDs into `directory`, mixing PDF and DOCX; returns their paths."""
+    os.makedirs(directory, exist_ok=True)
+    rng = random.Random(seed)
+    make_text = make_cv_text if kind == "cv" else make_jd_text
+    paths = []
+    for index in range(count):
+        text = make_text(rng, index)
+        if rng.random() < pdf_ratio:
+            path = os.path.join(directory, f"{kind}_{index}.pdf")
+            write_pdf(path, text)
+        else:
+            path = os.path.join(directory, f"{kind}_{index}.docx")
+            write_docx(path, text)
+        paths.append(path)
+    return paths
@@ -0,0 +1,195 @@
+import json
+import math
+import os
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import func, or_
+from sqlalchemy.orm import Session
+
+from models import CategorizerModel, Document
+from llm_service import llm_service, CATEGORIES
+from document_parser import document_parser
+from ranking import tokenize
+
+# Local fast-path categorization; the LLM is only asked when the model is unsure
+LOCAL_CATEGORIZER = os.getenv("LOCAL_CATEGORIZER", "true").lower() in ("1", "true", "yes")
+LOCAL_CATEGORIZER_THRESHOLD = float(os.getenv("LOCAL_CATEGORIZER_THRESHOLD", "0.9"))
+LOCAL_CATEGORIZER_MIN_DOCS = int(os.getenv("LOCAL_CATEGORIZER_MIN_DOCS", "50"))
+
+# Vocabulary cap and Laplace smoothing for the Naive Bayes model
+_MAX_VOCABULARY = 20000
+_ALPHA = 1.0
+# Every fifth training document (by id) is held out to measure agreement with the LLM
+_HOLDOUT_MODULUS = 5
+
+
+class LocalCategorizer:
+    """
+    Multinomial Naive Bayes over the set of distinct terms in a document's digest,
+    trained on documents the LLM categorized. Log-likelihoods are divided by the
+    square root of the term count before normalizing, so confidence reflects how
+    clearly a document separates rather than just how long it is.
+    The trained model is stored in SQLite; every worker reloads it when it changes.
+    """
+
+    def __init__(self):
+        self.trained_at: Optional[datetime] = None
+        self.class_docs: Dict[str, int] = {}
+        self.class_terms: Dict[str, Dict[str, int]] = {}
+        self.class_totals: Dict[str, int] = {}
+        self.vocabulary_size = 0
+
+    @property
+    def ready(self) -> bool:
+        return bool(self.class_docs)
+
+    @staticmethod
+    def _features(text: Optional[str]) -> set:
+        return set(tokenize(text))
+
+    def _fit(self, samples: List[Tuple[set, str]]):
+        class_docs = Counter(label for _, label in samples)
+        document_frequency = Counter(term for terms, _ in samples for term in terms)
+        vocabulary = {
+            term for term, count in document_frequency.most_common(_MAX_VOCABULARY) if count >= 2
+        }
+        class_terms: Dict[str, Counter] = {label: Counter() for label in class_docs}
+        for terms, label in samples:
+            class_terms[label].update(terms & vocabulary)
+
+        self.class_docs = dict(class_docs)
+        self.class_terms = {label: dict(counts) for label, counts in class_terms.items()}
+        self.class_totals = {label: sum(counts.values()) for label, counts in class_terms.items()}
+        self.vocabulary_size = len(vocabulary)
+
+    def predict(self, text: Optional[str]) -> Tuple[Optional[str], float]:
+        """(category, confidence in [0, 1]); (None, 0.0) when untrained or nothing is known."""
+        return self._predict_terms(self._features(text))
+
+    def _predict_terms(self, features: set) -> Tuple[Optional[str], float]:
+        if not self.ready:
+            return None, 0.0
+        terms = [term for term in features if any(term in counts for counts in self.class_terms.values())]
+        if not terms:
+            return None, 0.0
+
+        total_docs = sum(self.class_docs.values())
+        scale = math.sqrt(len(terms))
+        scores = {}
+        for label, docs in self.class_docs.items():
+            counts = self.class_terms[label]
+            denominator = self.class_totals[label] + _ALPHA * self.vocabulary_size
+            log_likelihood = sum(math.log((counts.get(term, 0) + _ALPHA) / denominator) for term in terms)
+            scores[label] = math.log(docs / total_docs) + log_likelihood / scale
+
+        best = max(scores, key=scores.get)
+        top = scores[best]
+        normalizer = sum(math.exp(score - top) for score in scores.values())
+        return best, 1.0 / normalizer
+
+    def _to_json(self) -> str:
+        return json.dumps({
+            "class_docs": self.class_docs,
+            "class_terms": self.class_terms,
+            "vocabulary_size": self.vocabulary_size,
+        })
+
+    def _from_json(self, payload: str):
+        data = json.loads(payload)
+        self.class_docs = data["class_docs"]
+        self.class_terms = data["class_terms"]
+        self.class_totals = {label: sum(counts.values()) for label, counts in self.class_terms.items()}
+        self.vocabulary_size = data["vocabulary_size"]
+
+    def ensure_loaded(self, db: Session):
+        """Load the latest stored model if it is newer than the one in memory."""
+        latest = db.query(func.max(CategorizerModel.trained_at)).scalar()
+        if latest is None or latest == self.trained_at:
+            return
+        row = db.query(CategorizerModel).filter(CategorizerModel.trained_at == latest).first()
+        self._from_json(row.model_json)
+        self.trained_at = row.trained_at
+
+    def _training_samples(self, db: Session) -> List[Tuple[int, set, str]]:
+        """(id, terms, category) for documents categorized by the LLM into a known category."""
+        rows = db.query(Document.id, Document.file_type, Document.category, Document.digest, Document.text_content).filter(
+            Document.category.in_(CATEGORIES),
+            or_(Document.category_source.is_(None), Document.category_source == "llm")
+        ).order_by(Document.id).yield_per(200)
+        return [
+            (row.id, self._features(row.digest or document_parser.build_digest(row.text_content, row.file_type)), row.category)
+            for row in rows
+        ]
+
+    def _evaluate(self, samples: List[Tuple[int, set, str]]) -> Dict:
+        """Agreement with the LLM's labels on held-out documents, from a model trained on the rest."""
+        train = [(terms, label) for doc_id, terms, label in samples if doc_id % _HOLDOUT_MODULUS]
+        holdout = [(terms, label) for doc_id, terms, label in samples if not doc_id % _HOLDOUT_MODULUS]
+        if not train or not holdout:
+            return {"holdout_documents": len(holdout)}
+
+        self._fit(train)
+        agree = confident = confident_agree = 0
+        for terms, label in holdout:
+            predicted, confidence = self._predict_terms(terms)
+            agree += predicted == label
+            if confidence >= LOCAL_CATEGORIZER_THRESHOLD:
+                confident += 1
+                confident_agree += predicted == label
+        return {
+            "holdout_documents": len(holdout),
+            "agreement": round(agree / len(holdout), 4),
+            "threshold": LOCAL_CATEGORIZER_THRESHOLD,
+            # Share of documents that would skip the LLM, and how often those match it
+            "coverage": round(confident / len(holdout), 4),
+            "agreement_when_confident": round(confident_agree / confident, 4) if confident else None,
+        }
+
+    def train(self, db: Session) -> Dict:
+        """Retrain on every LLM-categorized document, store the model and report holdout agreement."""
+        samples = self._training_samples(db)
+        if len(samples) < LOCAL_CATEGORIZER_MIN_DOCS:
+            return {
+                "trained": False,
+                "documents": len(samples),
+                "detail": f"At least {LOCAL_CATEGORIZER_MIN_DOCS} LLM-categorized documents are needed"
+            }
+
+        report = self._evaluate(samples)
+        self._fit([(terms, label) for _, terms, label in samples])
+        self.trained_at = datetime.utcnow()
+        db.query(CategorizerModel).delete()
+        db.add(CategorizerModel(trained_at=self.trained_at, documents=len(samples), model_json=self._to_json()))
+        db.commit()
+        return {
+            "trained": True,
+            "documents": len(samples),
+            "categories": dict(sorted(self.class_docs.items())),
+            "vocabulary_size": self.vocabulary_size,
+            **report
+        }
+
+    def ensure_trained(self, db: Session):
+        """Train once from existing documents if no model is stored yet (run at startup)."""
+        if not LOCAL_CATEGORIZER:
+            return
+        self.ensure_loaded(db)
+        if not self.ready:
+            report = self.train(db)
+            if report["trained"]:
+                print(f"✅ Local categorizer trained on {report['documents']} documents")
+
+    async def categorize(self, db: Session, text: str, doc_type: str) -> Tuple[str, str]:
+        """(category, source): answered locally when confident, otherwise by the LLM."""
+        if LOCAL_CATEGORIZER:
+            self.ensure_loaded(db)
+            category, confidence = self.predict(text)
+            if category is not None and confidence >= LOCAL_CATEGORIZER_THRESHOLD:
+                return category, "local"
+        return await llm_service.categorize_document(text, doc_type), "llm"
+
+
+# Singleton instance
+local_categorizer = LocalCategorizer()
@@ -0,0 +1,51 @@
+from typing import Dict, List
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from models import CategoryCount, Document
+
+
+def adjust(db: Session, category: str, file_type: str, delta: int):
+    """Add `delta` to a category counter in the caller's transaction."""
+    updated = db.query(CategoryCount).filter(
+        CategoryCount.category == category,
+        CategoryCount.file_type == file_type
+    ).update({CategoryCount.count: CategoryCount.count + delta}, synchronize_session=False)
+    if not updated:
+        db.add(CategoryCount(category=category, file_type=file_type, count=max(delta, 0)))
+        db.flush()
+
+
+def adjust_many(db: Session, docs: List[Document], sign: int = 1):
+    """Apply counter changes for several documents, one statement per (category, file_type)."""
+    deltas: Dict[tuple, int] = {}
+    for doc in docs:
+        key = (doc.category, doc.file_type)
+        deltas[key] = deltas.get(key, 0) + sign
+    for (category, file_type), delta in deltas.items():
+        adjust(db, category, file_type, delta)
+
+
+def rebuild(db: Session):
+    """Recompute every counter with a single GROUP BY over documents."""
+    rows = db.query(Document.category, Document.file_type, func.count(Document.id)).group_by(
+        Document.category, Document.file_type
+    ).all()
+    db.query(CategoryCount).delete()
+    db.add_all([
+        CategoryCount(category=category, file_type=file_type, count=count)
+        for category, file_type, count in rows
+    ])
+    db.commit()
+
+
+def ensure_seeded(db: Session):
+    """Seed the counters from existing documents the first time they are needed (run at startup)."""
+    if db.query(CategoryCount).first() is None and db.query(Document.id).first() is not None:
+        rebuild(db)
+
+
+def get_counts(db: Session) -> List[CategoryCount]:
+    """Current non-zero counters."""
+    return db.query(CategoryCount).filter(CategoryCount.count > 0).order_by(CategoryCount.category).all()
@@ -1,23 +1,77 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, inspect, text
 from sqlalchemy.orm import sessionmaker
 from models import Base
 import os
 
 # Database configuration
-DATABASE_URL = "sqlite:///./database.db"
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./database.db")
 
-# Create engine
-engine = create_engine(
-    DATABASE_URL, 
-    connect_args={"check_same_thread": False}  # Needed for SQLite
-)
+# SQLite tuning, applied to every new connection
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "10000"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
 
-# Create session factory
+# Connection pool sizing (per process)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+
+def _create_engine(read_only: bool = False):
+    is_sqlite = DATABASE_URL.startswith("sqlite")
+    new_engine = create_engine(
+        DATABASE_URL,
+        connect_args={"check_same_thread": False} if is_sqlite else {},  # Needed for SQLite
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_pre_ping=not is_sqlite
+    )
+    
+    if is_sqlite:
+        @event.listens_for(new_engine, "connect")
+        def _apply_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            # WAL lets readers proceed while a writer commits; busy_timeout makes
+            # writers wait for the lock instead of failing with "database is locked"
+            cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+            cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+            if read_only:
+                cursor.execute("PRAGMA query_only=ON")
+            cursor.close()
+    
+    return new_engine
+
+# Create engines: one for writes, one read-only for listing/history routes
+engine = _create_engine()
+read_engine = _create_engine(read_only=True)
+
+# Create session factories
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
 
 # Create all tables
 def init_db():
-    Base.metadata.create_all(bind=engine)
+    with engine.connect() as conn:
+        if engine.dialect.name == "sqlite":
+            # Serialise schema setup across worker processes starting at the same time
+            conn.exec_driver_sql("BEGIN IMMEDIATE")
+        Base.metadata.create_all(bind=conn)
+        _add_missing_columns(conn)
+        conn.commit()
+
+def _add_missing_columns(conn):
+    """create_all only creates missing tables; add columns and indexes introduced since a table was created."""
+    inspector = inspect(conn)
+    for table in Base.metadata.sorted_tables:
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                column_type = column.type.compile(dialect=engine.dialect)
+                conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+        for index in table.indexes:
+            index.create(bind=conn, checkfirst=True)
 
 # Dependency to get DB session
 def get_db():
@@ -26,3 +80,11 @@ def get_db():
         yield db
     finally:
         db.close()
+
+# Dependency to get a read-only DB session
+def get_read_db():
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
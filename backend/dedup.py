@@ -0,0 +1,163 @@
+import hashlib
+import os
+from typing import BinaryIO, Dict, List, Optional, Tuple
+
+from sqlalchemy import or_
+from sqlalchemy.orm import Session, undefer
+
+from models import Document, MatchJob, MatchResult
+from document_parser import document_parser
+from text_index import text_index
+import category_counts
+import match_state
+import profiles
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class DuplicateDocument(Exception):
+    """Raised by the upload pipeline when a file matches an already stored document."""
+
+    def __init__(self, existing_id: Optional[int] = None, category: Optional[str] = None, source: Optional[int] = None):
+        super().__init__(f"Duplicate of document {existing_id}")
+        self.existing_id = existing_id
+        self.category = category
+        self.source = source  # Position of an earlier file in the same upload, when not yet stored
+
+
+def save_and_hash(source: BinaryIO, path: str) -> str:
+    """Stream an upload to disk, returning the SHA-256 of its bytes."""
+    digest = hashlib.sha256()
+    with open(path, "wb") as buffer:
+        while True:
+            chunk = source.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+            buffer.write(chunk)
+    return digest.hexdigest()
+
+
+def hash_file(path: str) -> Optional[str]:
+    if not os.path.exists(path):
+        return None
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def normalized_text_hash(text: Optional[str]) -> str:
+    return hashlib.sha256(document_parser.normalize_text(text).encode("utf-8")).hexdigest()
+
+
+def find_existing(db: Session, file_type: str, content_hash: Optional[str] = None, text_hash: Optional[str] = None) -> Optional[Tuple[int, str]]:
+    """(id, category) of a stored document with the same bytes or normalized text, if any."""
+    conditions = []
+    if content_hash:
+        conditions.append(Document.content_hash == content_hash)
+    if text_hash:
+        conditions.append(Document.text_hash == text_hash)
+    if not conditions:
+        return None
+    row = db.query(Document.id, Document.category).filter(
+        Document.file_type == file_type,
+        or_(*conditions)
+    ).order_by(Document.id).first()
+    return (row.id, row.category) if row else None
+
+
+def existing_by_content_hash(db: Session, file_type: str, content_hashes: List[str]) -> Dict[str, Tuple[int, str]]:
+    """Map content hash -> (id, category) for stored documents, in one query."""
+    if not content_hashes:
+        return {}
+    rows = db.query(Document.content_hash, Document.id, Document.category).filter(
+        Document.file_type == file_type,
+        Document.content_hash.in_(content_hashes)
+    ).all()
+    return {row.content_hash: (row.id, row.category) for row in rows}
+
+
+def deduplicate(db: Session, dry_run: bool = False) -> Dict:
+    """
+    Backfill missing hashes, then merge documents that share a content or
+    normalized-text hash into the oldest copy. Match results and jobs are
+    re-pointed to the kept document before the duplicates are deleted.
+    """
+    docs = db.query(
+        Document.id, Document.file_type, Document.content_hash, Document.text_hash, Document.file_path
+    ).order_by(Document.id).all()
+
+    hashes = {doc.id: [doc.content_hash, doc.text_hash] for doc in docs}
+    backfill_ids = [doc.id for doc in docs if not doc.content_hash or not doc.text_hash]
+    paths = {doc.id: doc.file_path for doc in docs}
+    for start in range(0, len(backfill_ids), 200):
+        chunk = backfill_ids[start:start + 200]
+        rows = db.query(Document.id, Document.text_content).filter(Document.id.in_(chunk)).all()
+        for doc_id, text in rows:
+            if not hashes[doc_id][0]:
+                hashes[doc_id][0] = hash_file(paths[doc_id])
+            if not hashes[doc_id][1]:
+                hashes[doc_id][1] = normalized_text_hash(text)
+
+    # Union documents sharing either hash; ids ascend, so the first seen is the oldest
+    keeper_by_key: Dict[tuple, int] = {}
+    keeper_of: Dict[int, int] = {}
+    for doc in docs:
+        content_hash, text_hash = hashes[doc.id]
+        keys = [(doc.file_type, "content", content_hash), (doc.file_type, "text", text_hash)]
+        keeper = next((keeper_by_key[key] for key in keys if key[2] and key in keeper_by_key), doc.id)
+        keeper = keeper_of.get(keeper, keeper)
+        keeper_of[doc.id] = keeper
+        for key in keys:
+            if key[2]:
+                keeper_by_key.setdefault(key, keeper)
+
+    groups: Dict[int, List[int]] = {}
+    for doc_id, keeper in keeper_of.items():
+        if doc_id != keeper:
+            groups.setdefault(keeper, []).append(doc_id)
+
+    summary = {
+        "backfilled": len(backfill_ids),
+        "merged": sum(len(ids) for ids in groups.values()),
+        "groups": [{"kept": keeper, "duplicates": ids} for keeper, ids in groups.items()],
+        "dry_run": dry_run,
+    }
+    if dry_run:
+        return summary
+
+    for keeper, duplicate_ids in groups.items():
+        db.query(MatchResult).filter(MatchResult.cv_id.in_(duplicate_ids)).update(
+            {MatchResult.cv_id: keeper}, synchronize_session=False
+        )
+        db.query(MatchResult).filter(MatchResult.jd_id.in_(duplicate_ids)).update(
+            {MatchResult.jd_id: keeper}, synchronize_session=False
+        )
+        db.query(MatchJob).filter(MatchJob.jd_id.in_(duplicate_ids)).update(
+            {MatchJob.jd_id: keeper}, synchronize_session=False
+        )
+        duplicates = db.query(Document).options(undefer(Document.text_content)).filter(Document.id.in_(duplicate_ids)).all()
+        if any(doc.is_open for doc in duplicates):
+            db.query(Document).filter(Document.id == keeper).update({Document.is_open: True}, synchronize_session=False)
+        match_state.forget(db, duplicate_ids)
+        for doc in duplicates:
+            if doc.file_path != paths[keeper] and os.path.exists(doc.file_path):
+                os.remove(doc.file_path)
+            text_index.remove_document(db, doc.id, doc.text_content)
+            profiles.delete(db, doc.id)
+            category_counts.adjust(db, doc.category, doc.file_type, -1)
+            db.delete(doc)
+    db.flush()
+
+    # Survivors get their hashes only once the duplicates are gone (content_hash is unique)
+    merged = {doc_id for ids in groups.values() for doc_id in ids}
+    for doc_id in backfill_ids:
+        if doc_id not in merged:
+            content_hash, text_hash = hashes[doc_id]
+            db.query(Document).filter(Document.id == doc_id).update(
+                {Document.content_hash: content_hash, Document.text_hash: text_hash}, synchronize_session=False
+            )
+    db.commit()
+    return summary
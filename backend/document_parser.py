@@ -1,19 +1,97 @@
 import PyPDF2
 from docx import Document
-from typing import Optional
+from typing import Callable, List, Optional
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from itertools import islice
+import asyncio
 import os
+import re
+import signal
+
+# Parsing runs in a bounded process pool so large PDFs never block the event loop
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", str(os.cpu_count() or 2)))
+PARSE_TIMEOUT = float(os.getenv("PARSE_TIMEOUT", "60"))  # Seconds per document
+PARSE_MAX_PAGES = int(os.getenv("PARSE_MAX_PAGES", "30"))
+# Extra seconds a worker gets past its timeout before the pool is killed (when the in-worker timer can't interrupt it)
+_KILL_GRACE = 5.0
+# Submissions of one call across pools lost to another call's timeout
+_ATTEMPTS = 3
+
+# Size of the section-aware digest sent to the LLM in place of the raw text
+DIGEST_MAX_CHARS = int(os.getenv("DIGEST_MAX_CHARS", "3000"))
+
+# Section heading keywords -> section kind
+_SECTION_KEYWORDS = {
+    "skills": ("skills", "technical skills", "core competencies", "competencies", "technologies", "tech stack", "tools", "expertise", "key skills"),
+    "experience": ("experience", "work experience", "professional experience", "employment", "employment history", "work history", "career history"),
+    "summary": ("summary", "profile", "professional summary", "about me", "objective", "career objective", "overview", "role overview", "about the role", "job summary", "position summary"),
+    "requirements": ("requirements", "qualifications", "minimum qualifications", "required qualifications", "required skills", "what you need", "what we are looking for", "who you are", "must have", "essential"),
+    "responsibilities": ("responsibilities", "key responsibilities", "duties", "what you will do", "your role", "the role"),
+    "preferred": ("preferred qualifications", "nice to have", "preferred", "bonus", "desirable"),
+    "certifications": ("certifications", "certificates", "licenses", "accreditations"),
+    "projects": ("projects", "key projects", "achievements", "accomplishments"),
+    "education": ("education", "academic background", "qualifications and education", "academic qualifications"),
+    "boilerplate": ("references", "hobbies", "interests", "personal details", "personal information", "declaration",
+                    "about us", "about the company", "who we are", "benefits", "perks", "what we offer", "equal opportunity",
+                    "how to apply", "contact", "contact information"),
+}
+_HEADING_TO_SECTION = {keyword: kind for kind, keywords in _SECTION_KEYWORDS.items() for keyword in keywords}
+
+# Lower is kept first; boilerplate sections are dropped
+_SECTION_PRIORITY = {
+    "cv": {"skills": 0, "experience": 1, "summary": 2, "certifications": 3, "projects": 4, "education": 5, "requirements": 6, "responsibilities": 6, "preferred": 6, "other": 7},
+    "jd": {"requirements": 0, "skills": 0, "responsibilities": 1, "summary": 2, "preferred": 3, "experience": 3, "certifications": 4, "education": 4, "projects": 6, "other": 6},
+}
+
+_BOILERPLATE_LINE_RE = re.compile(
+    r"[\w.+-]+@[\w-]+\.[\w.]+"  # e-mail addresses
+    r"|https?://|www\."  # links
+    r"|^\+?[\d\s().-]{7,}$"  # phone numbers
+    r"|^page \d+( of \d+)?$"
+    r"|references (are )?available"
+    r"|^curriculum vitae$|^resume$|^r[ée]sum[ée]$",
+    re.IGNORECASE
+)
+_HEADING_STRIP_RE = re.compile(r"[^a-z ]")
+# Relative share of the digest budget by section priority (the preamble ranks -1)
+_SECTION_WEIGHTS = {-1: 1, 0: 4, 1: 3, 2: 2}
+
+class ParseTimeout(TimeoutError):
+    """A call in the parser pool ran longer than its timeout."""
+
+
+def _on_alarm(signum, frame):
+    raise ParseTimeout()
+
+
+def _call_with_deadline(fn: Callable, timeout: Optional[float], *args):
+    """Runs in a pool worker: call fn(*args), interrupted after `timeout` seconds of its own run time."""
+    if not timeout or not hasattr(signal, "setitimer"):
+        return fn(*args)
+    previous = signal.signal(signal.SIGALRM, _on_alarm)
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return fn(*args)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
 
 class DocumentParser:
+    def __init__(self):
+        self._executor: Optional[ProcessPoolExecutor] = None
+    
     @staticmethod
-    def extract_text_from_pdf(file_path: str) -> str:
-        """Extract text from PDF file."""
+    def extract_text_from_pdf(file_path: str, max_pages: int = PARSE_MAX_PAGES) -> str:
+        """Extract text from the first `max_pages` pages of a PDF file."""
         try:
-            text = ""
             with open(file_path, 'rb') as file:
                 pdf_reader = PyPDF2.PdfReader(file)
-                for page in pdf_reader.pages:
-                    text += page.extract_text() + "\n"
-            return text.strip()
+                pages = [page.extract_text() or "" for page in islice(pdf_reader.pages, max_pages)]
+            return "\n".join(pages).strip()
+        except ParseTimeout:
+            raise
         except Exception as e:
             print(f"Error extracting PDF text: {e}")
             return ""
@@ -25,27 +103,196 @@ class DocumentParser:
             doc = Document(file_path)
             text = "\n".join([paragraph.text for paragraph in doc.paragraphs])
             return text.strip()
+        except ParseTimeout:
+            raise
         except Exception as e:
             print(f"Error extracting DOCX text: {e}")
             return ""
     
     @staticmethod
-    def extract_text(file_path: str) -> str:
+    def extract_text(file_path: str, max_pages: int = PARSE_MAX_PAGES) -> str:
         """Extract text based on file extension."""
         ext = os.path.splitext(file_path)[1].lower()
         
         if ext == '.pdf':
-            return DocumentParser.extract_text_from_pdf(file_path)
+            return DocumentParser.extract_text_from_pdf(file_path, max_pages)
         elif ext in ['.docx', '.doc']:
             return DocumentParser.extract_text_from_docx(file_path)
         else:
             return ""
     
+    @staticmethod
+    def normalize_text(text: str) -> str:
+        """Lowercase and collapse whitespace so trivially different extractions compare equal."""
+        return " ".join((text or "").lower().split())
+    
+    @staticmethod
+    def detect_sections(text: str) -> List[tuple]:
+        """
+        Split text into (kind, heading, lines) sections using known heading keywords.
+        Lines before the first heading form a "preamble" section. Contact details,
+        links, page numbers and repeated lines are dropped; whitespace is collapsed.
+        """
+        sections = [("preamble", "", [])]
+        seen = set()
+        for raw_line in (text or "").splitlines():
+            line = " ".join(raw_line.split())
+            if not line or _BOILERPLATE_LINE_RE.search(line):
+                continue
+            key = line.lower()
+            if len(line) <= 50:
+                heading = " ".join(_HEADING_STRIP_RE.sub(" ", key).split())
+                if heading in _HEADING_TO_SECTION:
+                    sections.append((_HEADING_TO_SECTION[heading], line.rstrip(":"), []))
+                    continue
+            if key in seen:
+                continue
+            seen.add(key)
+            sections[-1][2].append(line)
+        return [section for section in sections if section[2]]
+    
+    @staticmethod
+    def build_digest(text: str, doc_type: str, max_chars: int = DIGEST_MAX_CHARS) -> str:
+        """
+        Token-budgeted digest of a document for LLM prompts. Sections are emitted in
+        priority order for the document type (skills/experience for CVs,
+        requirements/responsibilities for JDs), so truncating the digest drops the
+        least useful parts first. Every section gets a share of the budget
+        (weighted towards high-priority sections) before any section uses the remainder.
+        """
+        sections = DocumentParser.detect_sections(text)
+        if not sections:
+            return ""
+        priority = _SECTION_PRIORITY.get(doc_type, _SECTION_PRIORITY["cv"])
+        # The preamble usually carries the candidate's headline or the job title
+        rank = lambda section: -1 if section[0] == "preamble" else priority.get(section[0], priority["other"])
+        ranked = sorted((section for section in sections if section[0] != "boilerplate"), key=rank) or sections
+        weights = [_SECTION_WEIGHTS.get(rank(section), 1) for section in ranked]
+        
+        bodies = ["\n".join(lines) for _, _, lines in ranked]
+        headers = [f"{heading.upper()}:\n" if heading else "" for _, heading, _ in ranked]
+        overhead = sum(len(header) + 2 for header in headers)
+        budget = max(0, max_chars - overhead)
+        
+        # First pass: weighted shares; short sections hand back what they do not need
+        allotted = [0] * len(ranked)
+        remaining = budget
+        pending = list(range(len(ranked)))
+        while pending and remaining > 0:
+            total_weight = sum(weights[i] for i in pending)
+            shares = {i: remaining * weights[i] // total_weight for i in pending}
+            if not any(shares.values()):
+                break
+            still_pending = []
+            for i in pending:
+                grant = min(shares[i], len(bodies[i]) - allotted[i])
+                allotted[i] += grant
+                remaining -= grant
+                if allotted[i] < len(bodies[i]):
+                    still_pending.append(i)
+            if len(still_pending) == len(pending):
+                break
+            pending = still_pending
+        # Second pass: leftovers go to the highest-priority sections first
+        for i in pending:
+            grant = min(remaining, len(bodies[i]) - allotted[i])
+            allotted[i] += grant
+            remaining -= grant
+        
+        parts = []
+        for header, body, size in zip(headers, bodies, allotted):
+            if size <= 0:
+                continue
+            excerpt = body if size >= len(body) else body[:size].rsplit(" ", 1)[0]
+            parts.append(header + excerpt)
+        return "\n\n".join(parts)[:max_chars]
+    
     @staticmethod
     def validate_file(filename: str) -> bool:
         """Check if file extension is supported."""
         ext = os.path.splitext(filename)[1].lower()
         return ext in ['.pdf', '.docx', '.doc']
+    
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=PARSE_WORKERS)
+        return self._executor
+    
+    def _recycle(self, executor: ProcessPoolExecutor):
+        """Kill a pool with a worker stuck on a document; the next call starts a fresh pool."""
+        if self._executor is not executor:
+            return  # Already replaced by another timed-out call
+        self._executor = None
+        # Waiting on a future never stops its worker process, so the workers are killed outright.
+        # Other callers' futures fail with BrokenProcessPool and are resubmitted by run()
+        for process in list((executor._processes or {}).values()):
+            process.kill()
+        executor.shutdown(wait=False)
+    
+    async def _wait(self, executor: ProcessPoolExecutor, future, timeout: Optional[float]):
+        """
+        Wait for a pool future. The worker enforces `timeout` itself; if the call is
+        still running `_KILL_GRACE` seconds past it (stuck where the timer cannot
+        interrupt it), the pool is killed. Time spent queued is not counted.
+        """
+        wrapped = asyncio.wrap_future(future)
+        if not timeout:
+            done, _ = await asyncio.wait({wrapped})
+            return done
+        loop = asyncio.get_running_loop()
+        deadline = None
+        while True:
+            done, _ = await asyncio.wait({wrapped}, timeout=min(1.0, timeout))
+            if done:
+                return done
+            if future.running():
+                deadline = deadline or loop.time() + timeout + _KILL_GRACE
+                if loop.time() >= deadline:
+                    # The abandoned future fails with BrokenProcessPool once its worker is killed
+                    wrapped.add_done_callback(lambda f: f.cancelled() or f.exception())
+                    self._recycle(executor)
+                    raise ParseTimeout()
+    
+    async def run(self, fn: Callable, *args, timeout: Optional[float] = None):
+        """
+        Run `fn(*args)` in the process pool, raising ParseTimeout if it runs for more
+        than `timeout` seconds. A worker that cannot be interrupted gets the pool
+        killed and replaced; work lost with a killed pool is resubmitted to the new one.
+        """
+        for attempt in range(_ATTEMPTS):
+            executor = self.executor
+            try:
+                future = executor.submit(_call_with_deadline, fn, timeout, *args)
+            except (BrokenProcessPool, RuntimeError):
+                self._recycle(executor)  # Broken or shut down since it was created
+                continue
+            (wrapped,) = await self._wait(executor, future, timeout)
+            if wrapped.cancelled():
+                continue  # Cancelled with its pool, not by our caller
+            try:
+                return wrapped.result()
+            except BrokenProcessPool:
+                self._recycle(executor)
+                if attempt == _ATTEMPTS - 1:
+                    raise
+        raise BrokenProcessPool("Parser pool kept failing")
+    
+    async def extract_text_async(self, file_path: str, timeout: float = PARSE_TIMEOUT) -> str:
+        """Extract text in the process pool; returns "" if parsing exceeds `timeout` seconds."""
+        try:
+            return await self.run(DocumentParser.extract_text, file_path, PARSE_MAX_PAGES, timeout=timeout)
+        except ParseTimeout:
+            print(f"Timed out extracting text from {file_path} after {timeout}s")
+            return ""
+        except Exception as e:
+            print(f"Error extracting text from {file_path}: {e}")
+            return ""
+    
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
 
 # Singleton instance
 document_parser = DocumentParser()
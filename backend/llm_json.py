@@ -0,0 +1,270 @@
+import json
+from collections import Counter
+from typing import Any, Iterator, List, Optional, Tuple
+
+from pydantic import BaseModel, ValidationError, field_validator
+
+# Python-style literals some models emit in place of JSON ones
+_LITERALS = {"True": "true", "False": "false", "None": "null"}
+_CLOSERS = {"{": "}", "[": "]"}
+
+# How LLM responses were decoded: clean, repaired, fix_retry, fix_recovered, failed
+decode_stats = Counter()
+
+
+class JsonObjectTracker:
+    """
+    Tracks brace depth across streamed text to tell when the first top-level JSON object
+    closes. With `validate`, a balanced {...} that does not parse (braces in prose, e.g.
+    "the result for {candidate}:") is skipped and tracking resumes after it.
+    """
+
+    def __init__(self, validate: bool = True):
+        self.validate = validate
+        self.depth = 0
+        self.started = False
+        self.in_string = False
+        self.escaped = False
+        self.buffer: List[str] = []
+
+    def feed(self, chunk: str) -> bool:
+        """Consume a chunk; returns True once the first object is complete."""
+        for char in chunk:
+            if self.started and self.validate:
+                self.buffer.append(char)
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = self.started
+            elif char == "{":
+                if not self.started and self.validate:
+                    self.buffer = [char]
+                self.depth += 1
+                self.started = True
+            elif char == "}" and self.started:
+                self.depth -= 1
+                if self.depth == 0:
+                    if not self.validate or _parses("".join(self.buffer)):
+                        return True
+                    self.started = False
+        return False
+
+
+def _parses(text: str) -> bool:
+    try:
+        json.loads(text, strict=False)
+        return True
+    except json.JSONDecodeError:
+        return False
+
+
+class MatchOutput(BaseModel):
+    """Schema of one CV-JD match as returned by the LLM."""
+
+    score: float
+    match_level: str = "Unknown"
+    key_matches: List[str] = []
+    gaps: List[str] = []
+    summary: str = ""
+
+    @field_validator("score", mode="before")
+    @classmethod
+    def _parse_score(cls, value):
+        if isinstance(value, bool):
+            raise ValueError("score must be a number")
+        if isinstance(value, str):
+            value = value.strip().rstrip("%").strip()
+        return value
+
+    @field_validator("score")
+    @classmethod
+    def _clamp_score(cls, value: float) -> float:
+        return max(0.0, min(100.0, value))
+
+    @field_validator("key_matches", "gaps", mode="before")
+    @classmethod
+    def _coerce_list(cls, value):
+        if value is None:
+            return []
+        if isinstance(value, str):
+            return [value] if value.strip() else []
+        if isinstance(value, list):
+            return [item if isinstance(item, str) else json.dumps(item) for item in value if item is not None]
+        return value
+
+    @field_validator("match_level", "summary", mode="before")
+    @classmethod
+    def _coerce_text(cls, value):
+        if value is None:
+            return ""
+        return value if isinstance(value, str) else str(value)
+
+
+def _object_starts(text: str) -> Iterator[Tuple[int, Optional[int]]]:
+    """
+    (start, end) of each place a JSON object may begin, in order: every `{` outside the
+    balanced {...} spans already yielded. end is the index after the matching `}`, or
+    None when the object is never closed (e.g. truncated).
+    """
+    start = text.find("{")
+    while start >= 0:
+        end = None
+        tracker = JsonObjectTracker(validate=False)
+        for position in range(start, len(text)):
+            if tracker.feed(text[position]):
+                end = position + 1
+                break
+        yield start, end
+        start = text.find("{", end or start + 1)
+
+
+def balanced_objects(text: str) -> Iterator[str]:
+    """Each balanced {...} in text, in order; objects nested in an earlier one are not repeated."""
+    for start, end in _object_starts(text):
+        if end is not None:
+            yield text[start:end]
+
+
+def _close(out: List[str], stack: List[str]) -> str:
+    """Text so far with a dangling comma/colon resolved and every open container closed."""
+    text = "".join(out).rstrip()
+    if text.endswith(","):
+        text = text[:-1].rstrip()
+    elif text.endswith(":"):
+        text += " null"
+    return text + "".join(_CLOSERS[opener] for opener in reversed(stack))
+
+
+def repair_json(text: str) -> Optional[str]:
+    """
+    Best-effort repair of the first JSON object in an LLM response: single-quoted
+    strings, Python literals, trailing commas, a missing `]`/`}` and truncation
+    (open strings and containers are closed, an incomplete last member is dropped).
+    Each candidate object is tried in order, so braces in prose before it are skipped.
+    Returns parseable JSON text, or None if it cannot be repaired.
+    """
+    for start, _ in _object_starts(text):
+        repaired = _repair_from(text, start)
+        if repaired is not None:
+            return repaired
+    return None
+
+
+def _repair_from(text: str, start: int) -> Optional[str]:
+    """repair_json for the object beginning at text[start]."""
+    out: List[str] = []
+    stack: List[str] = []
+    # (output length, open containers) before each comma: where a truncated tail can be cut off
+    cuts: List[Tuple[int, List[str]]] = []
+    quote = None
+    escaped = False
+    position = start
+    while position < len(text):
+        char = text[position]
+        if quote:
+            if escaped:
+                escaped = False
+                if char == "'":
+                    out.pop()  # \' needs no escape in JSON
+                out.append(char)
+            elif char == "\\":
+                escaped = True
+                out.append(char)
+            elif char == quote:
+                quote = None
+                out.append('"')
+            elif char == '"':
+                out.append('\\"')  # Only reachable inside a single-quoted string
+            else:
+                out.append(char)
+        elif char in "\"'":
+            quote = char
+            out.append('"')
+        elif char in _CLOSERS:
+            stack.append(char)
+            out.append(char)
+        elif char in "}]":
+            if char in (_CLOSERS[opener] for opener in stack):
+                # Close anything left open inside this container first, e.g. a list missing its `]`
+                while _CLOSERS[stack[-1]] != char:
+                    out[:] = list(_close(out, [stack.pop()]))
+                out[:] = list(_close(out, []))
+                stack.pop()
+                out.append(char)
+                if not stack:
+                    break
+        elif char == ",":
+            cuts.append((len(out), list(stack)))
+            out.append(char)
+        elif char.isalpha():
+            end = position
+            while end < len(text) and (text[end].isalnum() or text[end] == "_"):
+                end += 1
+            word = text[position:end]
+            if word not in _LITERALS and text[end:].lstrip().startswith(":"):
+                word = f'"{word}"'  # Unquoted key
+            out.append(_LITERALS.get(word, word))
+            position = end
+            continue
+        else:
+            out.append(char)
+        position += 1
+
+    if quote:
+        out.append('"')
+    candidates = [_close(out, stack)] + [_close(out[:length], snapshot) for length, snapshot in reversed(cuts)]
+    for candidate in candidates:
+        try:
+            json.loads(candidate, strict=False)
+            return candidate
+        except json.JSONDecodeError:
+            continue
+    return None
+
+
+def decode_json(text: Optional[str]) -> Tuple[Optional[Any], Optional[str]]:
+    """
+    (value, error) for the first JSON object in an LLM response. Each balanced {...} is
+    parsed as-is in order and the first that parses is used, otherwise the response goes
+    through repair_json; error describes the first candidate's defect when neither works.
+    """
+    if not text or not text.strip():
+        return None, "empty response"
+    error = None
+    for candidate in balanced_objects(text):
+        try:
+            value = json.loads(candidate, strict=False)
+            decode_stats["clean"] += 1
+            return value, None
+        except json.JSONDecodeError as e:
+            error = error or f"{e.msg} at character {e.pos}"
+    error = error or "no complete JSON object found"
+
+    repaired = repair_json(text)
+    if repaired is None:
+        return None, error
+    decode_stats["repaired"] += 1
+    return json.loads(repaired, strict=False), None
+
+
+def validate_match(data: Any) -> Tuple[Optional[dict], Optional[str]]:
+    """(match fields, error) after checking data against MatchOutput."""
+    if not isinstance(data, dict):
+        return None, "expected a JSON object"
+    try:
+        return MatchOutput.model_validate(data).model_dump(), None
+    except ValidationError as e:
+        return None, "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors()[:3])
+
+
+def decode_match(text: Optional[str]) -> Tuple[Optional[dict], Optional[str]]:
+    """(match fields, error) for a single-CV match response."""
+    data, error = decode_json(text)
+    if error:
+        return None, error
+    return validate_match(data)
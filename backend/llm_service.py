@@ -1,8 +1,15 @@
 import httpx
 import json
-from typing import Dict, List, Optional
+from typing import Awaitable, Callable, Dict, List, Optional
 import asyncio
-from openai import AsyncOpenAI
+import random
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+from openai import AsyncOpenAI, APIConnectionError, APIStatusError, APITimeoutError
+
+from llm_json import JsonObjectTracker, decode_json, decode_match, validate_match, decode_stats
+from document_parser import DIGEST_MAX_CHARS
 
 import os
 
@@ -10,17 +17,446 @@ import os
 OLLAMA_URL = os.getenv("OLLAMA_URL", "http://51.112.105.60:11434")
 OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "qwen2.5:32b")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL")  # Optional, e.g. a local fake server for load tests
+
+# Fixed document categories offered to the LLM (and to the local categorizer)
+CATEGORIES = [
+    "Software Engineering",
+    "Artificial Intelligence / Machine Learning",
+    "Cybersecurity",
+    "Sales & Marketing",
+    "Finance & Accounting",
+    "Human Resources",
+    "Operations & Logistics",
+    "Healthcare",
+    "Legal",
+    "Design & Creative",
+    "Data Science",
+    "Product Management",
+    "Other",
+]
+CATEGORY_LIST = "\n".join(f"- {category}" for category in CATEGORIES)
+
+# Bump whenever the matching prompts change so cached results are not reused
+MATCH_PROMPT_VERSION = "v1"
+MATCH_PACK_PROMPT_VERSION = "v1-packed"
+
+# Characters of each document placed in a prompt; documents arrive as digests, so this
+# follows the digest size rather than cutting off its later sections
+PROMPT_MAX_CHARS = DIGEST_MAX_CHARS
+
+# Listwise matching: one JD with several CVs per request, sized by an estimated token budget
+MATCH_PACK_TOKEN_BUDGET = int(os.getenv("MATCH_PACK_TOKEN_BUDGET", "12000"))  # Prompt + reserved output tokens
+MATCH_PACK_MAX_CVS = int(os.getenv("MATCH_PACK_MAX_CVS", "8"))
+MATCH_PACK_OUTPUT_TOKENS = int(os.getenv("MATCH_PACK_OUTPUT_TOKENS", "350"))  # Reserved per CV for its JSON result
+
+# Maximum number of in-flight LLM requests per backend during batch matching
+OLLAMA_MAX_CONCURRENCY = int(os.getenv("OLLAMA_MAX_CONCURRENCY", "3"))
+OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", "8"))
+
+# Shared Ollama HTTP connection pool and generation settings
+OLLAMA_MAX_CONNECTIONS = int(os.getenv("OLLAMA_MAX_CONNECTIONS", "16"))
+OLLAMA_MAX_KEEPALIVE = int(os.getenv("OLLAMA_MAX_KEEPALIVE", "8"))
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")  # How long Ollama keeps the model loaded after a request
+OLLAMA_STREAM = os.getenv("OLLAMA_STREAM", "false").lower() in ("1", "true", "yes")
+
+# Retry policy for rate-limited / overloaded LLM calls
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "1.0"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "30.0"))
+
+# Hedged match calls: once a call outlives the observed latency percentile, a duplicate
+# is sent (to the failover model if configured) and the first good answer wins
+LLM_HEDGE = os.getenv("LLM_HEDGE", "true").lower() in ("1", "true", "yes")
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "0.5"))
+LLM_HEDGE_MAX_FRACTION = float(os.getenv("LLM_HEDGE_MAX_FRACTION", "0.1"))  # Cap on extra load from hedges
+
+# Secondary model per backend, used for hedges and while the primary's circuit is open
+OLLAMA_FAILOVER_MODEL = os.getenv("OLLAMA_FAILOVER_MODEL", "")  # e.g. gpt-4o-mini
+OPENAI_FAILOVER_MODEL = os.getenv("OPENAI_FAILOVER_MODEL", "")  # e.g. ollama
+
+# Circuit breaker: stop sending traffic to a backend after consecutive failed calls
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_SECONDS = float(os.getenv("CIRCUIT_RESET_SECONDS", "30"))
+
+# One short "fix the JSON" call when a match response cannot be decoded or repaired locally
+LLM_JSON_FIX_RETRY = os.getenv("LLM_JSON_FIX_RETRY", "true").lower() in ("1", "true", "yes")
+LLM_JSON_FIX_MAX_TOKENS = int(os.getenv("LLM_JSON_FIX_MAX_TOKENS", "600"))
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    AIMD concurrency controller for one LLM backend.
+    The limit grows by roughly one slot per window of successful calls and is
+    cut multiplicatively on overload signals (429, 5xx, timeouts).
+    """
+    
+    def __init__(self, max_limit: int, min_limit: int = 1, decrease_factor: float = 0.5, cooldown: float = 1.0):
+        self.max_limit = max(1, max_limit)
+        self.min_limit = max(1, min(min_limit, self.max_limit))
+        self.decrease_factor = decrease_factor
+        self.cooldown = cooldown
+        self.limit = float(self.max_limit)
+        self.in_flight = 0
+        self._last_decrease = 0.0
+        self._condition: Optional[asyncio.Condition] = None
+    
+    @property
+    def condition(self) -> asyncio.Condition:
+        # Created lazily so the limiter binds to the running event loop
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        return self._condition
+    
+    async def acquire(self):
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+    
+    async def release(self):
+        async with self.condition:
+            self.in_flight -= 1
+            self.condition.notify_all()
+    
+    async def on_success(self):
+        async with self.condition:
+            self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+            self.condition.notify_all()
+    
+    async def on_overload(self):
+        async with self.condition:
+            now = time.monotonic()
+            # Only cut once per cooldown window so a burst of 429s counts as one signal
+            if now - self._last_decrease >= self.cooldown:
+                self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+                self._last_decrease = now
+
+
+class LatencyTracker:
+    """Rolling window of recent successful call latencies for one model."""
+    
+    def __init__(self, window: int = 200):
+        self.samples = deque(maxlen=window)
+    
+    def record(self, seconds: float):
+        self.samples.append(seconds)
+    
+    def percentile(self, pct: float) -> Optional[float]:
+        """Nearest-rank percentile, or None until enough samples have been seen."""
+        if len(self.samples) < LLM_HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self.samples)
+        rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+        return ordered[rank]
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a backend whose circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker for one LLM backend.
+    After `failure_threshold` failed calls the circuit opens and calls fail fast;
+    after `reset_timeout` seconds a single trial call is let through, and its
+    outcome closes or re-opens the circuit.
+    """
+    
+    def __init__(self, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD, reset_timeout: float = CIRCUIT_RESET_SECONDS):
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_in_flight = False
+    
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.reset_timeout:
+            return "open"
+        return "half_open"
+    
+    def available(self) -> bool:
+        """Whether a call would currently be let through (does not claim the trial slot)."""
+        state = self.state
+        return state == "closed" or (state == "half_open" and not self._trial_in_flight)
+    
+    def allow(self) -> bool:
+        """Claim permission for one call."""
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._trial_in_flight:
+            self._trial_in_flight = True
+            return True
+        return False
+    
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+    
+    def record_failure(self):
+        self.failures += 1
+        if self._trial_in_flight or self.failures >= self.failure_threshold:
+            if self.opened_at is None or self._trial_in_flight:
+                print(f"⚠️ Circuit opened after {self.failures} consecutive failures")
+            self.opened_at = time.monotonic()
+        self._trial_in_flight = False
+    
+    def record_abandoned(self):
+        """A call was cancelled before finishing (e.g. it lost a hedge); it proves nothing."""
+        self._trial_in_flight = False
+
+
+def _retry_after_seconds(response) -> Optional[float]:
+    """Parse a Retry-After header (seconds or HTTP date) from a response."""
+    if response is None:
+        return None
+    value = response.headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _classify_llm_error(error: Exception) -> tuple:
+    """Return (is_retryable, is_overload, retry_after) for an exception raised by an LLM call."""
+    if isinstance(error, (httpx.TimeoutException, APITimeoutError, asyncio.TimeoutError)):
+        return True, True, None
+    if isinstance(error, (httpx.TransportError, APIConnectionError)):
+        return True, False, None
+    if isinstance(error, (httpx.HTTPStatusError, APIStatusError)):
+        status = error.response.status_code
+        if status == 429 or status >= 500:
+            return True, True, _retry_after_seconds(error.response)
+    return False, False, None
+
+def _rounded(seconds: Optional[float]) -> Optional[float]:
+    return round(seconds, 3) if seconds is not None else None
+
+def _backend_for(model: str) -> str:
+    return "ollama" if model == "ollama" else "openai"
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about 4 characters per token for English text)."""
+    return len(text) // 4 + 1
+
+# Instructions and framing of the packed prompt, excluding the JD and CV bodies
+_PACK_PROMPT_OVERHEAD = 400
+_PACK_FIELDS = ("score", "match_level", "key_matches", "gaps", "summary")
+
+def plan_packs(cv_list: List[Dict], jd_text: str, max_chars: int, budget: int = MATCH_PACK_TOKEN_BUDGET, max_cvs: int = MATCH_PACK_MAX_CVS) -> List[List[Dict]]:
+    """Greedily group CVs (in order) into packs whose estimated prompt + output tokens fit the budget."""
+    base = _PACK_PROMPT_OVERHEAD + estimate_tokens(jd_text[:max_chars])
+    packs, current, used = [], [], base
+    for cv in cv_list:
+        cost = estimate_tokens(cv["text"][:max_chars]) + MATCH_PACK_OUTPUT_TOKENS
+        if current and (used + cost > budget or len(current) >= max_cvs):
+            packs.append(current)
+            current, used = [], base
+        current.append(cv)
+        used += cost
+    if current:
+        packs.append(current)
+    return packs
+
+def _pack_prompt(jd_text: str, cvs: List[Dict], max_chars: int) -> str:
+    """Listwise prompt: the JD first (a shared prefix across packs), then each CV under its pack-local id."""
+    sections = "\n\n".join(
+        f"=== CV C{i} ===\n{cv['text'][:max_chars]}\n=== END CV C{i} ==="
+        for i, cv in enumerate(cvs, 1)
+    )
+    return f"""You are an expert HR recruiter. Evaluate each candidate CV below independently against the same Job Description.
+
+JOB DESCRIPTION:
+{jd_text[:max_chars]}
+
+CANDIDATE CVS:
+{sections}
+
+For EVERY CV, evaluate skills, experience, education and achievements against the job requirements. Score each CV on its own merits, not relative to the other CVs.
+
+Provide your analysis in the following JSON format, with exactly one entry per CV using the ids above (C1, C2, ...):
+{{
+    "results": [
+        {{
+            "id": "<CV id>",
+            "score": <number between 0-100, where 90-100 = Exceptional, 75-89 = Strong, 60-74 = Good, 40-59 = Fair, 0-39 = Poor>,
+            "match_level": "<Excellent/Good/Fair/Poor>",
+            "key_matches": ["matching skills/experiences with evidence from the CV"],
+            "gaps": ["missing requirements"],
+            "summary": "2-3 sentence assessment and recommendation"
+        }}
+    ]
+}}
+
+Respond with ONLY valid JSON, no additional text."""
+
+def _parse_pack_response(llm_response: str, cvs: List[Dict]) -> Dict[int, Dict]:
+    """Valid per-CV results keyed by position in the pack; malformed, unknown or repeated ids are dropped."""
+    data, _ = decode_json(llm_response)
+    items = data.get("results") if isinstance(data, dict) else None
+    if not isinstance(items, list):
+        return {}
+    
+    parsed = {}
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        item_id = str(item.get("id", "")).strip().upper().removeprefix("C")
+        if not item_id.isdigit() or not 1 <= int(item_id) <= len(cvs):
+            continue
+        position = int(item_id) - 1
+        result, _ = validate_match({field: item[field] for field in _PACK_FIELDS if field in item})
+        if position in parsed or result is None:
+            continue
+        result["cv_name"] = cvs[position]["name"]
+        parsed[position] = result
+    return parsed
+
+def _fix_json_prompt(llm_response: str, error: str) -> str:
+    return f"""The text below was meant to be one JSON object with the fields "score" (number 0-100), "match_level" (string), "key_matches" (list of strings), "gaps" (list of strings) and "summary" (string), but it could not be used: {error}.
+
+Rewrite it as that JSON object, keeping the values it already contains. Do not re-evaluate anything.
+
+TEXT:
+{llm_response[:4000]}
+
+Respond with ONLY valid JSON, no additional text."""
+
+def _profile_prompt(text: str, doc_type: str) -> str:
+    subject = "the candidate" if doc_type == "cv" else "the role"
+    years = "total years of professional experience" if doc_type == "cv" else "minimum years of experience required"
+    return f"""Extract a structured profile of {subject} from the following {doc_type.upper()}.
+
+{doc_type.upper()} Content:
+{text[:6000]}
+
+Provide the profile in the following JSON format:
+{{
+    "skills": ["individual technical and professional skills, tools and technologies, each 1-4 words"],
+    "titles": ["job titles, most recent first"],
+    "years_experience": <{years} as a number, or null if not stated>,
+    "education": ["degrees and qualifications"],
+    "certifications": ["professional certifications"]
+}}
+
+Respond with ONLY valid JSON, no additional text."""
 
 class LLMService:
     def __init__(self):
         self.ollama_url = OLLAMA_URL
         self.ollama_model = OLLAMA_MODEL
         if OPENAI_API_KEY:
-            self.openai_client = AsyncOpenAI(api_key=OPENAI_API_KEY)
+            # Retries are handled by _call_with_backoff so the limiter sees every 429
+            self.openai_client = AsyncOpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL, max_retries=0)
         else:
             self.openai_client = None
             print("⚠️ Warning: OPENAI_API_KEY is not set. OpenAI features will not work.")
         self.timeout = 180.0
+        self.ollama_keep_alive = OLLAMA_KEEP_ALIVE
+        self.ollama_stream = OLLAMA_STREAM
+        self.http_client: Optional[httpx.AsyncClient] = None
+        self.ollama_max_concurrency = OLLAMA_MAX_CONCURRENCY
+        self.openai_max_concurrency = OPENAI_MAX_CONCURRENCY
+        self.max_retries = LLM_MAX_RETRIES
+        self.limiters = {
+            "ollama": AdaptiveConcurrencyLimiter(OLLAMA_MAX_CONCURRENCY),
+            "openai": AdaptiveConcurrencyLimiter(OPENAI_MAX_CONCURRENCY),
+        }
+        self.breakers = {
+            "ollama": CircuitBreaker(),
+            "openai": CircuitBreaker(),
+        }
+        self.failover_models = {
+            "ollama": OLLAMA_FAILOVER_MODEL or None,
+            "openai": OPENAI_FAILOVER_MODEL or None,
+        }
+        self.latency: Dict[str, LatencyTracker] = {}
+        self.hedge_enabled = LLM_HEDGE
+        self.match_calls = 0
+        self.hedged_calls = 0
+    
+    async def startup(self):
+        """Open the pooled HTTP client used for all Ollama calls."""
+        if self.http_client is None:
+            self.http_client = httpx.AsyncClient(
+                base_url=self.ollama_url,
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=OLLAMA_MAX_CONNECTIONS,
+                    max_keepalive_connections=OLLAMA_MAX_KEEPALIVE
+                )
+            )
+    
+    async def shutdown(self):
+        """Close pooled HTTP connections."""
+        if self.http_client is not None:
+            await self.http_client.aclose()
+            self.http_client = None
+        if self.openai_client is not None:
+            await self.openai_client.close()
+    
+    async def _call_with_backoff(self, backend: str, call: Callable[[], Awaitable]):
+        """
+        Run an LLM call under the backend's adaptive limiter and circuit breaker.
+        Rate-limit, timeout and 5xx errors shrink the limit and are retried with
+        jittered exponential backoff, honouring Retry-After when present. A call
+        that still fails counts against the breaker; while it is open, calls
+        raise CircuitOpenError immediately.
+        """
+        breaker = self.breakers[backend]
+        if not breaker.allow():
+            raise CircuitOpenError(f"{backend} circuit is open after repeated failures")
+        try:
+            result = await self._call_with_retries(backend, call)
+        except asyncio.CancelledError:
+            breaker.record_abandoned()
+            raise
+        except Exception:
+            breaker.record_failure()
+            raise
+        breaker.record_success()
+        return result
+    
+    async def _call_with_retries(self, backend: str, call: Callable[[], Awaitable]):
+        limiter = self.limiters[backend]
+        attempt = 0
+        while True:
+            await limiter.acquire()
+            try:
+                result = await call()
+            except Exception as e:
+                error = e
+            else:
+                error = None
+            finally:
+                await limiter.release()
+            
+            if error is None:
+                await limiter.on_success()
+                return result
+            
+            retryable, overload, retry_after = _classify_llm_error(error)
+            if overload:
+                await limiter.on_overload()
+            if not retryable or attempt >= self.max_retries:
+                raise error
+            backoff = min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * (2 ** attempt))
+            delay = retry_after if retry_after is not None else random.uniform(0, backoff)
+            attempt += 1
+            print(f"⚠️ {backend} call failed ({error}); retry {attempt}/{self.max_retries} in {delay:.1f}s (limit {limiter.limit:.1f})")
+            await asyncio.sleep(delay)
     
     async def categorize_document_openai(self, text: str, doc_type: str, model: str = "gpt-4o-mini") -> str:
         """Categorize using OpenAI models."""
@@ -28,27 +464,15 @@ class LLMService:
             print("❌ Error: OpenAI client not initialized. Check your OPENAI_API_KEY.")
             return "Other"
         prompt = f"""Analyze the following {doc_type.upper()} and categorize it into ONE of these categories:
-- Software Engineering
-- Artificial Intelligence / Machine Learning
-- Cybersecurity
-- Sales & Marketing
-- Finance & Accounting
-- Human Resources
-- Operations & Logistics
-- Healthcare
-- Legal
-- Design & Creative
-- Data Science
-- Product Management
-- Other
+{CATEGORY_LIST}
 
 {doc_type.upper()} Content:
-{text[:3000]}
+{text[:PROMPT_MAX_CHARS]}
 
 Respond with ONLY the category name, nothing else."""
 
         try:
-            response = await self.openai_client.chat.completions.create(
+            response = await self._call_with_backoff("openai", lambda: self.openai_client.chat.completions.create(
                 model=model,
                 messages=[
                     {"role": "system", "content": "You are an expert HR categorization assistant."},
@@ -56,49 +480,58 @@ Respond with ONLY the category name, nothing else."""
                 ],
                 temperature=0.3,
                 max_tokens=50
-            )
+            ))
             category = response.choices[0].message.content.strip()
             return category
         except Exception as e:
             print(f"Error categorizing with OpenAI ({model}): {e}")
             return "Other"
     
+    async def _ollama_generate(self, payload: Dict, stop_at_json: bool = False) -> Dict:
+        """
+        POST to Ollama's /api/generate over the pooled client, raising HTTPStatusError on non-2xx responses.
+        With streaming enabled and `stop_at_json`, reading stops as soon as the first JSON object closes.
+        """
+        if self.http_client is None:
+            await self.startup()
+        payload = {**payload, "keep_alive": self.ollama_keep_alive}
+        
+        if not self.ollama_stream:
+            response = await self.http_client.post("/api/generate", json={**payload, "stream": False})
+            response.raise_for_status()
+            return response.json()
+        
+        chunks = []
+        tracker = JsonObjectTracker() if stop_at_json else None
+        async with self.http_client.stream("POST", "/api/generate", json={**payload, "stream": True}) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line:
+                    continue
+                event = json.loads(line)
+                piece = event.get("response", "")
+                chunks.append(piece)
+                if event.get("done") or (tracker and tracker.feed(piece)):
+                    break
+        return {"response": "".join(chunks)}
+    
     async def categorize_document_ollama(self, text: str, doc_type: str) -> str:
         """Categorize using Ollama."""
         prompt = f"""Analyze the following {doc_type.upper()} and categorize it into ONE of these categories:
-- Software Engineering
-- Artificial Intelligence / Machine Learning
-- Cybersecurity
-- Sales & Marketing
-- Finance & Accounting
-- Human Resources
-- Operations & Logistics
-- Healthcare
-- Legal
-- Design & Creative
-- Data Science
-- Product Management
-- Other
+{CATEGORY_LIST}
 
 {doc_type.upper()} Content:
-{text[:3000]}
+{text[:PROMPT_MAX_CHARS]}
 
 Respond with ONLY the category name, nothing else."""
 
         try:
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                response = await client.post(
-                    f"{self.ollama_url}/api/generate",
-                    json={
-                        "model": self.ollama_model,
-                        "prompt": prompt,
-                        "stream": False
-                    }
-                )
-                response.raise_for_status()
-                result = response.json()
-                category = result.get("response", "Other").strip()
-                return category
+            result = await self._call_with_backoff("ollama", lambda: self._ollama_generate({
+                "model": self.ollama_model,
+                "prompt": prompt
+            }))
+            category = result.get("response", "Other").strip()
+            return category
         except Exception as e:
             print(f"Error categorizing with Ollama: {e}")
             return "Other"
@@ -110,6 +543,52 @@ Respond with ONLY the category name, nothing else."""
         else:
             return await self.categorize_document_openai(text, doc_type, model)
     
+    async def extract_profile_openai(self, text: str, doc_type: str, model: str = "gpt-4o-mini") -> Optional[Dict]:
+        """Extract a structured profile using OpenAI models; None on failure."""
+        if not self.openai_client:
+            return None
+        try:
+            response = await self._call_with_backoff("openai", lambda: self.openai_client.chat.completions.create(
+                model=model,
+                messages=[
+                    {"role": "system", "content": "You are an expert HR analyst extracting structured data from CVs and job descriptions. Always respond in valid JSON."},
+                    {"role": "user", "content": _profile_prompt(text, doc_type)}
+                ],
+                temperature=0,
+                max_tokens=800,
+                response_format={"type": "json_object"}
+            ))
+            return json.loads(response.choices[0].message.content)
+        except Exception as e:
+            print(f"Error extracting profile with OpenAI ({model}): {e}")
+            return None
+    
+    async def extract_profile_ollama(self, text: str, doc_type: str) -> Optional[Dict]:
+        """Extract a structured profile using Ollama; None on failure."""
+        try:
+            result = await self._call_with_backoff("ollama", lambda: self._ollama_generate({
+                "model": self.ollama_model,
+                "prompt": _profile_prompt(text, doc_type),
+                "format": "json",
+                "options": {
+                    "temperature": 0,
+                    "num_predict": 800
+                }
+            }, stop_at_json=True))
+            data, error = decode_json(result.get("response", ""))
+            if error:
+                raise ValueError(error)
+            return data
+        except Exception as e:
+            print(f"Error extracting profile with Ollama: {e}")
+            return None
+    
+    async def extract_profile(self, text: str, doc_type: str, model: str = "gpt-4o-mini") -> Optional[Dict]:
+        """Extract skills, titles, years of experience, education and certifications from a document."""
+        if model == "ollama":
+            return await self.extract_profile_ollama(text, doc_type)
+        return await self.extract_profile_openai(text, doc_type, model)
+    
     async def match_cv_to_jd_openai(self, cv_text: str, jd_text: str, cv_name: str, model: str = "gpt-4o-mini") -> Dict:
         """Match CV to JD using OpenAI models with enhanced prompts."""
         if not self.openai_client:
@@ -126,10 +605,10 @@ Respond with ONLY the category name, nothing else."""
         prompt = f"""You are an expert HR recruiter with 20+ years of experience in talent acquisition. Perform a comprehensive analysis of how well this candidate's CV matches the Job Description.
 
 JOB DESCRIPTION:
-{jd_text[:3000]}
+{jd_text[:PROMPT_MAX_CHARS]}
 
 CANDIDATE CV:
-{cv_text[:3000]}
+{cv_text[:PROMPT_MAX_CHARS]}
 
 ANALYSIS INSTRUCTIONS:
 1. Carefully evaluate the candidate's skills, experience, education, and achievements against the job requirements
@@ -164,7 +643,7 @@ Provide your analysis in the following JSON format:
 Respond with ONLY valid JSON, no additional text."""
 
         try:
-            response = await self.openai_client.chat.completions.create(
+            response = await self._call_with_backoff("openai", lambda: self.openai_client.chat.completions.create(
                 model=model,
                 messages=[
                     {"role": "system", "content": "You are an expert HR recruiter performing detailed CV-JD matching analysis. Always provide thorough, evidence-based assessments in valid JSON format."},
@@ -173,19 +652,10 @@ Respond with ONLY valid JSON, no additional text."""
                 temperature=0.2,  # Lower temperature for more consistent scoring
                 max_tokens=1200,
                 response_format={"type": "json_object"}
-            )
+            ))
             
-            llm_response = response.choices[0].message.content
-            match_data = json.loads(llm_response)
+            match_data = await self._decode_match_response(response.choices[0].message.content, model)
             match_data["cv_name"] = cv_name
-            
-            # Ensure score is valid
-            if not isinstance(match_data.get("score"), (int, float)):
-                match_data["score"] = 50
-            else:
-                # Clamp score between 0-100
-                match_data["score"] = max(0, min(100, match_data["score"]))
-            
             return match_data
         except Exception as e:
             print(f"Error matching with OpenAI ({model}, {cv_name}): {e}")
@@ -203,10 +673,10 @@ Respond with ONLY valid JSON, no additional text."""
         prompt = f"""You are an expert HR recruiter. Analyze how well this CV matches the Job Description.
 
 JOB DESCRIPTION:
-{jd_text[:2500]}
+{jd_text[:PROMPT_MAX_CHARS]}
 
 CANDIDATE CV:
-{cv_text[:2500]}
+{cv_text[:PROMPT_MAX_CHARS]}
 
 Provide your analysis in the following JSON format:
 {{
@@ -220,39 +690,19 @@ Provide your analysis in the following JSON format:
 Respond with ONLY valid JSON, no additional text."""
 
         try:
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                response = await client.post(
-                    f"{self.ollama_url}/api/generate",
-                    json={
-                        "model": self.ollama_model,
-                        "prompt": prompt,
-                        "stream": False,
-                        "options": {
-                            "temperature": 0.3,
-                            "num_predict": 500
-                        }
-                    }
-                )
-                
-                if response.status_code != 200:
-                    raise Exception(f"HTTP {response.status_code}")
-                
-                result = response.json()
-                llm_response = result.get("response", "")
-                
-                # Extract JSON
-                if "```json" in llm_response:
-                    llm_response = llm_response.split("```json")[1].split("```")[0].strip()
-                elif "```" in llm_response:
-                    llm_response = llm_response.split("```")[1].split("```")[0].strip()
-                
-                match_data = json.loads(llm_response)
-                match_data["cv_name"] = cv_name
-                
-                if not isinstance(match_data.get("score"), (int, float)):
-                    match_data["score"] = 50
-                
-                return match_data
+            result = await self._call_with_backoff("ollama", lambda: self._ollama_generate({
+                "model": self.ollama_model,
+                "prompt": prompt,
+                "options": {
+                    "temperature": 0.3,
+                    "num_predict": 500,
+                    # Two full digests can exceed the default context window
+                    "num_ctx": estimate_tokens(prompt) + 500
+                }
+            }, stop_at_json=True))
+            match_data = await self._decode_match_response(result.get("response", ""), "ollama")
+            match_data["cv_name"] = cv_name
+            return match_data
         except Exception as e:
             print(f"Error matching with Ollama ({cv_name}): {e}")
             return {
@@ -264,60 +714,295 @@ Respond with ONLY valid JSON, no additional text."""
                 "summary": f"Ollama Error: {str(e)[:100]}"
             }
     
-    async def match_cv_to_jd(self, cv_text: str, jd_text: str, cv_name: str, model: str = "gpt-4o-mini") -> Dict:
-        """Match CV to JD using specified model."""
+    async def _fix_json(self, llm_response: str, error: str, model: str) -> Optional[str]:
+        """Ask the model that produced a broken match response to re-emit it as valid JSON."""
+        prompt = _fix_json_prompt(llm_response, error)
+        if model == "ollama":
+            result = await self._call_with_backoff("ollama", lambda: self._ollama_generate({
+                "model": self.ollama_model,
+                "prompt": prompt,
+                "format": "json",
+                "options": {
+                    "temperature": 0,
+                    "num_predict": LLM_JSON_FIX_MAX_TOKENS
+                }
+            }, stop_at_json=True))
+            return result.get("response", "")
+        response = await self._call_with_backoff("openai", lambda: self.openai_client.chat.completions.create(
+            model=model,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=0,
+            max_tokens=LLM_JSON_FIX_MAX_TOKENS,
+            response_format={"type": "json_object"}
+        ))
+        return response.choices[0].message.content
+    
+    async def _decode_match_response(self, llm_response: str, model: str) -> Dict:
+        """
+        Decode and validate a match response: the first balanced JSON object, repaired
+        locally if needed, then one "fix the JSON" call as a last resort.
+        Raises ValueError when nothing usable comes back.
+        """
+        match_data, error = decode_match(llm_response)
+        if match_data is not None:
+            return match_data
+        if LLM_JSON_FIX_RETRY and llm_response and llm_response.strip():
+            decode_stats["fix_retry"] += 1
+            match_data, _ = decode_match(await self._fix_json(llm_response, error, model))
+            if match_data is not None:
+                decode_stats["fix_recovered"] += 1
+                return match_data
+        decode_stats["failed"] += 1
+        raise ValueError(f"Unusable match response ({error})")
+    
+    async def _match_once(self, cv_text: str, jd_text: str, cv_name: str, model: str) -> Dict:
         if model == "ollama":
             return await self.match_cv_to_jd_ollama(cv_text, jd_text, cv_name)
         else:
             # Support for GPT-5 and all other OpenAI models
             return await self.match_cv_to_jd_openai(cv_text, jd_text, cv_name, model)
     
-    async def batch_match(self, cv_list: List[Dict], jd_text: str, model: str = "gpt-4o-mini", batch_size: int = 5) -> List[Dict]:
+    def _tracker(self, model: str) -> LatencyTracker:
+        if model not in self.latency:
+            self.latency[model] = LatencyTracker()
+        return self.latency[model]
+    
+    async def _timed_match(self, cv_text: str, jd_text: str, cv_name: str, model: str) -> Dict:
+        """Single match call whose latency feeds the model's tracker when it succeeds."""
+        start = time.monotonic()
+        result = await self._match_once(cv_text, jd_text, cv_name, model)
+        if result.get("match_level") != "Error":
+            self._tracker(model).record(time.monotonic() - start)
+        return result
+    
+    def _route(self, model: str) -> tuple:
+        """(model to call first, model for a hedge); fails over while the primary's circuit is open."""
+        failover = self.failover_models[_backend_for(model)]
+        if failover and not self.breakers[_backend_for(model)].available() and self.breakers[_backend_for(failover)].available():
+            return failover, model
+        return model, failover or model
+    
+    async def match_cv_to_jd(self, cv_text: str, jd_text: str, cv_name: str, model: str = "gpt-4o-mini") -> Dict:
         """
-        Match multiple CVs against a JD in batches.
-        Optimized batch sizes for different models.
+        Match CV to JD using specified model.
+        If the call outlives the model's observed p95 (LLM_HEDGE_PERCENTILE), a hedge
+        is sent to the failover model (or the same one) and the first successful
+        answer wins; the other call is cancelled. Results served by a model other
+        than the requested one carry `served_by`.
         """
-        # Adjust batch size based on model
+        primary, secondary = self._route(model)
+        self.match_calls += 1
+        delay = self._tracker(primary).percentile(LLM_HEDGE_PERCENTILE)
+        can_hedge = (
+            self.hedge_enabled and delay is not None
+            and self.hedged_calls < LLM_HEDGE_MAX_FRACTION * self.match_calls
+        )
+        
+        first = asyncio.ensure_future(self._timed_match(cv_text, jd_text, cv_name, primary))
+        tasks = {first: primary}
+        try:
+            if can_hedge:
+                done, _ = await asyncio.wait({first}, timeout=max(delay, LLM_HEDGE_MIN_DELAY))
+                if not done and self.breakers[_backend_for(secondary)].available():
+                    self.hedged_calls += 1
+                    hedge = asyncio.ensure_future(self._timed_match(cv_text, jd_text, cv_name, secondary))
+                    tasks[hedge] = secondary
+            
+            result = None
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    candidate = task.result()
+                    if result is None or (result.get("match_level") == "Error" and candidate.get("match_level") != "Error"):
+                        result = candidate
+                        served_by = tasks[task]
+                if result.get("match_level") != "Error":
+                    break
+        finally:
+            for task in tasks:
+                task.cancel()
+        
+        if served_by != model:
+            result["served_by"] = served_by
+        return result
+    
+    def backend_status(self) -> Dict:
+        """Circuit state, concurrency limit and latency percentiles per backend/model."""
+        return {
+            "backends": {
+                backend: {
+                    "circuit": self.breakers[backend].state,
+                    "consecutive_failures": self.breakers[backend].failures,
+                    "concurrency_limit": round(self.limiters[backend].limit, 1),
+                    "failover_model": self.failover_models[backend],
+                }
+                for backend in self.breakers
+            },
+            "latency": {
+                model: {
+                    "samples": len(tracker.samples),
+                    "p50": _rounded(tracker.percentile(50)),
+                    "p95": _rounded(tracker.percentile(95)),
+                }
+                for model, tracker in self.latency.items()
+            },
+            "match_calls": self.match_calls,
+            "hedged_calls": self.hedged_calls,
+            "json_decoding": dict(decode_stats),
+        }
+    
+    async def match_pack_openai(self, cvs: List[Dict], jd_text: str, model: str = "gpt-4o-mini") -> Dict[int, Dict]:
+        """Score several CVs against one JD in a single OpenAI request; returns valid results by pack position."""
+        if not self.openai_client:
+            return {}
+        prompt = _pack_prompt(jd_text, cvs, PROMPT_MAX_CHARS)
+        try:
+            response = await self._call_with_backoff("openai", lambda: self.openai_client.chat.completions.create(
+                model=model,
+                messages=[
+                    {"role": "system", "content": "You are an expert HR recruiter performing detailed CV-JD matching analysis. Always provide thorough, evidence-based assessments in valid JSON format."},
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=0.2,
+                max_tokens=MATCH_PACK_OUTPUT_TOKENS * len(cvs) + 100,
+                response_format={"type": "json_object"}
+            ))
+            return _parse_pack_response(response.choices[0].message.content, cvs)
+        except Exception as e:
+            print(f"Error matching pack of {len(cvs)} CVs with OpenAI ({model}): {e}")
+            return {}
+    
+    async def match_pack_ollama(self, cvs: List[Dict], jd_text: str) -> Dict[int, Dict]:
+        """Score several CVs against one JD in a single Ollama request; returns valid results by pack position."""
+        prompt = _pack_prompt(jd_text, cvs, PROMPT_MAX_CHARS)
+        num_predict = MATCH_PACK_OUTPUT_TOKENS * len(cvs) + 100
+        try:
+            result = await self._call_with_backoff("ollama", lambda: self._ollama_generate({
+                "model": self.ollama_model,
+                "prompt": prompt,
+                "options": {
+                    "temperature": 0.3,
+                    "num_predict": num_predict,
+                    # The default context window is too small for several CVs
+                    "num_ctx": estimate_tokens(prompt) + num_predict
+                }
+            }, stop_at_json=True))
+            return _parse_pack_response(result.get("response", ""), cvs)
+        except Exception as e:
+            print(f"Error matching pack of {len(cvs)} CVs with Ollama: {e}")
+            return {}
+    
+    async def match_pack(self, cvs: List[Dict], jd_text: str, model: str = "gpt-4o-mini") -> Dict[int, Dict]:
+        """Score a pack of CVs using specified model."""
         if model == "ollama":
-            batch_size = 3  # Ollama needs smaller batches
-        elif model in ["gpt-5", "gpt-4o", "gpt-4-turbo"]:
-            batch_size = 4  # Advanced models, moderate batching
-        else:
-            batch_size = 5  # GPT-4o-mini and GPT-3.5-turbo can handle more
+            return await self.match_pack_ollama(cvs, jd_text)
+        return await self.match_pack_openai(cvs, jd_text, model)
+    
+    def max_concurrency_for(self, model: str) -> int:
+        """Return the in-flight request limit for the backend serving `model`."""
+        if model == "ollama":
+            return self.ollama_max_concurrency
+        return self.openai_max_concurrency
+    
+    async def match_matrix(self, groups: List[tuple], model: str = "gpt-4o-mini", max_concurrency: Optional[int] = None, on_result: Optional[Callable[[int, Dict, Dict], Awaitable[None]]] = None, packed: bool = False) -> List[List[Dict]]:
+        """
+        Match several JDs' CV lists through one shared window of in-flight requests.
+        `groups` is a list of (jd_text, cv_list). Work is queued JD by JD, so consecutive
+        requests share the JD prompt prefix the backend can reuse, and a new request
+        starts as soon as any slot frees up. With `packed`, CVs are sent several per
+        request (see plan_packs); CVs whose packed result is missing or malformed are
+        re-queued as single-CV calls. `on_result(group, cv, result)` is awaited as each
+        CV finishes. Returns each group's results in input order.
+        """
+        limit = max(1, max_concurrency or self.max_concurrency_for(model))
+        results: List[List[Optional[Dict]]] = [[None] * len(cvs) for _, cvs in groups]
+        
+        # Work units are (group, [(position in group, cv), ...]); more than one CV means a packed request
+        queue = deque()
+        for group, (jd_text, cvs) in enumerate(groups):
+            indexed = list(enumerate(cvs))
+            if packed:
+                position_of = {id(cv): position for position, cv in indexed}
+                queue.extend((group, [(position_of[id(cv)], cv) for cv in pack]) for pack in plan_packs(cvs, jd_text, PROMPT_MAX_CHARS))
+            else:
+                queue.extend((group, [item]) for item in indexed)
         
-        all_results = []
+        total = sum(len(cvs) for _, cvs in groups)
+        requests = f" in {len(queue)} packed requests" if packed else ""
+        print(f"Matching {total} CVs against {len(groups)} JD(s) with {model}{requests} (max {limit} in flight)...")
         
-        for i in range(0, len(cv_list), batch_size):
-            batch = cv_list[i:i + batch_size]
-            print(f"Processing batch {i//batch_size + 1} with {model} ({len(batch)} CVs)...")
-            
-            tasks = []
-            for cv in batch:
-                task = self.match_cv_to_jd(cv["text"], jd_text, cv["name"], model)
-                tasks.append(task)
-            
-            batch_results = await asyncio.gather(*tasks, return_exceptions=True)
-            
-            for result in batch_results:
-                if isinstance(result, Exception):
-                    all_results.append({
-                        "cv_name": "Unknown",
-                        "score": 0,
-                        "match_level": "Error",
-                        "key_matches": [],
-                        "gaps": [],
-                        "summary": f"Error: {str(result)}"
-                    })
-                else:
-                    all_results.append(result)
-            
-            # Small delay between batches
-            if i + batch_size < len(cv_list):
-                await asyncio.sleep(0.5)
+        async def finish(group: int, position: int, cv: Dict, result: Dict):
+            results[group][position] = result
+            if on_result:
+                await on_result(group, cv, result)
+        
+        async def run(group: int, position: int, cv: Dict):
+            try:
+                result = await self.match_cv_to_jd(cv["text"], groups[group][0], cv["name"], model)
+            except Exception as e:
+                result = {
+                    "cv_name": cv["name"],
+                    "score": 0,
+                    "match_level": "Error",
+                    "key_matches": [],
+                    "gaps": [],
+                    "summary": f"Error: {str(e)}"
+                }
+            await finish(group, position, cv, result)
+        
+        async def run_pack(group: int, items: List[tuple]):
+            parsed = await self.match_pack([cv for _, cv in items], groups[group][0], model)
+            for pack_position, (position, cv) in enumerate(items):
+                if pack_position in parsed:
+                    await finish(group, position, cv, parsed[pack_position])
+            missing = [item for pack_position, item in enumerate(items) if pack_position not in parsed]
+            if missing:
+                print(f"⚠️ Packed response covered {len(parsed)}/{len(items)} CVs; scoring the rest individually")
+                # Next in line, while this JD's prefix is still warm; idle slots pick them up too
+                queue.extendleft((group, [item]) for item in reversed(missing))
+                spawn(min(len(missing), limit - len(active)))
+        
+        active = set()
+        workers = []
+        
+        async def worker():
+            try:
+                while queue:
+                    group, items = queue.popleft()
+                    if len(items) == 1:
+                        await run(group, *items[0])
+                    else:
+                        await run_pack(group, items)
+            finally:
+                active.discard(asyncio.current_task())
+        
+        def spawn(count: int):
+            for _ in range(max(0, count)):
+                task = asyncio.ensure_future(worker())
+                active.add(task)
+                workers.append(task)
+        
+        spawn(min(limit, len(queue)))
+        try:
+            while workers:
+                await workers.pop(0)
+        finally:
+            for task in workers:
+                task.cancel()
+        return results
+    
+    async def batch_match(self, cv_list: List[Dict], jd_text: str, model: str = "gpt-4o-mini", max_concurrency: Optional[int] = None, on_result: Optional[Callable[[Dict, Dict], Awaitable[None]]] = None, packed: bool = False) -> List[Dict]:
+        """
+        Match multiple CVs against a JD using a sliding window of in-flight requests
+        (see match_matrix). `on_result(cv, result)` is awaited as each CV finishes.
+        """
+        async def forward(_: int, cv: Dict, result: Dict):
+            await on_result(cv, result)
         
-        # Sort by score descending
-        sorted_results = sorted(all_results, key=lambda x: x.get("score", 0), reverse=True)
-        return sorted_results
+        results = (await self.match_matrix([(jd_text, cv_list)], model, max_concurrency, forward if on_result else None, packed))[0]
+        # Results are in input order; the stable sort preserves it for ties
+        return sorted(results, key=lambda x: x.get("score", 0), reverse=True)
 
 # Singleton instance
 llm_service = LLMService()
@@ -0,0 +1,112 @@
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from models import MatchCacheEntry
+from llm_service import MATCH_PROMPT_VERSION
+
+# Number of match results kept in the in-memory LRU in front of SQLite
+MATCH_CACHE_SIZE = int(os.getenv("MATCH_CACHE_SIZE", "4096"))
+
+# Session.info key holding cache rows to upsert when the session commits
+_PENDING_KEY = "match_cache_pending"
+
+# Per-CV fields that are re-attached on every hit instead of being cached
+_IDENTITY_FIELDS = ("cv_id", "cv_name", "cached", "near_duplicates")
+
+
+def text_hash(text: Optional[str]) -> str:
+    """SHA-256 hex digest of a document's text."""
+    return hashlib.sha256((text or "").encode("utf-8")).hexdigest()
+
+
+class MatchCache:
+    """
+    Content-addressed cache of CV x JD match results.
+    Keyed by (CV text hash, JD text hash, model, prompt version), backed by the
+    match_cache table with an in-memory LRU in front of it.
+    """
+    
+    def __init__(self, max_size: int = MATCH_CACHE_SIZE):
+        self.max_size = max_size
+        self._lru: "OrderedDict[str, Dict]" = OrderedDict()
+    
+    @staticmethod
+    def make_key(cv_hash: str, jd_hash: str, model: str, prompt_version: str = MATCH_PROMPT_VERSION) -> str:
+        return hashlib.sha256(f"{cv_hash}:{jd_hash}:{model}:{prompt_version}".encode("utf-8")).hexdigest()
+    
+    def _remember(self, key: str, result: Dict):
+        self._lru[key] = result
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_size:
+            self._lru.popitem(last=False)
+    
+    def get_many(self, db: Session, keys: List[str]) -> Dict[str, Dict]:
+        """Return cached results for the given keys, checking memory before SQLite."""
+        found = {}
+        missing = []
+        for key in keys:
+            if key in self._lru:
+                self._lru.move_to_end(key)
+                found[key] = dict(self._lru[key])
+            else:
+                missing.append(key)
+        
+        if missing:
+            rows = db.query(MatchCacheEntry.cache_key, MatchCacheEntry.result_json).filter(
+                MatchCacheEntry.cache_key.in_(missing)
+            ).all()
+            for key, result_json in rows:
+                result = json.loads(result_json)
+                self._remember(key, result)
+                found[key] = dict(result)
+        
+        return found
+    
+    def put(self, db: Session, key: str, cv_hash: str, jd_hash: str, model: str, result: Dict, prompt_version: str = MATCH_PROMPT_VERSION):
+        """Store a match result; it is written to SQLite when the caller commits the session."""
+        payload = {k: v for k, v in result.items() if k not in _IDENTITY_FIELDS}
+        self._remember(key, payload)
+        db.info.setdefault(_PENDING_KEY, {})[key] = {
+            "cache_key": key,
+            "cv_hash": cv_hash,
+            "jd_hash": jd_hash,
+            "model": model,
+            "prompt_version": prompt_version,
+            "result_json": json.dumps(payload),
+            "created_at": datetime.utcnow()
+        }
+
+
+@event.listens_for(Session, "before_commit")
+def _write_pending_entries(session: Session):
+    # Upserted in one statement at commit time, so concurrent requests (or worker
+    # processes) caching the same key never collide and no write lock is held
+    # while LLM calls are still in flight
+    pending = session.info.pop(_PENDING_KEY, None)
+    if not pending:
+        return
+    stmt = sqlite_insert(MatchCacheEntry)
+    session.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[MatchCacheEntry.cache_key],
+            set_={"result_json": stmt.excluded.result_json, "created_at": stmt.excluded.created_at}
+        ),
+        list(pending.values())
+    )
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_pending_entries(session: Session):
+    session.info.pop(_PENDING_KEY, None)
+
+
+# Singleton instance
+match_cache = MatchCache()
@@ -0,0 +1,360 @@
+import asyncio
+import json
+import os
+import socket
+import uuid
+from contextlib import nullcontext
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+from models import Document, MatchJob
+import match_state
+import profiles
+from match_pipeline import (
+    build_match_record, cascade_score_cvs, collapse_near_duplicates, score_cvs, score_matrix, select_cvs,
+    select_delta_cvs, select_matrix
+)
+
+ACTIVE_STATUSES = ("queued", "running")
+FINISHED_STATUSES = ("completed", "failed", "cancelled")
+
+# How often each server process refreshes its jobs' heartbeats and picks up cancellations
+MATCH_JOB_HEARTBEAT_SECONDS = float(os.getenv("MATCH_JOB_HEARTBEAT_SECONDS", "5"))
+# An active job whose owner has not sent a heartbeat for this long is failed as interrupted
+MATCH_JOB_STALE_SECONDS = float(os.getenv("MATCH_JOB_STALE_SECONDS", "60"))
+
+
+def _owner_alive(owner: Optional[str]) -> Optional[bool]:
+    """Whether the owning process still exists; None if it runs on another host."""
+    host, _, pid = (owner or "").rpartition(":")
+    if host != socket.gethostname() or not pid.isdigit():
+        return None
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _finish(db: Session, job_ids: Iterable[str], status: str, error: Optional[str] = None) -> int:
+    """Move still-active jobs to a finished status; a status set elsewhere (e.g. by another worker) is kept."""
+    return db.query(MatchJob).filter(
+        MatchJob.id.in_(list(job_ids)),
+        MatchJob.status.in_(ACTIVE_STATUSES)
+    ).update(
+        {"status": status, "error": error, "finished_at": datetime.utcnow()},
+        synchronize_session="fetch"
+    )
+
+
+class MatchJobManager:
+    """
+    Runs match requests as background asyncio tasks.
+    Each job writes a MatchResult row as soon as a CV is scored, so progress and
+    partial results can be read while it runs; jobs outlive the submitting request.
+    Jobs are owned by the server process that runs them. The owner keeps a heartbeat
+    on each active job and stops jobs whose cancellation was requested in the
+    database, so any worker can report on, cancel or clean up after any job.
+    """
+
+    def __init__(self):
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._heartbeat_task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """Start the heartbeat loop (at server startup)."""
+        if self._heartbeat_task is None or self._heartbeat_task.done():
+            self._heartbeat_task = asyncio.create_task(self._heartbeat())
+
+    def stop(self):
+        if self._heartbeat_task is not None:
+            self._heartbeat_task.cancel()
+            self._heartbeat_task = None
+
+    def submit(self, db: Session, params: Dict) -> MatchJob:
+        """Create a job for a MatchRequest dict and start it in the background."""
+        job = MatchJob(
+            id=uuid.uuid4().hex,
+            jd_id=params["jd_id"],
+            model=params["model"],
+            status="queued",
+            request_json=json.dumps(params),
+            owner=self.owner,
+            heartbeat_at=datetime.utcnow()
+        )
+        db.add(job)
+        db.commit()
+        db.refresh(job)
+
+        task = asyncio.create_task(self._run(job.id, params))
+        self._tasks[job.id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job.id, None))
+        return job
+
+    def submit_bulk(self, db: Session, params: Dict, jd_ids: List[int]) -> List[MatchJob]:
+        """
+        Create one job per JD for a BulkMatchRequest dict and run them all as a single
+        background task sharing one LLM window. Cancelling any of them cancels the batch.
+        """
+        batch_id = uuid.uuid4().hex
+        jobs = [
+            MatchJob(
+                id=uuid.uuid4().hex,
+                jd_id=jd_id,
+                model=params["model"],
+                status="queued",
+                request_json=json.dumps({**params, "jd_id": jd_id}),
+                batch_id=batch_id,
+                owner=self.owner,
+                heartbeat_at=datetime.utcnow()
+            )
+            for jd_id in jd_ids
+        ]
+        db.add_all(jobs)
+        db.commit()
+        for job in jobs:
+            db.refresh(job)
+
+        task = asyncio.create_task(self._run_bulk(batch_id, params))
+        for job in jobs:
+            self._tasks[job.id] = task
+        task.add_done_callback(lambda _: [self._tasks.pop(job.id, None) for job in jobs])
+        return jobs
+
+    def submit_open_deltas(self, db: Session) -> List[MatchJob]:
+        """Queue a delta run of every stored ranking of an open JD (after new CVs are uploaded)."""
+        if not match_state.AUTO_DELTA_MATCH:
+            return []
+        return [self.submit(db, match_state.delta_params(state)) for state in match_state.open_states(db)]
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancel a job running in this process now; returns False if it is not running here."""
+        task = self._tasks.get(job_id)
+        if task is None or task.done():
+            return False
+        task.cancel()
+        return True
+
+    def mark_interrupted(self, db: Session):
+        """
+        Fail active jobs whose owner is gone: its process no longer exists, it has not
+        sent a heartbeat for MATCH_JOB_STALE_SECONDS, or it is this process but the job
+        is not running here (left by an earlier process with the same pid).
+        Jobs of other live workers are left alone.
+        """
+        stale_before = datetime.utcnow() - timedelta(seconds=MATCH_JOB_STALE_SECONDS)
+        orphaned = [
+            job.id for job in db.query(MatchJob).filter(MatchJob.status.in_(ACTIVE_STATUSES))
+            if (job.owner == self.owner and job.id not in self._tasks)
+            or (job.owner != self.owner and _owner_alive(job.owner) is False)
+            or (job.heartbeat_at or job.created_at or datetime.min) < stale_before
+        ]
+        if orphaned:
+            _finish(db, orphaned, "failed", "Interrupted by server restart")
+            print(f"Marked {len(orphaned)} orphaned match job(s) as failed")
+        db.commit()
+
+    def _beat(self):
+        """Refresh heartbeats of the jobs running here, stop those cancelled or finished elsewhere, and sweep orphans."""
+        db = SessionLocal()
+        try:
+            job_ids = list(self._tasks)
+            if job_ids:
+                db.query(MatchJob).filter(
+                    MatchJob.id.in_(job_ids),
+                    MatchJob.status.in_(ACTIVE_STATUSES)
+                ).update({"heartbeat_at": datetime.utcnow()}, synchronize_session=False)
+                stopped = db.query(MatchJob.id).filter(
+                    MatchJob.id.in_(job_ids),
+                    or_(MatchJob.cancel_requested.is_(True), MatchJob.status.notin_(ACTIVE_STATUSES))
+                )
+                for (job_id,) in stopped:
+                    self.cancel(job_id)
+                db.commit()
+            self.mark_interrupted(db)
+        finally:
+            db.close()
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(MATCH_JOB_HEARTBEAT_SECONDS)
+            try:
+                self._beat()
+            except Exception as e:
+                print(f"Match job heartbeat failed: {e}")
+
+    async def _run(self, job_id: str, params: Dict):
+        db = SessionLocal()
+        job = None
+        try:
+            job = db.get(MatchJob, job_id)
+            if job.cancel_requested:
+                raise asyncio.CancelledError()
+            if job.status not in ACTIVE_STATUSES:
+                return  # Failed by another worker before it started
+            job.status = "running"
+            job.started_at = datetime.utcnow()
+
+            jd = db.query(Document).filter(
+                Document.id == params["jd_id"],
+                Document.file_type == "jd"
+            ).first()
+            if not jd:
+                raise ValueError("Job Description not found")
+
+            # Delta runs of the same stored ranking wait for each other instead of scoring the same new CVs
+            delta = params.get("delta", False)
+            packed = params.get("packed", False)
+            lock = match_state.lock(jd.id, params["model"], match_state.prompt_version_for(packed)) if delta else nullcontext()
+            async with lock:
+                if delta:
+                    cv_data, _, _, last_cv_id = select_delta_cvs(
+                        db, jd, params["model"], packed, params.get("top_k"), params.get("prerank", "bm25")
+                    )
+                else:
+                    last_cv_id = match_state.latest_cv_id(db)
+                    cv_data, _ = select_cvs(db, jd, params.get("cv_ids"), params.get("top_k"), params.get("prerank", "bm25"))
+                if cv_data and params.get("collapse_near_duplicates"):
+                    cv_data, _ = collapse_near_duplicates(db, cv_data, params.get("near_duplicate_threshold"))
+                jd_text = None
+                if cv_data and params.get("use_profiles"):
+                    jd_text, cv_data = profiles.compact_texts(db, jd, cv_data)
+                job.total = len(cv_data)
+                db.commit()
+
+                async def record(result: Dict):
+                    db.add(build_match_record(result, jd.id, job_id))
+                    job.done += 1
+                    db.commit()
+
+                results = []
+                if params.get("rescore_model"):
+                    await cascade_score_cvs(
+                        db, jd, cv_data, params["model"], params["rescore_model"], params.get("rescore_top_k"),
+                        params.get("rescore_threshold"), params.get("force_refresh", False), on_result=record,
+                        packed=packed, jd_text=jd_text
+                    )
+                elif cv_data:
+                    results = await score_cvs(db, jd, cv_data, params["model"], params.get("force_refresh", False),
+                                              on_result=record, packed=packed, jd_text=jd_text)
+
+                # Runs over the whole corpus and delta runs keep the JD's stored ranking current
+                if delta or (params.get("cv_ids") is None and not params.get("rescore_model")):
+                    match_state.record(db, jd.id, params, results, last_cv_id)
+
+            _finish(db, [job_id], "completed")
+            db.commit()
+        except asyncio.CancelledError:
+            db.rollback()
+            _finish(db, [job_id], "cancelled")
+            db.commit()
+            raise
+        except Exception as e:
+            print(f"Match job {job_id} failed: {e}")
+            db.rollback()
+            _finish(db, [job_id], "failed", str(e)[:500])
+            db.commit()
+        finally:
+            db.close()
+
+
+    async def _run_bulk(self, batch_id: str, params: Dict):
+        db = SessionLocal()
+        jobs: List[MatchJob] = []
+
+        def finish(job: MatchJob, status: str, error: Optional[str] = None):
+            _finish(db, [job.id], status, error)
+
+        try:
+            jobs = db.query(MatchJob).filter(
+                MatchJob.batch_id == batch_id,
+                MatchJob.status.in_(ACTIVE_STATUSES)
+            ).order_by(MatchJob.jd_id).all()
+            if any(job.cancel_requested for job in jobs):
+                raise asyncio.CancelledError()
+            jd_by_id = {jd.id: jd for jd in db.query(Document).filter(
+                Document.id.in_([job.jd_id for job in jobs]),
+                Document.file_type == "jd"
+            )}
+            for job in jobs:
+                job.status = "running"
+                job.started_at = datetime.utcnow()
+            db.flush()
+            missing = [job.id for job in jobs if job.jd_id not in jd_by_id]
+            if missing:
+                _finish(db, missing, "failed", "Job Description not found")
+            jobs = [job for job in jobs if job.jd_id in jd_by_id]
+            jds = [jd_by_id[job.jd_id] for job in jobs]
+
+            cv_lists, _, _ = select_matrix(
+                db, jds, params.get("top_k"), params.get("prerank", "bm25"), params.get("same_category", True)
+            )
+            jd_texts = [None] * len(jds)
+            if params.get("use_profiles"):
+                for index, jd in enumerate(jds):
+                    jd_texts[index], cv_lists[index] = profiles.compact_texts(db, jd, cv_lists[index])
+            for job, cv_list in zip(jobs, cv_lists):
+                job.total = len(cv_list)
+                if not cv_list:
+                    finish(job, "completed")
+            db.commit()
+
+            async def record(index: int, result: Dict):
+                job = jobs[index]
+                db.add(build_match_record(result, job.jd_id, job.id))
+                job.done += 1
+                # Each JD's job completes as soon as its own CVs are scored
+                if job.done >= job.total:
+                    finish(job, "completed")
+                db.commit()
+
+            await score_matrix(db, jds, cv_lists, params["model"], params.get("force_refresh", False),
+                               on_result=record, packed=params.get("packed", False), jd_texts=jd_texts)
+
+            for job in jobs:
+                finish(job, "completed")
+            db.commit()
+        except asyncio.CancelledError:
+            db.rollback()
+            _finish(db, [job.id for job in jobs], "cancelled")
+            db.commit()
+            raise
+        except Exception as e:
+            print(f"Bulk match {batch_id} failed: {e}")
+            db.rollback()
+            _finish(db, [job.id for job in jobs], "failed", str(e)[:500])
+            db.commit()
+        finally:
+            db.close()
+
+
+def job_progress(job: MatchJob) -> Dict:
+    """Progress snapshot with a naive ETA extrapolated from the completed CVs."""
+    eta_seconds: Optional[float] = None
+    if job.status == "running" and job.started_at and job.done:
+        elapsed = (datetime.utcnow() - job.started_at).total_seconds()
+        eta_seconds = round(elapsed / job.done * (job.total - job.done), 1)
+    return {
+        "job_id": job.id,
+        "batch_id": job.batch_id,
+        "jd_id": job.jd_id,
+        "model": job.model,
+        "status": job.status,
+        "done": job.done,
+        "total": job.total,
+        "eta_seconds": eta_seconds,
+        "error": job.error,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None
+    }
+
+
+# Singleton instance
+match_job_manager = MatchJobManager()
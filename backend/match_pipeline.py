@@ -0,0 +1,414 @@
+import json
+import os
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import or_
+from sqlalchemy.orm import Session, undefer
+
+from models import Document, MatchResult
+from document_parser import document_parser
+from llm_service import llm_service, MATCH_PROMPT_VERSION, MATCH_PACK_PROMPT_VERSION
+from match_cache import match_cache, text_hash
+from ranking import lexical_ranker
+from text_index import text_index
+import match_state
+import near_duplicates
+import profiles
+
+# Cascade ranking: how many top screened CVs the strong model rescores when no top-K or threshold is given
+CASCADE_TOP_K = int(os.getenv("CASCADE_TOP_K", "10"))
+
+# Categories whose CVs are also considered for a JD in bulk matching, beyond its own (and "Other")
+COMPATIBLE_CATEGORIES = {
+    "Software Engineering": ("Artificial Intelligence / Machine Learning", "Data Science", "Cybersecurity"),
+    "Artificial Intelligence / Machine Learning": ("Data Science", "Software Engineering"),
+    "Data Science": ("Artificial Intelligence / Machine Learning", "Software Engineering"),
+    "Cybersecurity": ("Software Engineering",),
+    "Product Management": ("Software Engineering", "Design & Creative"),
+    "Design & Creative": ("Product Management",),
+}
+
+# Keep IN (...) lists well under SQLite's bound-parameter limit
+_ID_CHUNK = 500
+
+# Per-result fields describing which cascade stage produced the final score
+_CASCADE_FIELDS = ("stage", "screen_model", "screen_score", "rescore_model", "rescore_score", "rescore_error")
+
+
+def prompt_text(doc: Document) -> str:
+    """
+    The text sent to the LLM for a document: its cached section-aware digest.
+    Documents stored before digests existed get one built and saved (the caller commits).
+    """
+    if doc.digest is None:
+        doc.digest = document_parser.build_digest(doc.text_content, doc.file_type)
+    return doc.digest or doc.text_content
+
+
+def _prerank(db: Session, jd: Document, cv_ids: Optional[List[int]], prerank: str) -> Dict[int, float]:
+    """Stage-1 scores of CVs for a JD: the profile pre-score, or BM25 over the text index."""
+    prerank_scores = {}
+    if prerank == "profile":
+        prerank_scores = profiles.prescore(db, jd, cv_ids)
+        if not prerank_scores:
+            print(f"JD {jd.id} has no extracted profile; falling back to BM25 pre-ranking")
+    if not prerank_scores:
+        text_index.ensure_loaded(db)
+        prerank_scores = lexical_ranker.score(jd.text_content, text_index, file_type="cv", doc_ids=cv_ids)
+    return prerank_scores
+
+
+def _shortlist(prerank_scores: Dict[int, float], top_k: int) -> List[int]:
+    ranked = sorted(prerank_scores.items(), key=lambda item: item[1], reverse=True)
+    return [cv_id for cv_id, _ in ranked[:top_k]]
+
+
+def categories_compatible(jd_category: Optional[str], cv_category: Optional[str]) -> bool:
+    """Whether a CV's category can plausibly fit a JD's; uncategorized documents fit anything."""
+    if jd_category in (None, "Other") or cv_category in (None, "Other"):
+        return True
+    return cv_category == jd_category or cv_category in COMPATIBLE_CATEGORIES.get(jd_category, ())
+
+
+def select_cvs(db: Session, jd: Document, cv_ids: Optional[List[int]] = None, top_k: Optional[int] = None, prerank: str = "bm25") -> Tuple[List[Dict], Dict[int, float]]:
+    """
+    Load the CVs to match against a JD.
+    With `top_k`, candidates are first shortlisted by BM25 over the text index, or
+    with prerank="profile" by the deterministic score over extracted profiles.
+    Returns (cv data dicts, stage-1 scores by CV id).
+    """
+    prerank_scores = {}
+    if top_k:
+        prerank_scores = _prerank(db, jd, cv_ids, prerank)
+        shortlist = _shortlist(prerank_scores, top_k)
+        cvs = db.query(Document).options(undefer(Document.digest)).filter(
+            Document.id.in_(shortlist),
+            Document.file_type == "cv"
+        ).all()
+    elif cv_ids:
+        cvs = db.query(Document).options(undefer(Document.digest)).filter(
+            Document.id.in_(cv_ids),
+            Document.file_type == "cv"
+        ).all()
+    else:
+        # Match against all CVs
+        cvs = db.query(Document).options(undefer(Document.digest)).filter(Document.file_type == "cv").all()
+
+    cv_data = [
+        {
+            "id": cv.id,
+            "name": cv.original_name,
+            "text": prompt_text(cv)
+        }
+        for cv in cvs
+    ]
+    return cv_data, prerank_scores
+
+
+def select_jds(db: Session, jd_ids: Optional[List[int]] = None, category: Optional[str] = None, open_only: bool = False) -> List[Document]:
+    """JDs for a bulk match: the given ids and/or a category (every JD when neither is given), in id order."""
+    query = db.query(Document).filter(Document.file_type == "jd")
+    if jd_ids is not None and category:
+        query = query.filter(or_(Document.id.in_(jd_ids), Document.category == category))
+    elif jd_ids is not None:
+        query = query.filter(Document.id.in_(jd_ids))
+    elif category:
+        query = query.filter(Document.category == category)
+    if open_only:
+        query = query.filter(Document.is_open.is_(True))
+    return query.order_by(Document.id).all()
+
+
+def select_matrix(
+    db: Session,
+    jds: List[Document],
+    top_k: Optional[int] = None,
+    prerank: str = "bm25",
+    same_category: bool = True
+) -> Tuple[List[List[Dict]], List[Dict[int, float]], Dict]:
+    """
+    Build the CV x JD work matrix for bulk matching. Each JD's candidates are pruned
+    to CVs of a compatible category (with `same_category`) and then to its `top_k`
+    by pre-ranking. Shortlisted CVs are loaded once and shared between JDs.
+    Returns (CV data per JD, stage-1 scores per JD, pruning summary).
+    """
+    pool = db.query(Document.id, Document.category).filter(Document.file_type == "cv").all()
+
+    shortlists = []
+    prerank_scores = []
+    after_category = 0
+    for jd in jds:
+        candidates = [cv_id for cv_id, category in pool if not same_category or categories_compatible(jd.category, category)]
+        after_category += len(candidates)
+        scores = _prerank(db, jd, candidates if same_category else None, prerank) if top_k and candidates else {}
+        shortlists.append(_shortlist(scores, top_k) if top_k else candidates)
+        prerank_scores.append(scores)
+
+    wanted = sorted({cv_id for shortlist in shortlists for cv_id in shortlist})
+    cv_by_id = {}
+    for start in range(0, len(wanted), _ID_CHUNK):
+        for cv in db.query(Document).options(undefer(Document.digest)).filter(Document.id.in_(wanted[start:start + _ID_CHUNK])):
+            cv_by_id[cv.id] = {"id": cv.id, "name": cv.original_name, "text": prompt_text(cv)}
+
+    cv_lists = [[cv_by_id[cv_id] for cv_id in shortlist if cv_id in cv_by_id] for shortlist in shortlists]
+    return cv_lists, prerank_scores, {
+        "jds": len(jds),
+        "cvs": len(pool),
+        "pairs": len(jds) * len(pool),
+        "after_category": after_category,
+        "after_prerank": sum(len(cv_list) for cv_list in cv_lists),
+    }
+
+
+def select_delta_cvs(db: Session, jd: Document, model: str, packed: bool = False, top_k: Optional[int] = None, prerank: str = "bm25") -> Tuple[List[Dict], Dict[int, float], Dict, int]:
+    """
+    CVs a delta run must score against the JD's stored ranking for this model and
+    prompt version: those added since its last run, plus any whose stored result
+    failed. Only the new CVs go through `top_k` pre-ranking.
+    Returns (cv data dicts, stage-1 scores, delta summary, high-water mark to record).
+    """
+    last_cv_id = match_state.latest_cv_id(db)
+    state = match_state.get(db, jd.id, model, match_state.prompt_version_for(packed))
+    new_ids, retry_ids = match_state.delta_cv_ids(db, state, last_cv_id)
+
+    cv_data, prerank_scores = [], {}
+    if new_ids:
+        cv_data, prerank_scores = select_cvs(db, jd, new_ids, top_k, prerank)
+    if retry_ids:
+        retry_data, _ = select_cvs(db, jd, retry_ids)
+        cv_data += retry_data
+    return cv_data, prerank_scores, {
+        "previous_ranking": state is not None,
+        "new_cvs": len(new_ids),
+        "retried": len(retry_ids)
+    }, last_cv_id
+
+
+async def score_cvs(
+    db: Session,
+    jd: Document,
+    cv_data: List[Dict],
+    model: str,
+    force_refresh: bool = False,
+    on_result: Optional[Callable[[Dict], Awaitable[None]]] = None,
+    packed: bool = False,
+    jd_text: Optional[str] = None
+) -> List[Dict]:
+    """
+    Score CVs against a JD, serving cached (CV text, JD text, model) pairs without
+    calling the LLM. Each result carries `cv_id` and `cached`; `on_result` is awaited
+    as each one becomes available. New cache entries are added to `db`; the caller commits.
+    With `packed`, uncached CVs are scored several per LLM request. `jd_text`
+    replaces the JD's stored text in prompts (e.g. its rendered profile).
+    """
+    async def forward(_: int, result: Dict):
+        await on_result(result)
+
+    results = await score_matrix(db, [jd], [cv_data], model, force_refresh, forward if on_result else None, packed, [jd_text])
+    return results[0]
+
+
+async def score_matrix(
+    db: Session,
+    jds: List[Document],
+    cv_lists: List[List[Dict]],
+    model: str,
+    force_refresh: bool = False,
+    on_result: Optional[Callable[[int, Dict], Awaitable[None]]] = None,
+    packed: bool = False,
+    jd_texts: Optional[List[Optional[str]]] = None
+) -> List[List[Dict]]:
+    """
+    score_cvs for several JDs at once: cached pairs are served first, and every
+    uncached pair goes through one shared LLM window, queued JD by JD.
+    `on_result(jd_index, result)` is awaited as each result becomes available.
+    Returns each JD's results, best first.
+    """
+    # Packed prompts differ from single-CV prompts, so their results are cached separately
+    prompt_version = MATCH_PACK_PROMPT_VERSION if packed else MATCH_PROMPT_VERSION
+    texts = [(jd_texts[i] if jd_texts else None) or prompt_text(jd) for i, jd in enumerate(jds)]
+    jd_hashes = [text_hash(text) for text in texts]
+    cache_keys = []
+    for jd_hash, cv_data in zip(jd_hashes, cv_lists):
+        keys = {}
+        for cv in cv_data:
+            cv_hash = text_hash(cv["text"])
+            keys[cv["id"]] = (match_cache.make_key(cv_hash, jd_hash, model, prompt_version), cv_hash)
+        cache_keys.append(keys)
+
+    hits = {} if force_refresh else match_cache.get_many(
+        db, [key for keys in cache_keys for key, _ in keys.values()]
+    )
+
+    match_results: List[List[Dict]] = [[] for _ in jds]
+    pending: List[List[Dict]] = [[] for _ in jds]
+    for group, cv_data in enumerate(cv_lists):
+        for cv in cv_data:
+            key, _ = cache_keys[group][cv["id"]]
+            if key in hits:
+                result = dict(hits[key])
+                result["cv_id"] = cv["id"]
+                result["cv_name"] = cv["name"]
+                result["cached"] = True
+                if cv.get("near_duplicates"):
+                    result["near_duplicates"] = cv["near_duplicates"]
+                match_results[group].append(result)
+                if on_result:
+                    await on_result(group, result)
+            else:
+                pending[group].append(cv)
+
+    # Only JDs with uncached CVs take part in the LLM run
+    scheduled = [group for group in range(len(jds)) if pending[group]]
+
+    async def handle(index: int, cv: Dict, result: Dict):
+        group = scheduled[index]
+        result["cv_id"] = cv["id"]
+        result["cached"] = False
+        if cv.get("near_duplicates"):
+            result["near_duplicates"] = cv["near_duplicates"]
+        match_results[group].append(result)
+
+        key, cv_hash = cache_keys[group][cv["id"]]
+        # Answers from a failover model are not cached under the requested model's key
+        if result.get("match_level") != "Error" and "served_by" not in result:
+            match_cache.put(db, key, cv_hash, jd_hashes[group], model, result, prompt_version)
+        if on_result:
+            await on_result(group, result)
+
+    if scheduled:
+        await llm_service.match_matrix(
+            [(texts[group], pending[group]) for group in scheduled], model, on_result=handle, packed=packed
+        )
+
+    for results in match_results:
+        results.sort(key=lambda x: x.get("score", 0), reverse=True)
+    return match_results
+
+
+async def cascade_score_cvs(
+    db: Session,
+    jd: Document,
+    cv_data: List[Dict],
+    model: str,
+    rescore_model: str,
+    rescore_top_k: Optional[int] = None,
+    rescore_threshold: Optional[float] = None,
+    force_refresh: bool = False,
+    on_result: Optional[Callable[[Dict], Awaitable[None]]] = None,
+    packed: bool = False,
+    jd_text: Optional[str] = None
+) -> Tuple[List[Dict], Dict]:
+    """
+    Two-stage ranking. Every CV is screened by `model`; the top `rescore_top_k` and
+    any scoring at least `rescore_threshold` are rescored by `rescore_model`.
+    Results carry both scores and `stage` ("screen" or "rescore"). Rescored CVs
+    rank first by their rescore, the rest follow by screen score, since scores
+    from different models are not comparable. Returns (results, cascade summary).
+    """
+    screened = await score_cvs(db, jd, cv_data, model, force_refresh, packed=packed, jd_text=jd_text)
+    if rescore_top_k is None and rescore_threshold is None:
+        rescore_top_k = CASCADE_TOP_K
+    
+    # score_cvs returns results best first; failed screens are never promoted
+    candidates = [result for result in screened if result.get("match_level") != "Error"]
+    selected = {result["cv_id"] for result in candidates[:rescore_top_k or 0]}
+    if rescore_threshold is not None:
+        selected.update(result["cv_id"] for result in candidates if result.get("score", 0) >= rescore_threshold)
+    
+    final = []
+    screens = {}
+    for result in screened:
+        result["screen_model"] = model
+        result["screen_score"] = result.get("score", 0)
+        if result["cv_id"] in selected:
+            screens[result["cv_id"]] = result
+            continue
+        result["stage"] = "screen"
+        final.append(result)
+        if on_result:
+            await on_result(result)
+    
+    async def rescored(result: Dict):
+        screen = screens[result["cv_id"]]
+        if result.get("match_level") == "Error":
+            # Keep the screen result rather than dropping a shortlisted CV
+            result = {**screen, "stage": "screen", "rescore_model": rescore_model, "rescore_error": result.get("summary", "")}
+        else:
+            result.update(stage="rescore", screen_model=model, screen_score=screen["screen_score"],
+                          rescore_model=rescore_model, rescore_score=result.get("score", 0))
+        final.append(result)
+        if on_result:
+            await on_result(result)
+    
+    if selected:
+        await score_cvs(db, jd, [cv for cv in cv_data if cv["id"] in selected], rescore_model,
+                        force_refresh, on_result=rescored, packed=packed, jd_text=jd_text)
+    
+    final.sort(key=lambda result: (result["stage"] == "rescore", result.get("score", 0)), reverse=True)
+    return final, {
+        "screen_model": model,
+        "rescore_model": rescore_model,
+        "screened": len(screened),
+        "rescored": sum(1 for result in final if result["stage"] == "rescore"),
+        "ranking": "rescore" if selected else "screen"
+    }
+
+
+def collapse_near_duplicates(db: Session, cv_data: List[Dict], threshold: Optional[float] = None) -> Tuple[List[Dict], Optional[Dict]]:
+    """Score one representative per near-duplicate cluster; returns (representatives, summary)."""
+    representatives, collapsed = near_duplicates.collapse(db, cv_data, threshold)
+    return representatives, {
+        "clusters": sum(1 for cv in representatives if cv.get("near_duplicates")),
+        "collapsed": collapsed
+    }
+
+
+def build_match_record(result: Dict, jd_id: int, job_id: Optional[str] = None) -> MatchResult:
+    """MatchResult row for a scored CV."""
+    details = {k: v for k, v in result.items() if k != "cached"}
+    return MatchResult(
+        cv_id=result["cv_id"],
+        jd_id=jd_id,
+        score=result.get("score", 0),
+        explanation=result.get("summary", ""),
+        details_json=json.dumps(details),
+        job_id=job_id
+    )
+
+
+def result_summary(result: Dict, prerank_scores: Optional[Dict[int, float]] = None) -> Dict:
+    """API representation of one scored CV."""
+    cv_id = result["cv_id"]
+    summary = {
+        "cv_id": cv_id,
+        "cv_name": result["cv_name"],
+        "score": result.get("score", 0),
+        "match_level": result.get("match_level", "Unknown"),
+        "key_matches": result.get("key_matches", []),
+        "gaps": result.get("gaps", []),
+        "summary": result.get("summary", ""),
+        "cached": result.get("cached", False),
+        "prerank_score": (prerank_scores or {}).get(cv_id),
+        "near_duplicates": result.get("near_duplicates", [])
+    }
+    for field in _CASCADE_FIELDS:
+        if field in result:
+            summary[field] = result[field]
+    if "served_by" in result:
+        summary["served_by"] = result["served_by"]
+    return summary
+
+
+def prerank_summary(prerank_scores: Dict[int, float], shortlisted: int) -> Optional[Dict]:
+    """Stage-1 scores for every candidate, so shortlist recall can be checked."""
+    if not prerank_scores:
+        return None
+    return {
+        "candidates": len(prerank_scores),
+        "shortlisted": shortlisted,
+        "scores": [
+            {"cv_id": cv_id, "score": round(score, 4)}
+            for cv_id, score in sorted(prerank_scores.items(), key=lambda item: item[1], reverse=True)
+        ]
+    }
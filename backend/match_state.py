@@ -0,0 +1,155 @@
+import asyncio
+import json
+import os
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import func, or_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from models import Document, MatchState, MatchStateResult
+from llm_service import MATCH_PROMPT_VERSION, MATCH_PACK_PROMPT_VERSION
+
+# Queue a delta match for every stored ranking of an open JD whenever CVs are uploaded
+AUTO_DELTA_MATCH = os.getenv("AUTO_DELTA_MATCH", "true").lower() in ("1", "true", "yes")
+
+# Per-CV fields that are not stored with a ranked result
+_IDENTITY_FIELDS = ("cv_id", "cv_name", "cached")
+# Request settings remembered with a ranking and reused by automatic delta runs
+_CARRIED_SETTINGS = ("model", "top_k", "prerank", "use_profiles", "collapse_near_duplicates", "near_duplicate_threshold", "packed")
+
+# Delta runs of the same ranking are serialized within a process, so each one only scores what the previous one did not
+_locks: Dict[Tuple[int, str, str], asyncio.Lock] = {}
+
+
+def prompt_version_for(packed: bool) -> str:
+    return MATCH_PACK_PROMPT_VERSION if packed else MATCH_PROMPT_VERSION
+
+
+def lock(jd_id: int, model: str, prompt_version: str) -> asyncio.Lock:
+    key = (jd_id, model, prompt_version)
+    if key not in _locks:
+        _locks[key] = asyncio.Lock()
+    return _locks[key]
+
+
+def get(db: Session, jd_id: int, model: str, prompt_version: str) -> Optional[MatchState]:
+    return db.query(MatchState).filter(
+        MatchState.jd_id == jd_id,
+        MatchState.model == model,
+        MatchState.prompt_version == prompt_version
+    ).first()
+
+
+def latest_cv_id(db: Session) -> int:
+    return db.query(func.max(Document.id)).filter(Document.file_type == "cv").scalar() or 0
+
+
+def delta_cv_ids(db: Session, state: Optional[MatchState], upto: int) -> Tuple[List[int], List[int]]:
+    """
+    (CVs added since the ranking was last updated, CVs whose stored result failed).
+    Without a stored ranking every CV up to `upto` is new.
+    """
+    after = state.last_cv_id if state is not None else 0
+    new_ids = [cv_id for (cv_id,) in db.query(Document.id).filter(
+        Document.file_type == "cv",
+        Document.id > after,
+        Document.id <= upto
+    ).order_by(Document.id)]
+    retry_ids = []
+    if state is not None:
+        retry_ids = [cv_id for (cv_id,) in db.query(MatchStateResult.cv_id).join(
+            Document, Document.id == MatchStateResult.cv_id
+        ).filter(
+            MatchStateResult.state_id == state.id,
+            MatchStateResult.failed.is_(True)
+        )]
+    return new_ids, retry_ids
+
+
+def record(db: Session, jd_id: int, params: Dict, results: List[Dict], last_cv_id: int) -> MatchState:
+    """
+    Merge scored results into the JD's stored ranking for the run's model and prompt
+    version, and advance its high-water mark to `last_cv_id`. A failed result never
+    replaces a stored successful one. The caller commits.
+    """
+    model = params["model"]
+    prompt_version = prompt_version_for(params.get("packed", False))
+    db.execute(sqlite_insert(MatchState).values(
+        jd_id=jd_id, model=model, prompt_version=prompt_version, last_cv_id=0
+    ).on_conflict_do_nothing(index_elements=["jd_id", "model", "prompt_version"]))
+    state = get(db, jd_id, model, prompt_version)
+    state.last_cv_id = max(state.last_cv_id or 0, last_cv_id)
+    state.request_json = json.dumps({key: params.get(key) for key in _CARRIED_SETTINGS})
+    state.updated_at = datetime.utcnow()
+
+    rows = [
+        {
+            "state_id": state.id,
+            "cv_id": result["cv_id"],
+            "score": result.get("score", 0),
+            "failed": result.get("match_level") == "Error",
+            "result_json": json.dumps({k: v for k, v in result.items() if k not in _IDENTITY_FIELDS})
+        }
+        for result in results
+    ]
+    if rows:
+        stmt = sqlite_insert(MatchStateResult)
+        db.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[MatchStateResult.state_id, MatchStateResult.cv_id],
+                set_={"score": stmt.excluded.score, "failed": stmt.excluded.failed, "result_json": stmt.excluded.result_json},
+                where=or_(stmt.excluded.failed.is_(False), MatchStateResult.failed.is_(True))
+            ),
+            rows
+        )
+    return state
+
+
+def ranked_count(db: Session, state: MatchState) -> int:
+    return db.query(func.count(MatchStateResult.cv_id)).join(
+        Document, Document.id == MatchStateResult.cv_id
+    ).filter(MatchStateResult.state_id == state.id).scalar()
+
+
+def ranking(db: Session, state: MatchState, top_n: Optional[int] = None) -> List[Dict]:
+    """Stored results best first (served by the state_id/score index); CVs deleted since are left out."""
+    query = db.query(MatchStateResult.cv_id, MatchStateResult.result_json, Document.original_name).join(
+        Document, Document.id == MatchStateResult.cv_id
+    ).filter(MatchStateResult.state_id == state.id).order_by(MatchStateResult.score.desc(), MatchStateResult.cv_id)
+    if top_n:
+        query = query.limit(top_n)
+
+    results = []
+    for cv_id, result_json, name in query:
+        result = json.loads(result_json)
+        result["cv_id"] = cv_id
+        result["cv_name"] = name
+        result["cached"] = True  # Not scored by the current request
+        results.append(result)
+    return results
+
+
+def open_states(db: Session) -> List[MatchState]:
+    """Stored rankings of every JD marked open."""
+    return db.query(MatchState).join(Document, Document.id == MatchState.jd_id).filter(
+        Document.file_type == "jd",
+        Document.is_open.is_(True)
+    ).all()
+
+
+def delta_params(state: MatchState) -> Dict:
+    """MatchRequest settings for an automatic delta run of a stored ranking."""
+    return {**json.loads(state.request_json or "{}"), "model": state.model, "jd_id": state.jd_id, "delta": True}
+
+
+def forget(db: Session, document_ids: Iterable[int]):
+    """Drop stored rankings of deleted JDs and ranked results of deleted CVs; the caller commits."""
+    document_ids = list(document_ids)
+    state_ids = [state_id for (state_id,) in db.query(MatchState.id).filter(MatchState.jd_id.in_(document_ids))]
+    db.query(MatchStateResult).filter(or_(
+        MatchStateResult.cv_id.in_(document_ids),
+        MatchStateResult.state_id.in_(state_ids)
+    )).delete(synchronize_session=False)
+    db.query(MatchState).filter(MatchState.id.in_(state_ids)).delete(synchronize_session=False)
@@ -1,6 +1,6 @@
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Float, Text
+from sqlalchemy import create_engine, Column, Integer, String, DateTime, Float, Text, LargeBinary, Index, Boolean
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import sessionmaker, deferred
 from datetime import datetime
 
 Base = declarative_base()
@@ -13,10 +13,24 @@ class Document(Base):
     original_name = Column(String)
     file_type = Column(String)  # 'cv' or 'jd'
     category = Column(String, index=True)  # Software, AI, Security, Sales, etc.
+    category_source = Column(String)  # 'llm' or 'local' (fast-path categorizer); NULL for older rows (LLM)
     upload_date = Column(DateTime, default=datetime.utcnow)
     file_path = Column(String)
     file_size = Column(Integer)
-    text_content = Column(Text)  # Extracted text for matching
+    text_content = deferred(Column(Text))  # Extracted text for matching; loaded only when accessed
+    content_hash = Column(String)  # SHA-256 of the uploaded bytes
+    text_hash = Column(String, index=True)  # SHA-256 of the normalized extracted text
+    minhash = deferred(Column(LargeBinary))  # MinHash signature for near-duplicate detection
+    digest = deferred(Column(Text))  # Section-aware compaction of text_content, sent to the LLM
+    is_open = Column(Boolean, default=False)  # JDs only: new CVs are delta-matched against it on upload
+    profile_attempts = Column(Integer, default=0)  # Failed profile backfill attempts; NULL for older rows (none)
+    
+    __table_args__ = (
+        Index("ix_documents_category_file_type", "category", "file_type"),
+        Index("ux_documents_file_type_content_hash", "file_type", "content_hash", unique=True),
+        Index("ix_documents_upload_date_id", "upload_date", "id"),
+        Index("ix_documents_file_type_upload_date_id", "file_type", "upload_date", "id"),
+    )
 
 class MatchResult(Base):
     __tablename__ = "match_results"
@@ -28,3 +42,121 @@ class MatchResult(Base):
     explanation = Column(Text)
     match_date = Column(DateTime, default=datetime.utcnow)
     details_json = Column(Text)  # JSON string with detailed breakdown
+    job_id = Column(String, index=True)  # Set when produced by an asynchronous match job
+    
+    __table_args__ = (
+        Index("ix_match_results_match_date_id", "match_date", "id"),
+        Index("ix_match_results_jd_id_match_date", "jd_id", "match_date"),
+        Index("ix_match_results_cv_id_match_date", "cv_id", "match_date"),
+        Index("ix_match_results_jd_id_score", "jd_id", "score"),
+    )
+
+class MatchCacheEntry(Base):
+    __tablename__ = "match_cache"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    cache_key = Column(String, unique=True, index=True)  # sha256 of (cv_hash, jd_hash, model, prompt_version)
+    cv_hash = Column(String, index=True)
+    jd_hash = Column(String, index=True)
+    model = Column(String)
+    prompt_version = Column(String)
+    result_json = Column(Text)  # LLM match result without per-CV identifiers
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class IndexPosting(Base):
+    __tablename__ = "index_postings"
+    
+    term = Column(String, primary_key=True)
+    postings = Column(LargeBinary)  # array('I') of interleaved (doc_id, term_frequency) pairs
+
+class IndexedDocument(Base):
+    __tablename__ = "index_documents"
+    
+    doc_id = Column(Integer, primary_key=True)
+    file_type = Column(String, index=True)  # 'cv' or 'jd'
+    length = Column(Integer)  # Token count, used for BM25 length normalisation
+
+class MatchJob(Base):
+    __tablename__ = "match_jobs"
+    
+    id = Column(String, primary_key=True)  # uuid4 hex
+    jd_id = Column(Integer, index=True)
+    model = Column(String)
+    status = Column(String, index=True)  # queued, running, completed, failed, cancelled
+    total = Column(Integer, default=0)
+    done = Column(Integer, default=0)
+    error = Column(Text)
+    request_json = Column(Text)  # The submitted MatchRequest
+    batch_id = Column(String, index=True)  # Shared by the per-JD jobs of one bulk match
+    owner = Column(String)  # "host:pid" of the server process running the job
+    heartbeat_at = Column(DateTime)  # Refreshed by the owner while the job is active
+    cancel_requested = Column(Boolean, default=False)  # Set by any worker; the owner stops the job
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
+
+class CategoryCount(Base):
+    __tablename__ = "category_counts"
+    
+    category = Column(String, primary_key=True)
+    file_type = Column(String, primary_key=True)  # 'cv' or 'jd'
+    count = Column(Integer, default=0)
+
+class DocumentProfile(Base):
+    __tablename__ = "document_profiles"
+    
+    document_id = Column(Integer, primary_key=True)
+    file_type = Column(String, index=True)  # 'cv' or 'jd'
+    titles_json = Column(Text)  # JSON list of job titles held (CV) or offered (JD)
+    years_experience = Column(Float)  # Total years (CV) or years required (JD)
+    education_json = Column(Text)  # JSON list of degrees / qualifications
+    certifications_json = Column(Text)  # JSON list of certifications
+    model = Column(String)  # Model that extracted the profile
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class ProfileSkill(Base):
+    __tablename__ = "profile_skills"
+    
+    document_id = Column(Integer, primary_key=True)
+    skill = Column(String, primary_key=True)  # Normalized (lowercase, single-spaced)
+    file_type = Column(String)  # 'cv' or 'jd'
+    
+    __table_args__ = (
+        Index("ix_profile_skills_skill_file_type", "skill", "file_type"),
+    )
+
+class CategorizerModel(Base):
+    __tablename__ = "categorizer_models"
+    
+    id = Column(Integer, primary_key=True)
+    trained_at = Column(DateTime, default=datetime.utcnow, index=True)
+    documents = Column(Integer)  # Training documents
+    model_json = Column(Text)  # Per-category document counts and term counts
+
+class MatchState(Base):
+    __tablename__ = "match_states"
+    
+    id = Column(Integer, primary_key=True)
+    jd_id = Column(Integer, index=True)
+    model = Column(String)
+    prompt_version = Column(String)
+    last_cv_id = Column(Integer)  # Highest CV id considered by the runs so far; later CVs are the delta
+    request_json = Column(Text)  # Settings of the last run, reused by automatic delta runs
+    updated_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        Index("ux_match_states_jd_id_model_prompt_version", "jd_id", "model", "prompt_version", unique=True),
+    )
+
+class MatchStateResult(Base):
+    __tablename__ = "match_state_results"
+    
+    state_id = Column(Integer, primary_key=True)
+    cv_id = Column(Integer, primary_key=True)
+    score = Column(Float)
+    failed = Column(Boolean, default=False)  # The LLM call failed; retried by the next delta run
+    result_json = Column(Text)  # Match result without per-CV identifiers
+    
+    __table_args__ = (
+        Index("ix_match_state_results_state_id_score", "state_id", "score"),
+    )
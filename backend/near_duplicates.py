@@ -0,0 +1,195 @@
+import hashlib
+import os
+import random
+import re
+from array import array
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from models import Document
+from document_parser import document_parser
+
+# MinHash signature length; changing it invalidates stored signatures (they are recomputed)
+MINHASH_PERMUTATIONS = int(os.getenv("MINHASH_PERMUTATIONS", "128"))
+# Words per shingle
+MINHASH_SHINGLE_SIZE = int(os.getenv("MINHASH_SHINGLE_SIZE", "3"))
+# Estimated Jaccard similarity above which two CVs count as versions of the same CV
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv("NEAR_DUPLICATE_THRESHOLD", "0.8"))
+
+_PRIME = (1 << 61) - 1
+_MAX_HASH = 0xFFFFFFFF
+_WORD_RE = re.compile(r"\w+")
+
+# Fixed seed: every process must derive the same permutations for signatures to be comparable
+_rng = random.Random(0x5EED)
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(MINHASH_PERMUTATIONS)]
+
+# Keep IN (...) lists well under SQLite's bound-parameter limit
+_ID_CHUNK = 500
+
+
+def _shingle_hashes(text: Optional[str]) -> set:
+    words = _WORD_RE.findall((text or "").lower())
+    size = min(MINHASH_SHINGLE_SIZE, len(words))
+    return {
+        int.from_bytes(hashlib.blake2b(" ".join(words[i:i + size]).encode("utf-8"), digest_size=4).digest(), "little")
+        for i in range(len(words) - size + 1)
+    } if words else set()
+
+
+def minhash_signature(text: Optional[str]) -> bytes:
+    """MinHash signature of a text's word shingles, as packed 32-bit integers."""
+    hashes = _shingle_hashes(text)
+    if not hashes:
+        return array("I", [_MAX_HASH] * MINHASH_PERMUTATIONS).tobytes()
+    return array("I", (
+        min(((a * h + b) % _PRIME) & _MAX_HASH for h in hashes)
+        for a, b in _PERMUTATIONS
+    )).tobytes()
+
+
+async def signature_async(text: Optional[str]) -> bytes:
+    """Compute a signature in the parser's process pool, off the event loop."""
+    return await document_parser.run(minhash_signature, text)
+
+
+def _decode(blob: Optional[bytes]) -> Optional[array]:
+    if not blob:
+        return None
+    signature = array("I")
+    signature.frombytes(blob)
+    return signature if len(signature) == MINHASH_PERMUTATIONS else None
+
+
+def similarity(a: array, b: array) -> float:
+    """Estimated Jaccard similarity of two signatures."""
+    return sum(1 for x, y in zip(a, b) if x == y) / len(a)
+
+
+def _lsh_params(num_perm: int, threshold: float) -> Tuple[int, int]:
+    """(bands, rows) whose S-curve midpoint (1/b)^(1/r) is closest to the threshold."""
+    best = (num_perm, 1)
+    best_error = float("inf")
+    for rows in range(1, num_perm + 1):
+        bands = num_perm // rows
+        error = abs((1 / bands) ** (1 / rows) - threshold)
+        if error < best_error:
+            best, best_error = (bands, rows), error
+    return best
+
+
+class LSHIndex:
+    """
+    Banded locality-sensitive hashing over MinHash signatures.
+    Documents sharing any band bucket are candidate pairs; candidates are then
+    verified against the threshold on the full signature.
+    """
+
+    def __init__(self, threshold: float = NEAR_DUPLICATE_THRESHOLD):
+        self.threshold = threshold
+        self.bands, self.rows = _lsh_params(MINHASH_PERMUTATIONS, threshold)
+        self.signatures: Dict[int, array] = {}
+        self.buckets: Dict[Tuple[int, bytes], List[int]] = defaultdict(list)
+
+    def add(self, doc_id: int, signature: array):
+        self.signatures[doc_id] = signature
+        for band in range(self.bands):
+            start = band * self.rows
+            self.buckets[(band, signature[start:start + self.rows].tobytes())].append(doc_id)
+
+    def clusters(self) -> List[Dict]:
+        """Connected groups of near-duplicates: [{"members": [ids ascending], "similarity": {id: score to newest}}]."""
+        parent = {doc_id: doc_id for doc_id in self.signatures}
+
+        def find(doc_id: int) -> int:
+            while parent[doc_id] != doc_id:
+                parent[doc_id] = parent[parent[doc_id]]
+                doc_id = parent[doc_id]
+            return doc_id
+
+        checked = set()
+        for members in self.buckets.values():
+            for i, first in enumerate(members):
+                for second in members[i + 1:]:
+                    pair = (first, second) if first < second else (second, first)
+                    if pair in checked:
+                        continue
+                    checked.add(pair)
+                    if similarity(self.signatures[first], self.signatures[second]) >= self.threshold:
+                        parent[find(first)] = find(second)
+
+        groups: Dict[int, List[int]] = defaultdict(list)
+        for doc_id in self.signatures:
+            groups[find(doc_id)].append(doc_id)
+
+        clusters = []
+        for members in groups.values():
+            if len(members) < 2:
+                continue
+            members.sort()
+            newest = self.signatures[members[-1]]
+            clusters.append({
+                "members": members,
+                "similarity": {doc_id: round(similarity(self.signatures[doc_id], newest), 3) for doc_id in members},
+            })
+        return clusters
+
+
+def load_signatures(db: Session, doc_ids: Iterable[int]) -> Dict[int, array]:
+    """
+    Stored signatures for the given documents. Missing or stale ones are computed from
+    the stored full text, as at upload, and written back; the caller commits.
+    """
+    doc_ids = list(doc_ids)
+    signatures = {}
+    for start in range(0, len(doc_ids), _ID_CHUNK):
+        chunk = doc_ids[start:start + _ID_CHUNK]
+        for doc_id, blob in db.query(Document.id, Document.minhash).filter(Document.id.in_(chunk)):
+            signature = _decode(blob)
+            if signature is not None:
+                signatures[doc_id] = signature
+
+    missing = [doc_id for doc_id in doc_ids if doc_id not in signatures]
+    texts = {}
+    for start in range(0, len(missing), _ID_CHUNK):
+        chunk = missing[start:start + _ID_CHUNK]
+        texts.update(db.query(Document.id, Document.text_content).filter(Document.id.in_(chunk)).all())
+
+    for doc_id in missing:
+        if doc_id not in texts:
+            continue
+        blob = minhash_signature(texts[doc_id])
+        db.query(Document).filter(Document.id == doc_id).update({Document.minhash: blob}, synchronize_session=False)
+        signatures[doc_id] = _decode(blob)
+    return signatures
+
+
+def find_clusters(db: Session, doc_ids: Iterable[int], threshold: float = NEAR_DUPLICATE_THRESHOLD) -> List[Dict]:
+    """Near-duplicate clusters among the given documents."""
+    index = LSHIndex(threshold)
+    for doc_id, signature in load_signatures(db, doc_ids).items():
+        index.add(doc_id, signature)
+    return index.clusters()
+
+
+def collapse(db: Session, cv_data: List[Dict], threshold: Optional[float] = None) -> Tuple[List[Dict], int]:
+    """
+    Keep one representative (the most recently uploaded) per near-duplicate cluster.
+    Each representative carries `near_duplicates`: the other members with their
+    similarity to it. Returns (representatives, number of CVs collapsed away).
+    """
+    by_id = {cv["id"]: cv for cv in cv_data}
+    # Signatures come from the stored full text; cv["text"] is the prompt digest
+    clusters = find_clusters(db, list(by_id), threshold or NEAR_DUPLICATE_THRESHOLD)
+
+    dropped = set()
+    for cluster in clusters:
+        representative = by_id[cluster["members"][-1]]
+        representative["near_duplicates"] = [
+            {"cv_id": doc_id, "cv_name": by_id[doc_id]["name"], "similarity": cluster["similarity"][doc_id]}
+            for doc_id in cluster["members"][:-1]
+        ]
+        dropped.update(cluster["members"][:-1])
+    return [cv for cv in cv_data if cv["id"] not in dropped], len(dropped)
@@ -0,0 +1,18 @@
+import base64
+from datetime import datetime
+from typing import Tuple
+
+from fastapi import HTTPException
+
+
+def encode_cursor(timestamp: datetime, row_id: int) -> str:
+    """Opaque keyset cursor for (timestamp, id) ordering."""
+    return base64.urlsafe_b64encode(f"{timestamp.isoformat()}|{row_id}".encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        timestamp, row_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(timestamp), int(row_id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
@@ -0,0 +1,236 @@
+import asyncio
+import json
+import os
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from models import Document, DocumentProfile, ProfileSkill
+from llm_service import llm_service
+
+# Structured profiles are extracted once at upload and reused by every match
+EXTRACT_PROFILES = os.getenv("EXTRACT_PROFILES", "true").lower() in ("1", "true", "yes")
+PROFILE_MODEL = os.getenv("PROFILE_MODEL", "gpt-4o-mini")
+# Documents whose extraction failed this many times are left out of the backfill
+PROFILE_MAX_ATTEMPTS = int(os.getenv("PROFILE_MAX_ATTEMPTS", "3"))
+
+# Weights of the deterministic profile pre-score (0-100)
+PRESCORE_SKILL_WEIGHT = 0.8
+PRESCORE_YEARS_WEIGHT = 0.2
+
+_MAX_ITEMS = 100
+_MAX_ITEM_LENGTH = 120
+# Keep IN (...) lists well under SQLite's bound-parameter limit
+_ID_CHUNK = 500
+
+
+def _clean_list(value, lower: bool = False) -> List[str]:
+    if not isinstance(value, list):
+        return []
+    items = []
+    seen = set()
+    for item in value:
+        if not isinstance(item, (str, int, float)) or isinstance(item, bool):
+            continue
+        text = " ".join(str(item).split())[:_MAX_ITEM_LENGTH]
+        if lower:
+            text = text.lower()
+        if text and text.lower() not in seen:
+            seen.add(text.lower())
+            items.append(text)
+        if len(items) >= _MAX_ITEMS:
+            break
+    return items
+
+
+def normalize_profile(data: Optional[Dict]) -> Optional[Dict]:
+    """Coerce an LLM extraction into {skills, titles, years_experience, education, certifications}."""
+    if not isinstance(data, dict):
+        return None
+    years = data.get("years_experience")
+    try:
+        years = max(0.0, min(60.0, float(years))) if years is not None and not isinstance(years, bool) else None
+    except (TypeError, ValueError):
+        years = None
+    return {
+        "skills": _clean_list(data.get("skills"), lower=True),
+        "titles": _clean_list(data.get("titles")),
+        "years_experience": years,
+        "education": _clean_list(data.get("education")),
+        "certifications": _clean_list(data.get("certifications")),
+    }
+
+
+async def extract(text: str, doc_type: str) -> Optional[Dict]:
+    """Run the LLM extraction for a new upload; None when disabled or on failure."""
+    if not EXTRACT_PROFILES:
+        return None
+    return normalize_profile(await llm_service.extract_profile(text, doc_type, PROFILE_MODEL))
+
+
+def save(db: Session, document_id: int, file_type: str, profile: Optional[Dict]):
+    """Store (or replace) a document's profile and its skill index rows; the caller commits."""
+    if profile is None:
+        return
+    delete(db, document_id)
+    db.add(DocumentProfile(
+        document_id=document_id,
+        file_type=file_type,
+        titles_json=json.dumps(profile["titles"]),
+        years_experience=profile["years_experience"],
+        education_json=json.dumps(profile["education"]),
+        certifications_json=json.dumps(profile["certifications"]),
+        model=PROFILE_MODEL
+    ))
+    db.add_all(ProfileSkill(document_id=document_id, skill=skill, file_type=file_type) for skill in profile["skills"])
+
+
+def delete(db: Session, document_id: int):
+    db.query(ProfileSkill).filter(ProfileSkill.document_id == document_id).delete(synchronize_session=False)
+    db.query(DocumentProfile).filter(DocumentProfile.document_id == document_id).delete(synchronize_session=False)
+
+
+def load(db: Session, document_ids: Iterable[int]) -> Dict[int, Dict]:
+    """Profiles by document id; documents without one are absent."""
+    document_ids = list(document_ids)
+    result = {}
+    for start in range(0, len(document_ids), _ID_CHUNK):
+        chunk = document_ids[start:start + _ID_CHUNK]
+        for row in db.query(DocumentProfile).filter(DocumentProfile.document_id.in_(chunk)):
+            result[row.document_id] = {
+                "skills": [],
+                "titles": json.loads(row.titles_json or "[]"),
+                "years_experience": row.years_experience,
+                "education": json.loads(row.education_json or "[]"),
+                "certifications": json.loads(row.certifications_json or "[]"),
+            }
+        for document_id, skill in db.query(ProfileSkill.document_id, ProfileSkill.skill).filter(
+            ProfileSkill.document_id.in_(chunk)
+        ).order_by(ProfileSkill.document_id, ProfileSkill.skill):
+            if document_id in result:
+                result[document_id]["skills"].append(skill)
+    return result
+
+
+def render(profile: Dict) -> str:
+    """Compact text form of a profile, sent to the LLM instead of the raw document."""
+    years = profile["years_experience"]
+    lines = [
+        f"Titles: {', '.join(profile['titles']) or 'Not stated'}",
+        f"Years of experience: {years:g}" if years is not None else "Years of experience: Not stated",
+        f"Skills: {', '.join(profile['skills']) or 'Not stated'}",
+        f"Education: {'; '.join(profile['education']) or 'Not stated'}",
+        f"Certifications: {'; '.join(profile['certifications']) or 'None'}",
+    ]
+    return "\n".join(lines)
+
+
+def compact_texts(db: Session, jd: Document, cv_data: List[Dict]) -> Tuple[Optional[str], List[Dict]]:
+    """
+    Swap prompt text for rendered profiles wherever a document has one.
+    Returns (JD text, CV data); CVs without a profile keep their prompt text, and a JD
+    without one gets None so scoring falls back to its digest (match_pipeline.prompt_text).
+    """
+    found = load(db, [jd.id] + [cv["id"] for cv in cv_data])
+    jd_text = render(found[jd.id]) if jd.id in found else None
+    return jd_text, [
+        {**cv, "text": render(found[cv["id"]])} if cv["id"] in found else cv
+        for cv in cv_data
+    ]
+
+
+def prescore(db: Session, jd: Document, cv_ids: Optional[List[int]] = None) -> Dict[int, float]:
+    """
+    Deterministic 0-100 score of CVs against a JD from their profiles: the share of the
+    JD's skills a CV lists, plus whether it meets the required years. CVs without a
+    profile score 0; an empty dict means the JD has no profile.
+    """
+    jd_profile = load(db, [jd.id]).get(jd.id)
+    if jd_profile is None:
+        return {}
+
+    profile_query = db.query(DocumentProfile.document_id, DocumentProfile.years_experience).filter(
+        DocumentProfile.file_type == "cv"
+    )
+    if cv_ids is not None:
+        profile_query = profile_query.filter(DocumentProfile.document_id.in_(cv_ids))
+    years = dict(profile_query.all())
+
+    overlap = {}
+    if jd_profile["skills"]:
+        # Served by the (skill, file_type) index
+        skill_query = db.query(ProfileSkill.document_id, func.count()).filter(
+            ProfileSkill.skill.in_(jd_profile["skills"]),
+            ProfileSkill.file_type == "cv"
+        )
+        if cv_ids is not None:
+            skill_query = skill_query.filter(ProfileSkill.document_id.in_(cv_ids))
+        overlap = dict(skill_query.group_by(ProfileSkill.document_id).all())
+
+    required = jd_profile["years_experience"]
+    scores = {cv_id: 0.0 for cv_id in (cv_ids if cv_ids is not None else [])}
+    for cv_id, cv_years in years.items():
+        skill_share = overlap.get(cv_id, 0) / len(jd_profile["skills"]) if jd_profile["skills"] else 0.0
+        if not required:
+            years_share = 1.0
+        elif cv_years is None:
+            years_share = 0.5
+        else:
+            years_share = min(1.0, cv_years / required)
+        scores[cv_id] = round(100 * (PRESCORE_SKILL_WEIGHT * skill_share + PRESCORE_YEARS_WEIGHT * years_share), 2)
+    return scores
+
+
+def _missing_profiles(db: Session, *columns):
+    """Documents without a profile that have not used up their extraction attempts."""
+    return db.query(*columns).outerjoin(
+        DocumentProfile, DocumentProfile.document_id == Document.id
+    ).filter(
+        DocumentProfile.document_id.is_(None),
+        func.coalesce(Document.profile_attempts, 0) < PROFILE_MAX_ATTEMPTS
+    )
+
+
+async def backfill(db: Session, limit: int) -> Dict:
+    """
+    Extract profiles for up to `limit` documents that have none; commits.
+    Failures are counted per document and the least-tried documents go first, so
+    ones that keep failing neither block the rest nor get retried forever.
+    """
+    attempts = func.coalesce(Document.profile_attempts, 0)
+    rows = _missing_profiles(db, Document.id, Document.file_type, Document.text_content).order_by(
+        attempts, Document.id
+    ).limit(limit).all()
+
+    extracted = [
+        normalize_profile(data)
+        for data in await asyncio.gather(
+            *(llm_service.extract_profile(row.text_content or "", row.file_type, PROFILE_MODEL) for row in rows)
+        )
+    ]
+    stored = 0
+    failed_ids = []
+    for row, profile in zip(rows, extracted):
+        if profile is not None:
+            save(db, row.id, row.file_type, profile)
+            stored += 1
+        else:
+            failed_ids.append(row.id)
+    for start in range(0, len(failed_ids), _ID_CHUNK):
+        db.query(Document).filter(Document.id.in_(failed_ids[start:start + _ID_CHUNK])).update(
+            {Document.profile_attempts: attempts + 1}, synchronize_session=False
+        )
+    db.commit()
+
+    remaining = _missing_profiles(db, func.count(Document.id)).scalar()
+    abandoned = db.query(func.count(Document.id)).outerjoin(
+        DocumentProfile, DocumentProfile.document_id == Document.id
+    ).filter(DocumentProfile.document_id.is_(None), Document.profile_attempts >= PROFILE_MAX_ATTEMPTS).scalar()
+    return {
+        "processed": len(rows),
+        "extracted": stored,
+        "failed": len(failed_ids),
+        "remaining": remaining,
+        "abandoned": abandoned,
+    }
@@ -0,0 +1,81 @@
+import math
+import re
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# Terms too common in CVs/JDs to carry any ranking signal
+STOPWORDS = frozenset("""
+a an and are as at be by for from has have in is it its of on or that the this to was were will with
+you your we our us they their he she his her i me my not but if then than so such can may must should
+would could do does did into over under about per via etc also all any each other more most
+""".split())
+
+_TOKEN_RE = re.compile(r"[a-z0-9][a-z0-9+#.]*[a-z0-9+#]|[a-z0-9]")
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """Lowercase word tokens, keeping tech terms such as c++, c# and node.js intact."""
+    if not text:
+        return []
+    return [t for t in _TOKEN_RE.findall(text.lower()) if (len(t) > 1 or t in ("c", "r")) and t not in STOPWORDS]
+
+
+class LexicalRanker:
+    """
+    BM25 ranker used to shortlist CVs before LLM scoring.
+    Each query term's posting list is scored in one array operation against the
+    index's precomputed corpus statistics, so IDF does not depend on which
+    candidates are asked for.
+    """
+    
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+    
+    def score(self, query_text: str, index, file_type: Optional[str] = None, doc_ids: Optional[Iterable[int]] = None) -> Dict[int, float]:
+        """
+        Score candidate documents against the query; returns doc id -> BM25 score.
+        Candidates default to every indexed document of `file_type`; requested ids
+        missing from the index score 0.
+        """
+        if doc_ids is None:
+            candidates = index.doc_ids(file_type)
+        else:
+            candidates = [
+                doc_id for doc_id in doc_ids
+                if file_type is None or index.doc_types.get(doc_id, file_type) == file_type
+            ]
+        if not candidates:
+            return {}
+        
+        n_docs, avg_len = index.corpus_stats(file_type)
+        lengths = index.length_array()
+        scores = np.zeros(len(lengths))
+        for term, query_freq in Counter(tokenize(query_text)).items():
+            pairs = index.posting_pairs(term)
+            doc_freq = index.doc_frequency(term, file_type)
+            if pairs is None or not doc_freq:
+                continue
+            idf = math.log(1 + (n_docs - doc_freq + 0.5) / (doc_freq + 0.5))
+            ids = pairs[:, 0]
+            freqs = pairs[:, 1].astype(np.float64)
+            norm = self.k1 * (1 - self.b + self.b * lengths[ids] / avg_len)
+            # Doc ids are unique within a posting list, so fancy-index += is safe
+            scores[ids] += query_freq * idf * freqs * (self.k1 + 1) / (freqs + norm)
+        
+        ids = np.asarray(candidates, dtype=np.int64)
+        known = (ids >= 0) & (ids < len(scores))
+        values = np.zeros(len(ids))
+        values[known] = scores[ids[known]]
+        return dict(zip(ids.tolist(), values.tolist()))
+    
+    def top_k(self, query_text: str, index, k: int, file_type: Optional[str] = None, doc_ids: Optional[Iterable[int]] = None) -> List[Tuple[int, float]]:
+        """Return the k best (doc id, score) pairs, best first."""
+        scores = self.score(query_text, index, file_type, doc_ids)
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+
+# Singleton instance
+lexical_ranker = LexicalRanker()
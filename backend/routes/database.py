@@ -1,60 +1,113 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import FileResponse, JSONResponse
+from sqlalchemy import and_, func, or_
 from sqlalchemy.orm import Session
 from typing import List, Optional
+import hashlib
+import json
 import os
 
-from database import get_db
-from models import Document
+from database import get_db, get_read_db
+from models import Document, MatchState
+from ranking import lexical_ranker
+from text_index import text_index
+from pagination import encode_cursor, decode_cursor
+import category_counts
+import dedup
+import match_state
+import near_duplicates
+import profiles
+from categorizer import local_categorizer
 
 router = APIRouter(prefix="/documents", tags=["database"])
 
+# Columns that can be requested through `fields=`, mapped to their API names
+LISTING_COLUMNS = {
+    "id": Document.id,
+    "filename": Document.original_name,
+    "file_type": Document.file_type,
+    "category": Document.category,
+    "upload_date": Document.upload_date,
+    "file_size": Document.file_size,
+}
+MAX_PAGE_SIZE = 1000
+
 @router.get("")
 async def get_documents(
+    request: Request,
     file_type: Optional[str] = Query(None, description="Filter by 'cv' or 'jd'"),
     category: Optional[str] = Query(None, description="Filter by category"),
-    db: Session = Depends(get_db)
+    limit: int = Query(200, ge=1, le=MAX_PAGE_SIZE, description="Page size"),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    fields: Optional[str] = Query(None, description="Comma-separated subset of: " + ", ".join(LISTING_COLUMNS)),
+    db: Session = Depends(get_read_db)
 ):
-    """Get all documents with optional filtering."""
-    query = db.query(Document)
+    """List documents newest first, one keyset-paginated page at a time."""
+    selected = list(LISTING_COLUMNS) if not fields else [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in selected if f not in LISTING_COLUMNS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
     
+    keyset = decode_cursor(cursor) if cursor else None
+    filters = []
     if file_type:
-        query = query.filter(Document.file_type == file_type)
+        filters.append(Document.file_type == file_type)
     if category:
-        query = query.filter(Document.category == category)
+        filters.append(Document.category == category)
     
-    documents = query.order_by(Document.upload_date.desc()).all()
+    # Listed columns never change after upload, so inserts and deletes are the only changes a
+    # page can see: one aggregate probe over the filtered rows (served by the file_type /
+    # category indexes) yields the ETag before any page is read
+    total, max_id, max_upload_date = db.query(
+        func.count(Document.id), func.max(Document.id), func.max(Document.upload_date)
+    ).filter(*filters).one()
+    probe = [total, max_id, max_upload_date.isoformat() if max_upload_date else None, file_type, category, limit, cursor, selected]
+    etag = 'W/"' + hashlib.sha1(json.dumps(probe).encode()).hexdigest() + '"'
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
     
-    return {
-        "total": len(documents),
-        "documents": [
-            {
-                "id": doc.id,
-                "filename": doc.original_name,
-                "file_type": doc.file_type,
-                "category": doc.category,
-                "upload_date": doc.upload_date.isoformat(),
-                "file_size": doc.file_size
-            }
-            for doc in documents
-        ]
+    # upload_date and id are always read: they form the keyset cursor
+    columns = {name: LISTING_COLUMNS[name] for name in selected}
+    query = db.query(Document.upload_date.label("_upload_date"), Document.id.label("_id"), *[
+        column.label(name) for name, column in columns.items()
+    ]).filter(*filters)
+    
+    if keyset:
+        upload_date, doc_id = keyset
+        query = query.filter(or_(
+            Document.upload_date < upload_date,
+            and_(Document.upload_date == upload_date, Document.id < doc_id)
+        ))
+    
+    rows = query.order_by(Document.upload_date.desc(), Document.id.desc()).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    
+    documents = []
+    for row in rows:
+        item = {name: getattr(row, name) for name in columns}
+        if "upload_date" in item:
+            item["upload_date"] = item["upload_date"].isoformat()
+        documents.append(item)
+    
+    body = {
+        "total": total,
+        "documents": documents,
+        "next_cursor": encode_cursor(rows[-1]._upload_date, rows[-1]._id) if has_more else None
     }
+    return JSONResponse(body, headers={"ETag": etag})
 
 @router.get("/categories")
-async def get_categories(db: Session = Depends(get_db)):
+async def get_categories(db: Session = Depends(get_read_db)):
     """Get all categories with document counts."""
-    # Get all documents grouped by category and type
-    documents = db.query(Document).all()
-    
+    # Counters are maintained by the upload and delete routes
     categories = {}
-    for doc in documents:
-        if doc.category not in categories:
-            categories[doc.category] = {"cvs": 0, "jds": 0}
-        
-        if doc.file_type == "cv":
-            categories[doc.category]["cvs"] += 1
+    for row in category_counts.get_counts(db):
+        counts = categories.setdefault(row.category, {"cvs": 0, "jds": 0})
+        if row.file_type == "cv":
+            counts["cvs"] += row.count
         else:
-            categories[doc.category]["jds"] += 1
+            counts["jds"] += row.count
     
     return {
         "categories": [
@@ -68,8 +121,99 @@ async def get_categories(db: Session = Depends(get_db)):
         ]
     }
 
+@router.get("/search")
+async def search_documents(
+    q: str = Query(..., description="Free-text query"),
+    file_type: Optional[str] = Query(None, description="Filter by 'cv' or 'jd'"),
+    limit: int = Query(20, ge=1, le=200),
+    db: Session = Depends(get_db)
+):
+    """Rank documents against a free-text query using the text index."""
+    text_index.ensure_loaded(db)
+    ranked = [
+        (doc_id, score)
+        for doc_id, score in lexical_ranker.top_k(q, text_index, limit, file_type=file_type)
+        if score > 0
+    ]
+    
+    docs = {
+        row.id: row
+        for row in db.query(
+            Document.id, Document.original_name, Document.file_type, Document.category
+        ).filter(Document.id.in_([doc_id for doc_id, _ in ranked]))
+    }
+    
+    return {
+        "query": q,
+        "results": [
+            {
+                "id": doc_id,
+                "filename": docs[doc_id].original_name,
+                "file_type": docs[doc_id].file_type,
+                "category": docs[doc_id].category,
+                "score": round(score, 4)
+            }
+            for doc_id, score in ranked if doc_id in docs
+        ]
+    }
+
+@router.post("/maintenance/deduplicate")
+async def deduplicate_documents(
+    dry_run: bool = Query(True, description="Only report the duplicate groups"),
+    db: Session = Depends(get_db)
+):
+    """
+    Find documents with identical bytes or normalized text and merge each group
+    into its oldest document. Match history is re-pointed to the kept document.
+    """
+    return dedup.deduplicate(db, dry_run=dry_run)
+
+@router.get("/near-duplicates")
+async def get_near_duplicates(
+    file_type: str = Query("cv", pattern="^(cv|jd)$"),
+    threshold: float = Query(near_duplicates.NEAR_DUPLICATE_THRESHOLD, gt=0, le=1),
+    db: Session = Depends(get_db)
+):
+    """Clusters of near-duplicate documents (estimated Jaccard similarity >= threshold)."""
+    doc_ids = [doc_id for doc_id, in db.query(Document.id).filter(Document.file_type == file_type)]
+    clusters = near_duplicates.find_clusters(db, doc_ids, threshold)
+    # Signatures computed for older documents are kept for next time
+    db.commit()
+    
+    member_ids = [doc_id for cluster in clusters for doc_id in cluster["members"]]
+    names = dict(db.query(Document.id, Document.original_name).filter(Document.id.in_(member_ids))) if member_ids else {}
+    return {
+        "threshold": threshold,
+        "clusters": [
+            {
+                "representative": cluster["members"][-1],
+                "members": [
+                    {"id": doc_id, "filename": names.get(doc_id), "similarity": cluster["similarity"][doc_id]}
+                    for doc_id in cluster["members"]
+                ]
+            }
+            for cluster in clusters
+        ]
+    }
+
+@router.post("/maintenance/extract-profiles")
+async def extract_missing_profiles(
+    limit: int = Query(100, ge=1, le=1000, description="Documents to process in this call"),
+    db: Session = Depends(get_db)
+):
+    """Extract structured profiles for documents uploaded before profile extraction existed."""
+    return await profiles.backfill(db, limit)
+
+@router.post("/maintenance/train-categorizer")
+async def train_categorizer(db: Session = Depends(get_db)):
+    """
+    Retrain the local fast-path categorizer on LLM-categorized documents and
+    report how often it agrees with the LLM on held-out documents.
+    """
+    return local_categorizer.train(db)
+
 @router.get("/{document_id}")
-async def get_document(document_id: int, db: Session = Depends(get_db)):
+async def get_document(document_id: int, db: Session = Depends(get_read_db)):
     """Get document metadata by ID."""
     doc = db.query(Document).filter(Document.id == document_id).first()
     
@@ -83,11 +227,45 @@ async def get_document(document_id: int, db: Session = Depends(get_db)):
         "category": doc.category,
         "upload_date": doc.upload_date.isoformat(),
         "file_size": doc.file_size,
-        "file_path": doc.file_path
+        "file_path": doc.file_path,
+        "is_open": bool(doc.is_open)
     }
 
+@router.put("/{document_id}/open")
+async def set_jd_open(
+    document_id: int,
+    is_open: bool = Query(True, description="Open JDs are delta-matched against newly uploaded CVs"),
+    db: Session = Depends(get_db)
+):
+    """Mark a JD open (or closed) for automatic delta matching."""
+    doc = db.query(Document).filter(Document.id == document_id, Document.file_type == "jd").first()
+    
+    if not doc:
+        raise HTTPException(status_code=404, detail="Job Description not found")
+    
+    doc.is_open = is_open
+    db.commit()
+    
+    stored_rankings = db.query(MatchState.model, MatchState.prompt_version).filter(MatchState.jd_id == doc.id).all()
+    return {
+        "id": doc.id,
+        "is_open": doc.is_open,
+        # Only rankings built by an earlier match are extended automatically
+        "rankings": [{"model": model, "prompt_version": version} for model, version in stored_rankings]
+    }
+
+@router.get("/{document_id}/profile")
+async def get_document_profile(document_id: int, db: Session = Depends(get_read_db)):
+    """Get the structured profile (skills, titles, years, education, certifications) extracted at upload."""
+    profile = profiles.load(db, [document_id]).get(document_id)
+    
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    
+    return {"document_id": document_id, **profile}
+
 @router.get("/{document_id}/view")
-async def view_document(document_id: int, db: Session = Depends(get_db)):
+async def view_document(document_id: int, db: Session = Depends(get_read_db)):
     """Serve the document file for viewing."""
     doc = db.query(Document).filter(Document.id == document_id).first()
     
@@ -131,7 +309,11 @@ async def delete_document(document_id: int, db: Session = Depends(get_db)):
     if os.path.exists(doc.file_path):
         os.remove(doc.file_path)
     
-    # Delete from database
+    # Delete from database and the text index
+    text_index.remove_document(db, doc.id, doc.text_content)
+    profiles.delete(db, doc.id)
+    match_state.forget(db, [doc.id])
+    category_counts.adjust(db, doc.category, doc.file_type, -1)
     db.delete(doc)
     db.commit()
     
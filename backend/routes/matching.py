@@ -1,20 +1,60 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from pydantic import BaseModel
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session, aliased
+from pydantic import BaseModel, Field
 from typing import List, Optional
 from datetime import datetime
+import asyncio
 import json
 
-from database import get_db
-from models import Document, MatchResult
-from llm_service import llm_service
+from database import get_db, get_read_db, ReadSessionLocal
+from models import Document, MatchResult, MatchJob
+from match_pipeline import (
+    select_cvs, select_delta_cvs, select_jds, select_matrix, score_cvs, score_matrix, cascade_score_cvs,
+    collapse_near_duplicates, build_match_record, result_summary, prerank_summary
+)
+from match_jobs import match_job_manager, job_progress, FINISHED_STATUSES
+from pagination import encode_cursor, decode_cursor
+import match_state
+import profiles
 
 router = APIRouter(prefix="/match", tags=["matching"])
 
+# Seconds between database polls while streaming job results
+JOB_POLL_INTERVAL = 1.0
+
 class MatchRequest(BaseModel):
     jd_id: int
     cv_ids: Optional[List[int]] = None  # If None, match against all CVs
     model: Optional[str] = "openai"  # "openai" or "ollama"
+    force_refresh: bool = False  # Bypass cached results and re-run the LLM
+    top_k: Optional[int] = None  # If set, only the top-K CVs by pre-ranking go to the LLM
+    prerank: str = Field("bm25", pattern="^(bm25|profile)$")  # Pre-ranking: BM25 over text, or the profile pre-score
+    use_profiles: bool = False  # Send extracted profiles to the LLM instead of raw text, where available
+    collapse_near_duplicates: bool = False  # Score one representative per near-duplicate CV cluster
+    near_duplicate_threshold: Optional[float] = Field(None, gt=0, le=1)  # Defaults to NEAR_DUPLICATE_THRESHOLD
+    packed: bool = False  # Send several CVs per LLM request (listwise prompt) instead of one
+    # Cascade: `model` screens every CV, `rescore_model` rescores the top-K / those above the threshold
+    rescore_model: Optional[str] = None
+    rescore_top_k: Optional[int] = Field(None, ge=0)  # Defaults to CASCADE_TOP_K when no threshold is given
+    rescore_threshold: Optional[float] = Field(None, ge=0, le=100)
+    # Delta: score only CVs added since the JD's stored ranking (for this model/prompt) was last updated
+    delta: bool = False
+    top_n: Optional[int] = Field(None, ge=1)  # Delta only: return the top-N of the merged ranking
+
+class BulkMatchRequest(BaseModel):
+    jd_ids: Optional[List[int]] = None  # JDs to match; combined with `category`. Neither means every JD
+    category: Optional[str] = None  # Every JD in this category
+    open_only: bool = False  # Only JDs marked open
+    model: Optional[str] = "openai"
+    force_refresh: bool = False
+    same_category: bool = True  # Skip CVs whose category cannot fit the JD's (see COMPATIBLE_CATEGORIES)
+    top_k: Optional[int] = Field(None, ge=1)  # Per JD, only the top-K CVs by pre-ranking go to the LLM
+    prerank: str = Field("bm25", pattern="^(bm25|profile)$")
+    use_profiles: bool = False
+    packed: bool = False
+    top_n: Optional[int] = Field(None, ge=1)  # Results returned per JD
 
 @router.post("")
 async def match_cvs_to_jd(
@@ -31,110 +71,396 @@ async def match_cvs_to_jd(
     if not jd:
         raise HTTPException(status_code=404, detail="Job Description not found")
     
-    # Get CVs
-    if request.cv_ids:
-        cvs = db.query(Document).filter(
-            Document.id.in_(request.cv_ids),
-            Document.file_type == "cv"
-        ).all()
-    else:
-        # Match against all CVs
-        cvs = db.query(Document).filter(Document.file_type == "cv").all()
+    if request.delta:
+        if request.cv_ids is not None or request.rescore_model:
+            raise HTTPException(status_code=400, detail="delta cannot be combined with cv_ids or rescore_model")
+        async with match_state.lock(jd.id, request.model, match_state.prompt_version_for(request.packed)):
+            return await _delta_match(request, jd, db)
     
-    if not cvs:
+    # Get CVs; stage 1 is a cheap local pre-ranking (BM25 or profile pre-score)
+    last_cv_id = match_state.latest_cv_id(db)
+    cv_data, prerank_scores = select_cvs(db, jd, request.cv_ids, request.top_k, request.prerank)
+    
+    if not cv_data:
         raise HTTPException(status_code=404, detail="No CVs found")
     
-    # Prepare CV data for matching
-    cv_data = [
-        {
-            "id": cv.id,
-            "name": cv.original_name,
-            "text": cv.text_content
-        }
-        for cv in cvs
-    ]
+    shortlisted = len(cv_data)
+    near_duplicate_summary = None
+    if request.collapse_near_duplicates:
+        cv_data, near_duplicate_summary = collapse_near_duplicates(db, cv_data, request.near_duplicate_threshold)
+    
+    jd_text = None
+    if request.use_profiles:
+        jd_text, cv_data = profiles.compact_texts(db, jd, cv_data)
     
-    # Perform batch matching with selected model
-    match_results = await llm_service.batch_match(cv_data, jd.text_content, request.model)
+    cascade = None
+    if request.rescore_model:
+        match_results, cascade = await cascade_score_cvs(
+            db, jd, cv_data, request.model, request.rescore_model, request.rescore_top_k,
+            request.rescore_threshold, request.force_refresh, packed=request.packed, jd_text=jd_text
+        )
+    else:
+        match_results = await score_cvs(db, jd, cv_data, request.model, request.force_refresh,
+                                        packed=request.packed, jd_text=jd_text)
     
     # Save results to database
-    saved_results = []
     for result in match_results:
-        # Find the CV ID
-        cv_id = next((cv["id"] for cv in cv_data if cv["name"] == result["cv_name"]), None)
-        
-        if cv_id:
-            match_record = MatchResult(
-                cv_id=cv_id,
-                jd_id=jd.id,
-                score=result.get("score", 0),
-                explanation=result.get("summary", ""),
-                details_json=json.dumps(result)
-            )
-            db.add(match_record)
-            saved_results.append({
-                "cv_id": cv_id,
-                "cv_name": result["cv_name"],
-                "score": result.get("score", 0),
-                "match_level": result.get("match_level", "Unknown"),
-                "key_matches": result.get("key_matches", []),
-                "gaps": result.get("gaps", []),
-                "summary": result.get("summary", "")
-            })
+        db.add(build_match_record(result, jd.id))
+    
+    # A run over the whole corpus (re)builds the stored ranking that delta runs extend
+    if request.cv_ids is None and not request.rescore_model:
+        match_state.record(db, jd.id, request.model_dump(), match_results, last_cv_id)
     
     db.commit()
     
     return {
         "jd_id": jd.id,
         "jd_name": jd.original_name,
-        "total_cvs_matched": len(saved_results),
-        "results": saved_results
+        "total_cvs_matched": len(match_results),
+        "cache_hits": sum(1 for result in match_results if result["cached"]),
+        "prerank": prerank_summary(prerank_scores, shortlisted),
+        "near_duplicates": near_duplicate_summary,
+        "cascade": cascade,
+        "results": [result_summary(result, prerank_scores) for result in match_results]
     }
 
-@router.get("/history")
-async def get_match_history(
-    limit: int = 10,
+async def _delta_match(request: MatchRequest, jd: Document, db: Session) -> dict:
+    """Score only the CVs the JD's stored ranking has not seen, merge them in and return the updated ranking."""
+    cv_data, prerank_scores, delta, last_cv_id = select_delta_cvs(
+        db, jd, request.model, request.packed, request.top_k, request.prerank
+    )
+    shortlisted = len(cv_data)
+    near_duplicate_summary = None
+    if cv_data and request.collapse_near_duplicates:
+        cv_data, near_duplicate_summary = collapse_near_duplicates(db, cv_data, request.near_duplicate_threshold)
+    
+    jd_text = None
+    if cv_data and request.use_profiles:
+        jd_text, cv_data = profiles.compact_texts(db, jd, cv_data)
+    
+    match_results = await score_cvs(db, jd, cv_data, request.model, request.force_refresh,
+                                    packed=request.packed, jd_text=jd_text) if cv_data else []
+    
+    for result in match_results:
+        db.add(build_match_record(result, jd.id))
+    state = match_state.record(db, jd.id, request.model_dump(), match_results, last_cv_id)
+    db.commit()
+    
+    scored = {result["cv_id"]: result for result in match_results}
+    ranking = [scored.get(result["cv_id"], result) for result in match_state.ranking(db, state, request.top_n)]
+    
+    return {
+        "jd_id": jd.id,
+        "jd_name": jd.original_name,
+        "total_cvs_matched": len(match_results),
+        "cache_hits": sum(1 for result in match_results if result["cached"]),
+        "prerank": prerank_summary(prerank_scores, shortlisted),
+        "near_duplicates": near_duplicate_summary,
+        "cascade": None,
+        "delta": {**delta, "ranked": match_state.ranked_count(db, state)},
+        "results": [result_summary(result, prerank_scores) for result in ranking]
+    }
+
+@router.post("/bulk")
+async def bulk_match(
+    request: BulkMatchRequest,
     db: Session = Depends(get_db)
 ):
-    """Get recent match history."""
-    matches = db.query(MatchResult).order_by(
-        MatchResult.match_date.desc()
-    ).limit(limit).all()
-    
-    results = []
-    for match in matches:
-        cv = db.query(Document).filter(Document.id == match.cv_id).first()
-        jd = db.query(Document).filter(Document.id == match.jd_id).first()
-        
-        if cv and jd:
-            results.append({
-                "id": match.id,
-                "cv_name": cv.original_name,
+    """
+    Match several JDs against the CV pool in one run. CV x JD pairs are pruned by
+    category compatibility and per-JD pre-ranking; the remaining uncached pairs share
+    one LLM window, queued JD by JD. Returns one ranked list per JD.
+    """
+    jds = select_jds(db, request.jd_ids, request.category, request.open_only)
+    
+    if not jds:
+        raise HTTPException(status_code=404, detail="No Job Descriptions found")
+    
+    cv_lists, prerank_scores, pruning = select_matrix(db, jds, request.top_k, request.prerank, request.same_category)
+    
+    jd_texts = [None] * len(jds)
+    if request.use_profiles:
+        for index, jd in enumerate(jds):
+            jd_texts[index], cv_lists[index] = profiles.compact_texts(db, jd, cv_lists[index])
+    
+    match_results = await score_matrix(db, jds, cv_lists, request.model, request.force_refresh,
+                                       packed=request.packed, jd_texts=jd_texts)
+    
+    for jd, results in zip(jds, match_results):
+        for result in results:
+            db.add(build_match_record(result, jd.id))
+    
+    db.commit()
+    
+    cache_hits = sum(1 for results in match_results for result in results if result["cached"])
+    return {
+        "model": request.model,
+        "pruning": {**pruning, "cache_hits": cache_hits, "llm_pairs": pruning["after_prerank"] - cache_hits},
+        "rankings": [
+            {
+                "jd_id": jd.id,
                 "jd_name": jd.original_name,
-                "score": match.score,
-                "match_date": match.match_date.isoformat()
-            })
+                "total_cvs_matched": len(results),
+                "cache_hits": sum(1 for result in results if result["cached"]),
+                "results": [result_summary(result, scores) for result in results[:request.top_n]]
+            }
+            for jd, results, scores in zip(jds, match_results, prerank_scores)
+        ]
+    }
+
+@router.post("/bulk/jobs")
+async def submit_bulk_match_job(
+    request: BulkMatchRequest,
+    db: Session = Depends(get_db)
+):
+    """Start a bulk match in the background: one job per JD, all sharing one LLM window."""
+    jd_ids = [jd.id for jd in select_jds(db, request.jd_ids, request.category, request.open_only)]
+    
+    if not jd_ids:
+        raise HTTPException(status_code=404, detail="No Job Descriptions found")
+    
+    jobs = match_job_manager.submit_bulk(db, request.model_dump(), jd_ids)
+    return {"batch_id": jobs[0].batch_id, "jobs": [job_progress(job) for job in jobs]}
+
+@router.get("/bulk/jobs/{batch_id}")
+async def get_bulk_match_job(batch_id: str, db: Session = Depends(get_read_db)):
+    """Get progress of every per-JD job of a bulk match."""
+    jobs = db.query(MatchJob).filter(MatchJob.batch_id == batch_id).order_by(MatchJob.jd_id).all()
+    
+    if not jobs:
+        raise HTTPException(status_code=404, detail="Bulk match not found")
     
-    return {"matches": results}
+    return {
+        "batch_id": batch_id,
+        "done": sum(job.done for job in jobs),
+        "total": sum(job.total for job in jobs),
+        "finished_jobs": sum(1 for job in jobs if job.status in FINISHED_STATUSES),
+        "jobs": [job_progress(job) for job in jobs]
+    }
+
+@router.post("/jobs")
+async def submit_match_job(
+    request: MatchRequest,
+    db: Session = Depends(get_db)
+):
+    """Start a match in the background and return its job id immediately."""
+    jd = db.query(Document.id).filter(
+        Document.id == request.jd_id,
+        Document.file_type == "jd"
+    ).first()
+    
+    if not jd:
+        raise HTTPException(status_code=404, detail="Job Description not found")
+    
+    if request.delta and (request.cv_ids is not None or request.rescore_model):
+        raise HTTPException(status_code=400, detail="delta cannot be combined with cv_ids or rescore_model")
+    
+    job = match_job_manager.submit(db, request.model_dump())
+    return job_progress(job)
+
+@router.get("/jobs/{job_id}")
+async def get_match_job(job_id: str, db: Session = Depends(get_read_db)):
+    """Get progress (done/total/ETA) of a match job."""
+    job = db.get(MatchJob, job_id)
+    
+    if not job:
+        raise HTTPException(status_code=404, detail="Match job not found")
+    
+    return job_progress(job)
+
+@router.post("/jobs/{job_id}/cancel")
+async def cancel_match_job(job_id: str, db: Session = Depends(get_db)):
+    """Cancel a running match job; results written so far are kept."""
+    job = db.get(MatchJob, job_id)
+    
+    if not job:
+        raise HTTPException(status_code=404, detail="Match job not found")
+    
+    if job.status in FINISHED_STATUSES:
+        raise HTTPException(status_code=409, detail=f"Match job already {job.status}")
+    
+    # The owning worker stops the job on its next heartbeat; if it runs here, stop it now
+    job.cancel_requested = True
+    db.commit()
+    match_job_manager.cancel(job_id)
+    
+    return {"status": "success", "message": "Cancellation requested"}
+
+def _job_result(row: MatchResult, cv_name: Optional[str]) -> dict:
+    details = json.loads(row.details_json) if row.details_json else {}
+    details.setdefault("cv_id", row.cv_id)
+    details.setdefault("cv_name", cv_name or "Unknown")
+    summary = result_summary(details)
+    summary["id"] = row.id
+    return summary
+
+@router.get("/jobs/{job_id}/results")
+async def stream_match_job_results(
+    job_id: str,
+    format: str = Query("ndjson", pattern="^(ndjson|sse)$", description="'ndjson' or 'sse'")
+):
+    """
+    Stream a job's results as they are written.
+    Emits `result` events (each poll's new results in score order), `progress`
+    events, and a final `ranking` event with every result in score order
+    (for cascade jobs, rescored CVs first).
+    """
+    db = ReadSessionLocal()
+    try:
+        if db.get(MatchJob, job_id) is None:
+            raise HTTPException(status_code=404, detail="Match job not found")
+    finally:
+        db.close()
+    
+    def encode(event: str, data: dict) -> str:
+        if format == "sse":
+            return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+        return json.dumps({"type": event, **data}) + "\n"
+    
+    def job_rows(db: Session, after_id: int = 0):
+        return db.query(MatchResult, Document.original_name).outerjoin(
+            Document, Document.id == MatchResult.cv_id
+        ).filter(
+            MatchResult.job_id == job_id,
+            MatchResult.id > after_id
+        ).order_by(MatchResult.score.desc()).all()
+    
+    async def events():
+        last_id = 0
+        while True:
+            db = ReadSessionLocal()
+            try:
+                job = db.get(MatchJob, job_id)
+                rows = job_rows(db, last_id)
+                progress = job_progress(job)
+                ranking = [_job_result(row, name) for row, name in job_rows(db)] if job.status in FINISHED_STATUSES else None
+                if ranking:
+                    ranking.sort(key=lambda result: result.get("stage") == "rescore", reverse=True)
+            finally:
+                db.close()
+            
+            for row, name in rows:
+                last_id = max(last_id, row.id)
+                yield encode("result", _job_result(row, name))
+            yield encode("progress", progress)
+            
+            if ranking is not None:
+                yield encode("ranking", {"results": ranking})
+                break
+            await asyncio.sleep(JOB_POLL_INTERVAL)
+    
+    media_type = "text/event-stream" if format == "sse" else "application/x-ndjson"
+    return StreamingResponse(events(), media_type=media_type)
+
+@router.get("/history")
+async def get_match_history(
+    limit: int = Query(10, ge=1, le=500),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    jd_id: Optional[int] = None,
+    cv_id: Optional[int] = None,
+    min_score: Optional[float] = None,
+    max_score: Optional[float] = None,
+    since: Optional[datetime] = Query(None, description="Only matches on or after this time"),
+    until: Optional[datetime] = Query(None, description="Only matches before this time"),
+    db: Session = Depends(get_read_db)
+):
+    """Get recent match history, newest first, in a single joined query."""
+    cv = aliased(Document)
+    jd = aliased(Document)
+    query = db.query(
+        MatchResult.id,
+        MatchResult.score,
+        MatchResult.match_date,
+        cv.original_name.label("cv_name"),
+        jd.original_name.label("jd_name")
+    ).join(cv, cv.id == MatchResult.cv_id).join(jd, jd.id == MatchResult.jd_id)
+    
+    if jd_id is not None:
+        query = query.filter(MatchResult.jd_id == jd_id)
+    if cv_id is not None:
+        query = query.filter(MatchResult.cv_id == cv_id)
+    if min_score is not None:
+        query = query.filter(MatchResult.score >= min_score)
+    if max_score is not None:
+        query = query.filter(MatchResult.score <= max_score)
+    if since is not None:
+        query = query.filter(MatchResult.match_date >= since)
+    if until is not None:
+        query = query.filter(MatchResult.match_date < until)
+    if cursor:
+        match_date, match_id = decode_cursor(cursor)
+        query = query.filter(or_(
+            MatchResult.match_date < match_date,
+            and_(MatchResult.match_date == match_date, MatchResult.id < match_id)
+        ))
+    
+    rows = query.order_by(MatchResult.match_date.desc(), MatchResult.id.desc()).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    
+    return {
+        "matches": [
+            {
+                "id": row.id,
+                "cv_name": row.cv_name,
+                "jd_name": row.jd_name,
+                "score": row.score,
+                "match_date": row.match_date.isoformat()
+            }
+            for row in rows
+        ],
+        "next_cursor": encode_cursor(rows[-1].match_date, rows[-1].id) if has_more else None
+    }
+
+@router.get("/ranking/{jd_id}")
+async def get_stored_ranking(
+    jd_id: int,
+    model: str = "openai",
+    packed: bool = False,
+    top_n: Optional[int] = Query(None, ge=1),
+    db: Session = Depends(get_read_db)
+):
+    """Get a JD's stored ranking for a model, as built by full and delta matches."""
+    state = match_state.get(db, jd_id, model, match_state.prompt_version_for(packed))
+    
+    if state is None:
+        raise HTTPException(status_code=404, detail="No stored ranking for this JD and model")
+    
+    return {
+        "jd_id": jd_id,
+        "model": model,
+        "prompt_version": state.prompt_version,
+        "updated_at": state.updated_at.isoformat(),
+        "ranked": match_state.ranked_count(db, state),
+        "results": [result_summary(result) for result in match_state.ranking(db, state, top_n)]
+    }
 
 @router.get("/{match_id}")
-async def get_match_details(match_id: int, db: Session = Depends(get_db)):
+async def get_match_details(match_id: int, db: Session = Depends(get_read_db)):
     """Get detailed match results."""
-    match = db.query(MatchResult).filter(MatchResult.id == match_id).first()
+    cv = aliased(Document)
+    jd = aliased(Document)
+    row = db.query(
+        MatchResult.id,
+        MatchResult.score,
+        MatchResult.match_date,
+        MatchResult.details_json,
+        cv.original_name.label("cv_name"),
+        jd.original_name.label("jd_name")
+    ).outerjoin(cv, cv.id == MatchResult.cv_id).outerjoin(jd, jd.id == MatchResult.jd_id).filter(
+        MatchResult.id == match_id
+    ).first()
     
-    if not match:
+    if not row:
         raise HTTPException(status_code=404, detail="Match not found")
     
-    cv = db.query(Document).filter(Document.id == match.cv_id).first()
-    jd = db.query(Document).filter(Document.id == match.jd_id).first()
-    
-    details = json.loads(match.details_json) if match.details_json else {}
+    details = json.loads(row.details_json) if row.details_json else {}
     
     return {
-        "id": match.id,
-        "cv_name": cv.original_name if cv else "Unknown",
-        "jd_name": jd.original_name if jd else "Unknown",
-        "score": match.score,
-        "match_date": match.match_date.isoformat(),
+        "id": row.id,
+        "cv_name": row.cv_name or "Unknown",
+        "jd_name": row.jd_name or "Unknown",
+        "score": row.score,
+        "match_date": row.match_date.isoformat(),
         "details": details
     }
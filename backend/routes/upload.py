@@ -1,15 +1,23 @@
 from fastapi import APIRouter, UploadFile, File, Depends, HTTPException
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional, Tuple
 import os
 import shutil
 from datetime import datetime
 import uuid
+import asyncio
 
 from database import get_db
 from models import Document
 from document_parser import document_parser
-from llm_service import llm_service
+from text_index import text_index
+import category_counts
+import dedup
+import near_duplicates
+import profiles
+from categorizer import local_categorizer
+from match_jobs import match_job_manager
 
 router = APIRouter(prefix="/upload", tags=["upload"])
 
@@ -35,43 +43,91 @@ async def save_uploaded_file(file: UploadFile, doc_type: str, category: str) ->
     
     return file_path, unique_filename, file_size
 
+def _duplicate_result(filename: str, existing_id: int, category: str) -> dict:
+    return {
+        "id": existing_id,
+        "filename": filename,
+        "category": category,
+        "status": "duplicate",
+        "duplicate_of": existing_id
+    }
+
 @router.post("/cv")
 async def upload_cvs(
     files: List[UploadFile] = File(...),
     db: Session = Depends(get_db)
 ):
-    """Upload one or more CV files."""
+    """
+    Upload one or more CV files.
+    Files whose bytes or normalized text match a stored CV (or an earlier file in
+    the same request) are not stored again; they are reported as duplicates.
+    """
     results = []
     errors = []
+    duplicates = []
     
+    # Save (and hash) every file first, then run them all through the upload pipeline concurrently
+    pending = []
     for file in files:
+        # Validate file type
+        if not document_parser.validate_file(file.filename):
+            errors.append({
+                "filename": file.filename,
+                "error": "Unsupported file format. Only PDF and DOCX are supported."
+            })
+            continue
+        
+        temp_path = f"temp_{uuid.uuid4()}{os.path.splitext(file.filename)[1]}"
         try:
-            # Validate file type
-            if not document_parser.validate_file(file.filename):
-                errors.append({
-                    "filename": file.filename,
-                    "error": "Unsupported file format. Only PDF and DOCX are supported."
-                })
-                continue
-            
-            # Save file temporarily to extract text
-            temp_path = f"temp_{uuid.uuid4()}{os.path.splitext(file.filename)[1]}"
-            with open(temp_path, "wb") as buffer:
-                shutil.copyfileobj(file.file, buffer)
-            
-            # Extract text
-            text_content = document_parser.extract_text(temp_path)
+            content_hash = dedup.save_and_hash(file.file, temp_path)
+            pending.append((file, temp_path, content_hash))
+        except Exception as e:
+            errors.append({
+                "filename": file.filename,
+                "error": str(e)
+            })
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+    
+    # Byte-identical files are caught before any parsing or LLM work
+    stored = dedup.existing_by_content_hash(db, "cv", list({content_hash for _, _, content_hash in pending}))
+    claimed_content = {}
+    claimed_text = {}
+    profiles_by_position = {}
+    
+    async def prepare(position: int, file: UploadFile, temp_path: str, content_hash: str) -> Document:
+        """Parse, categorize and file one CV; raises ValueError with a per-file error message."""
+        try:
+            if content_hash in stored:
+                raise dedup.DuplicateDocument(*stored[content_hash])
+            if content_hash in claimed_content:
+                raise dedup.DuplicateDocument(source=claimed_content[content_hash])
+            claimed_content[content_hash] = position
             
+            # Extract text off the event loop
+            text_content = await document_parser.extract_text_async(temp_path)
             if not text_content:
-                os.remove(temp_path)
-                errors.append({
-                    "filename": file.filename,
-                    "error": "Could not extract text from file"
-                })
-                continue
+                raise ValueError("Could not extract text from file")
+            
+            # Same text in a different container (re-exported PDF, DOCX copy) is also a duplicate
+            text_hash = dedup.normalized_text_hash(text_content)
+            existing = dedup.find_existing(db, "cv", text_hash=text_hash)
+            if existing:
+                raise dedup.DuplicateDocument(*existing)
+            if text_hash in claimed_text:
+                raise dedup.DuplicateDocument(source=claimed_text[text_hash])
+            claimed_text[text_hash] = position
             
-            # Categorize using LLM
-            category = await llm_service.categorize_document(text_content, "cv")
+            # Categorize from the compact digest (locally when confident, else via the LLM)
+            # and extract the structured profile (LLM, bounded by the backend's concurrency
+            # limiter) while the MinHash signature is computed in the parser pool
+            digest = document_parser.build_digest(text_content, "cv")
+            (category, category_source), profile, minhash = await asyncio.gather(
+                local_categorizer.categorize(db, digest, "cv"),
+                profiles.extract(text_content, "cv"),
+                near_duplicates.signature_async(text_content)
+            )
+            profiles_by_position[position] = profile
             
             # Move file to proper category folder
             file_ext = os.path.splitext(file.filename)[1]
@@ -81,43 +137,143 @@ async def upload_cvs(
             final_path = os.path.join(category_dir, unique_filename)
             shutil.move(temp_path, final_path)
             
-            file_size = os.path.getsize(final_path)
-            
-            # Save to database
-            doc = Document(
+            return Document(
                 filename=unique_filename,
                 original_name=file.filename,
                 file_type="cv",
                 category=category,
+                category_source=category_source,
                 file_path=final_path,
-                file_size=file_size,
-                text_content=text_content
+                file_size=os.path.getsize(final_path),
+                text_content=text_content,
+                content_hash=content_hash,
+                text_hash=text_hash,
+                minhash=minhash,
+                digest=digest
             )
-            db.add(doc)
-            db.commit()
-            db.refresh(doc)
-            
-            results.append({
-                "id": doc.id,
+        finally:
+            # Clean up temp file if it is still there
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+    
+    # Each file flows through parse -> categorize independently; nothing waits for the slowest file
+    prepared = await asyncio.gather(
+        *(prepare(position, *item) for position, item in enumerate(pending)),
+        return_exceptions=True
+    )
+    
+    docs = []
+    doc_at = {}
+    for position, ((file, _, _), outcome) in enumerate(zip(pending, prepared)):
+        if isinstance(outcome, dedup.DuplicateDocument):
+            duplicates.append((file, outcome))
+        elif isinstance(outcome, Document):
+            docs.append(outcome)
+            doc_at[position] = outcome
+        else:
+            # Any other exception, including a CancelledError (a BaseException) from the parser pool
+            errors.append({
                 "filename": file.filename,
-                "category": category,
-                "status": "success"
+                "error": str(outcome) or type(outcome).__name__
             })
-            
+    
+    # Insert every CV in one transaction. A concurrent upload of the same file can be stored
+    # after the duplicate checks above; the unique content hash index then rejects the flush.
+    # After a rollback, files whose bytes are now stored are reported as duplicates of the
+    # stored copy and the rest are inserted again
+    raced = {}
+    while doc_at:
+        try:
+            db.add_all(doc_at.values())
+            db.flush()
+            break
+        except IntegrityError as e:
+            db.rollback()
+            stored = dedup.existing_by_content_hash(db, "cv", [doc.content_hash for doc in doc_at.values()])
+            lost = [position for position, doc in doc_at.items() if doc.content_hash in stored]
+            if not lost:
+                for doc in doc_at.values():
+                    errors.append({
+                        "filename": doc.original_name,
+                        "error": str(e)
+                    })
+                lost = list(doc_at)
+            for position in lost:
+                doc = doc_at.pop(position)
+                if doc.content_hash in stored:
+                    raced[position] = stored[doc.content_hash]
+                    duplicates.append((pending[position][0], dedup.DuplicateDocument(*stored[doc.content_hash])))
+                if os.path.exists(doc.file_path):
+                    os.remove(doc.file_path)
+            for doc in doc_at.values():
+                doc.id = None  # Ids handed out by the rolled-back insert
+    docs = list(doc_at.values())
+    
+    # Index and count the stored documents in the same transaction
+    if docs:
+        try:
+            text_index.add_documents(db, [(doc.id, "cv", doc.text_content) for doc in docs])
+            for position, doc in doc_at.items():
+                profiles.save(db, doc.id, "cv", profiles_by_position.get(position))
+            category_counts.adjust_many(db, docs)
+            db.commit()
         except Exception as e:
+            db.rollback()
+            for doc in docs:
+                errors.append({
+                    "filename": doc.original_name,
+                    "error": str(e)
+                })
+                if os.path.exists(doc.file_path):
+                    os.remove(doc.file_path)
+            docs = []
+            doc_at = {}
+    
+    for doc in docs:
+        results.append({
+            "id": doc.id,
+            "filename": doc.original_name,
+            "category": doc.category,
+            "categorized_by": doc.category_source,
+            "status": "success"
+        })
+    
+    def resolve(duplicate: dedup.DuplicateDocument) -> Optional[Tuple[int, str]]:
+        """(id, category) of the stored document a duplicate ends up pointing at, following earlier files in the request."""
+        while duplicate.source is not None:
+            source = duplicate.source
+            if source in doc_at:
+                return doc_at[source].id, doc_at[source].category
+            if source in raced:
+                return raced[source]
+            if not isinstance(prepared[source], dedup.DuplicateDocument):
+                return None
+            duplicate = prepared[source]
+        return duplicate.existing_id, duplicate.category
+    
+    duplicate_count = 0
+    for file, duplicate in duplicates:
+        existing = resolve(duplicate)
+        if existing is None:
+            # The file it duplicates was not stored either; report it alongside
             errors.append({
                 "filename": file.filename,
-                "error": str(e)
+                "error": f"Duplicate of {pending[duplicate.source][0].filename}, which was not stored"
             })
-            # Clean up temp file if it exists
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
+            continue
+        duplicate_count += 1
+        results.append(_duplicate_result(file.filename, *existing))
+    
+    # Extend the stored rankings of open JDs with just the new CVs
+    delta_jobs = [job.id for job in match_job_manager.submit_open_deltas(db)] if docs else []
     
     return {
-        "uploaded": len(results),
+        "uploaded": len(docs),
+        "duplicates": duplicate_count,
         "failed": len(errors),
         "results": results,
-        "errors": errors
+        "errors": errors,
+        "delta_jobs": delta_jobs
     }
 
 @router.post("/jd")
@@ -125,7 +281,9 @@ async def upload_jd(
     file: UploadFile = File(...),
     db: Session = Depends(get_db)
 ):
-    """Upload a Job Description file."""
+    """Upload a Job Description file; an identical JD already stored is returned instead."""
+    temp_path = None
+    final_path = None
     try:
         # Validate file type
         if not document_parser.validate_file(file.filename):
@@ -134,23 +292,37 @@ async def upload_jd(
                 detail="Unsupported file format. Only PDF and DOCX are supported."
             )
         
-        # Save file temporarily to extract text
+        # Save file temporarily to extract text, hashing it on the way
         temp_path = f"temp_{uuid.uuid4()}{os.path.splitext(file.filename)[1]}"
-        with open(temp_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        content_hash = dedup.save_and_hash(file.file, temp_path)
         
-        # Extract text
-        text_content = document_parser.extract_text(temp_path)
+        existing = dedup.find_existing(db, "jd", content_hash=content_hash)
+        text_content = None
+        text_hash = None
+        if not existing:
+            # Extract text off the event loop
+            text_content = await document_parser.extract_text_async(temp_path)
+            
+            if not text_content:
+                os.remove(temp_path)
+                raise HTTPException(
+                    status_code=400,
+                    detail="Could not extract text from file"
+                )
+            
+            text_hash = dedup.normalized_text_hash(text_content)
+            existing = dedup.find_existing(db, "jd", text_hash=text_hash)
         
-        if not text_content:
+        if existing:
             os.remove(temp_path)
-            raise HTTPException(
-                status_code=400,
-                detail="Could not extract text from file"
-            )
+            return _duplicate_result(file.filename, *existing)
         
-        # Categorize using LLM
-        category = await llm_service.categorize_document(text_content, "jd")
+        # Categorize from the compact digest (locally when confident) and extract the structured profile
+        digest = document_parser.build_digest(text_content, "jd")
+        (category, category_source), profile = await asyncio.gather(
+            local_categorizer.categorize(db, digest, "jd"),
+            profiles.extract(text_content, "jd")
+        )
         
         # Move file to proper category folder
         file_ext = os.path.splitext(file.filename)[1]
@@ -168,11 +340,28 @@ async def upload_jd(
             original_name=file.filename,
             file_type="jd",
             category=category,
+            category_source=category_source,
             file_path=final_path,
             file_size=file_size,
-            text_content=text_content
+            text_content=text_content,
+            content_hash=content_hash,
+            text_hash=text_hash,
+            digest=digest
         )
         db.add(doc)
+        try:
+            db.flush()
+        except IntegrityError:
+            # A concurrent upload of the same file was stored first
+            db.rollback()
+            existing = dedup.find_existing(db, "jd", content_hash=content_hash)
+            if not existing:
+                raise
+            os.remove(final_path)
+            return _duplicate_result(file.filename, *existing)
+        text_index.add_document(db, doc.id, "jd", text_content)
+        profiles.save(db, doc.id, "jd", profile)
+        category_counts.adjust(db, category, "jd", 1)
         db.commit()
         db.refresh(doc)
         
@@ -180,12 +369,15 @@ async def upload_jd(
             "id": doc.id,
             "filename": file.filename,
             "category": category,
+            "categorized_by": category_source,
             "status": "success"
         }
         
     except HTTPException:
         raise
     except Exception as e:
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
+        db.rollback()
+        for path in (temp_path, final_path):
+            if path and os.path.exists(path):
+                os.remove(path)
         raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,9 @@
+import os
+import sys
+import tempfile
+
+# The database URL is read at import time, so point it at a scratch file first
+WORKDIR = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(WORKDIR, 'test.db')}"
+os.environ["EXTRACT_PROFILES"] = "false"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,43 @@
+import asyncio
+from database import SessionLocal, init_db
+from llm_service import llm_service
+from models import Document, DocumentProfile
+import profiles
+
+
+def test_backfill_moves_past_documents_that_keep_failing(monkeypatch):
+    init_db()
+    db = SessionLocal()
+    try:
+        db.query(DocumentProfile).delete()
+        docs = [
+            Document(filename=f"backfill-{i}.docx", original_name=f"backfill-{i}.docx", file_type="cv", category="Software Engineering",
+                     text_content="broken" if i < 2 else f"cv {i}", content_hash=f"backfill-{i}")
+            for i in range(4)
+        ]
+        db.add_all(docs)
+        db.commit()
+        ids = {doc.id for doc in docs}
+
+        async def extract_profile(text, doc_type, model):
+            return None if text == "broken" else {"skills": ["python"]}
+
+        monkeypatch.setattr(llm_service, "extract_profile", extract_profile)
+        monkeypatch.setattr(profiles, "PROFILE_MAX_ATTEMPTS", 2)
+
+        def run(limit):
+            return asyncio.run(profiles.backfill(db, limit))
+
+        first = run(2)
+        assert first["failed"] == 2
+        # The failed documents go to the back of the queue instead of being picked again
+        second = run(2)
+        assert second["extracted"] == 2
+        assert set(profiles.load(db, ids)) == ids - {docs[0].id, docs[1].id}
+
+        third = run(10)
+        assert third["failed"] == 2
+        assert third["remaining"] == 0 and third["abandoned"] >= 2
+        assert run(10)["processed"] == 0
+    finally:
+        db.close()
@@ -0,0 +1,132 @@
+import glob
+import hashlib
+import io
+import os
+
+import pytest
+from docx import Document as Docx
+from fastapi.testclient import TestClient
+
+import app as app_module
+from database import SessionLocal
+from llm_service import llm_service
+from models import Document
+from routes import upload
+from text_index import text_index
+
+from conftest import WORKDIR
+
+
+def docx_bytes(text: str) -> bytes:
+    doc = Docx()
+    doc.add_paragraph(text)
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue()
+
+
+def document_count() -> int:
+    db = SessionLocal()
+    try:
+        return db.query(Document).count()
+    finally:
+        db.close()
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.chdir(WORKDIR)
+
+    async def categorize(text, doc_type, model="gpt-4o-mini"):
+        return "Software Engineering"
+
+    monkeypatch.setattr(llm_service, "categorize_document", categorize)
+    monkeypatch.setattr(upload.local_categorizer, "categorize", lambda db, text, doc_type: _llm_category())
+    with TestClient(app_module.app) as test_client:
+        yield test_client
+
+
+async def _llm_category():
+    return "Software Engineering", "llm"
+
+
+def stored_files() -> list:
+    return glob.glob(os.path.join(WORKDIR, "uploads", "**", "*.docx"), recursive=True)
+
+
+def test_cv_upload_leaves_no_rows_when_indexing_fails(client, monkeypatch):
+    before, files_before = document_count(), len(stored_files())
+
+    def fail(db, docs):
+        raise RuntimeError("index unavailable")
+
+    monkeypatch.setattr(text_index, "add_documents", fail)
+    response = client.post("/api/upload/cv", files=[
+        ("files", ("one.docx", docx_bytes("indexing failure cv one"), "application/octet-stream")),
+        ("files", ("two.docx", docx_bytes("indexing failure cv two"), "application/octet-stream")),
+    ])
+
+    assert response.status_code == 200
+    assert response.json()["uploaded"] == 0
+    assert response.json()["failed"] == 2
+    assert document_count() == before
+    assert len(stored_files()) == files_before
+
+
+def test_jd_upload_leaves_no_rows_when_indexing_fails(client, monkeypatch):
+    before, files_before = document_count(), len(stored_files())
+
+    def fail(db, doc_id, file_type, text):
+        raise RuntimeError("index unavailable")
+
+    monkeypatch.setattr(text_index, "add_document", fail)
+    response = client.post("/api/upload/jd", files={
+        "file": ("jd.docx", docx_bytes("indexing failure jd"), "application/octet-stream")
+    })
+
+    assert response.status_code == 500
+    assert document_count() == before
+    assert len(stored_files()) == files_before
+
+
+def test_byte_copy_of_a_text_duplicate_is_a_duplicate(client):
+    stored = client.post("/api/upload/cv", files=[
+        ("files", ("original.docx", docx_bytes("python kubernetes copy chain"), "application/octet-stream")),
+    ]).json()["results"][0]
+
+    copy = docx_bytes("PYTHON   Kubernetes copy chain")
+    response = client.post("/api/upload/cv", files=[
+        ("files", ("a.docx", copy, "application/octet-stream")),
+        ("files", ("b.docx", copy, "application/octet-stream")),
+    ]).json()
+
+    assert response["errors"] == []
+    assert response["duplicates"] == 2
+    assert {result["duplicate_of"] for result in response["results"]} == {stored["id"]}
+
+
+def test_cv_stored_concurrently_is_reported_as_duplicate(client, monkeypatch):
+    content = docx_bytes("raced cv stored by another request")
+    other = docx_bytes("cv uploaded alongside it")
+    original_extract = upload.document_parser.extract_text_async
+
+    async def extract_then_race(path, *args, **kwargs):
+        text = await original_extract(path, *args, **kwargs)
+        if "raced" in text:
+            # Another request stores the same bytes after this one's duplicate checks
+            db = SessionLocal()
+            db.add(Document(filename="first.docx", original_name="first.docx", file_type="cv",
+                            category="Software Engineering", content_hash=hashlib.sha256(content).hexdigest()))
+            db.commit()
+            db.close()
+        return text
+
+    monkeypatch.setattr(upload.document_parser, "extract_text_async", extract_then_race)
+    response = client.post("/api/upload/cv", files=[
+        ("files", ("second.docx", content, "application/octet-stream")),
+        ("files", ("other.docx", other, "application/octet-stream")),
+    ]).json()
+
+    statuses = {result["filename"]: result["status"] for result in response["results"]}
+    assert statuses == {"second.docx": "duplicate", "other.docx": "success"}
+    assert response["errors"] == []
@@ -0,0 +1,239 @@
+from array import array
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from models import Document, IndexPosting, IndexedDocument
+from ranking import tokenize
+
+# Keep IN (...) lists well under SQLite's bound-parameter limit
+_TERM_CHUNK = 500
+
+
+def _decode(blob: bytes) -> array:
+    postings = array("I")
+    postings.frombytes(blob)
+    return postings
+
+
+def _pairs(postings: array) -> np.ndarray:
+    """Zero-copy (n, 2) view of a posting list: column 0 doc ids, column 1 term frequencies."""
+    return np.frombuffer(postings, dtype=np.uintc).reshape(-1, 2)
+
+
+class InvertedIndex:
+    """
+    Term -> posting list index over document text.
+    Posting lists are array('I') of interleaved (doc_id, term_frequency) pairs, kept
+    in memory and persisted one blob per term in the index_postings table.
+    Loaded lazily on first use and updated incrementally on upload and delete.
+    Corpus statistics for BM25 (documents, total length and per-term document
+    frequency, per file type) are kept up to date alongside the postings, so scoring
+    never recounts them.
+    """
+    
+    def __init__(self):
+        self.postings: Dict[str, array] = {}
+        self.doc_lengths: Dict[int, int] = {}
+        self.doc_types: Dict[int, str] = {}
+        self.doc_freq: Dict[str, Counter] = {}  # file type -> term -> documents containing it
+        self.type_docs = Counter()  # file type -> indexed documents
+        self.type_tokens = Counter()  # file type -> total document length
+        self._lengths: Optional[np.ndarray] = None
+        self.loaded = False
+    
+    def _clear(self):
+        self.postings.clear()
+        self.doc_lengths.clear()
+        self.doc_types.clear()
+        self.doc_freq.clear()
+        self.type_docs.clear()
+        self.type_tokens.clear()
+        self._lengths = None
+    
+    def ensure_loaded(self, db: Session):
+        """
+        Load the persisted index, building it from the documents table the first time.
+        Reloads when another worker process has changed the persisted index.
+        """
+        if self.loaded:
+            if not self._is_stale(db):
+                return
+            self._clear()
+            self.loaded = False
+        
+        docs = db.query(IndexedDocument.doc_id, IndexedDocument.file_type, IndexedDocument.length).all()
+        if not docs and db.query(Document.id).first() is not None:
+            self.rebuild(db)
+            return
+        
+        for doc_id, file_type, length in docs:
+            self.doc_lengths[doc_id] = length
+            self.doc_types[doc_id] = file_type
+            self.type_docs[file_type] += 1
+            self.type_tokens[file_type] += length
+        for term, blob in db.query(IndexPosting.term, IndexPosting.postings).yield_per(1000):
+            self.postings[term] = _decode(blob)
+        self._count_doc_freq()
+        self.loaded = True
+        print(f"✅ Text index loaded ({len(self.doc_lengths)} documents, {len(self.postings)} terms)")
+    
+    def _is_stale(self, db: Session) -> bool:
+        count, max_id = db.query(func.count(IndexedDocument.doc_id), func.max(IndexedDocument.doc_id)).one()
+        return (count, max_id) != (len(self.doc_lengths), max(self.doc_lengths, default=None))
+    
+    def _count_doc_freq(self):
+        """Per-type document frequency of every term, from the loaded postings."""
+        type_names = sorted(self.type_docs)
+        codes = np.zeros(max(self.doc_lengths, default=0) + 1, dtype=np.intp)
+        for doc_id, file_type in self.doc_types.items():
+            codes[doc_id] = type_names.index(file_type) + 1
+        self.doc_freq = {file_type: Counter() for file_type in type_names}
+        for term, postings in self.postings.items():
+            counts = np.bincount(codes[_pairs(postings)[:, 0]], minlength=len(type_names) + 1)
+            for code, file_type in enumerate(type_names, start=1):
+                if counts[code]:
+                    self.doc_freq[file_type][term] = int(counts[code])
+    
+    def rebuild(self, db: Session):
+        """Re-index every document from scratch and persist the result."""
+        self._clear()
+        
+        rows = db.query(Document.id, Document.file_type, Document.text_content).yield_per(200)
+        for doc_id, file_type, text in rows:
+            self._index(doc_id, file_type, Counter(tokenize(text)))
+        
+        db.query(IndexPosting).delete()
+        db.query(IndexedDocument).delete()
+        db.bulk_save_objects([
+            IndexedDocument(doc_id=doc_id, file_type=self.doc_types[doc_id], length=length)
+            for doc_id, length in self.doc_lengths.items()
+        ])
+        db.bulk_save_objects([
+            IndexPosting(term=term, postings=postings.tobytes())
+            for term, postings in self.postings.items()
+        ])
+        db.commit()
+        self.loaded = True
+        print(f"✅ Text index rebuilt ({len(self.doc_lengths)} documents, {len(self.postings)} terms)")
+    
+    def _index(self, doc_id: int, file_type: str, terms: Counter):
+        for term, freq in terms.items():
+            self.postings.setdefault(term, array("I")).extend((doc_id, freq))
+        self.doc_lengths[doc_id] = sum(terms.values())
+        self.doc_types[doc_id] = file_type
+        self.doc_freq.setdefault(file_type, Counter()).update(terms.keys())
+        self.type_docs[file_type] += 1
+        self.type_tokens[file_type] += self.doc_lengths[doc_id]
+        self._lengths = None
+    
+    def _persist_terms(self, db: Session, terms: Iterable[str]):
+        terms = list(terms)
+        for start in range(0, len(terms), _TERM_CHUNK):
+            chunk = terms[start:start + _TERM_CHUNK]
+            existing = {
+                row.term: row
+                for row in db.query(IndexPosting).filter(IndexPosting.term.in_(chunk))
+            }
+            for term in chunk:
+                postings = self.postings.get(term)
+                row = existing.get(term)
+                if postings is None:
+                    if row is not None:
+                        db.delete(row)
+                elif row is not None:
+                    row.postings = postings.tobytes()
+                else:
+                    db.add(IndexPosting(term=term, postings=postings.tobytes()))
+        # Sessions don't autoflush; later lookups in this transaction must see the new rows
+        db.flush()
+    
+    def add_document(self, db: Session, doc_id: int, file_type: str, text: str):
+        """Index a newly inserted document; the caller commits the session."""
+        self.add_documents(db, [(doc_id, file_type, text)])
+    
+    def add_documents(self, db: Session, docs: Iterable[Tuple[int, str, str]]):
+        """Index newly inserted (doc_id, file_type, text) documents, persisting each touched term once."""
+        self.ensure_loaded(db)
+        touched = set()
+        for doc_id, file_type, text in docs:
+            if doc_id in self.doc_lengths:
+                continue
+            terms = Counter(tokenize(text))
+            self._index(doc_id, file_type, terms)
+            db.add(IndexedDocument(doc_id=doc_id, file_type=file_type, length=self.doc_lengths[doc_id]))
+            touched.update(terms)
+        self._persist_terms(db, touched)
+    
+    def remove_document(self, db: Session, doc_id: int, text: Optional[str]):
+        """Drop a document's postings; the caller commits the session."""
+        self.ensure_loaded(db)
+        if doc_id not in self.doc_lengths:
+            return
+        file_type = self.doc_types[doc_id]
+        type_freq = self.doc_freq.get(file_type, Counter())
+        terms = set(tokenize(text))
+        for term in terms:
+            postings = self.postings.get(term)
+            if postings is None:
+                continue
+            pairs = _pairs(postings)
+            keep = pairs[:, 0] != doc_id
+            if keep.all():
+                continue
+            type_freq[term] -= 1
+            if type_freq[term] <= 0:
+                del type_freq[term]
+            if keep.any():
+                kept = array("I")
+                kept.frombytes(pairs[keep].tobytes())
+                self.postings[term] = kept
+            else:
+                del self.postings[term]
+        self.type_docs[file_type] -= 1
+        self.type_tokens[file_type] -= self.doc_lengths[doc_id]
+        del self.doc_lengths[doc_id]
+        del self.doc_types[doc_id]
+        self._lengths = None
+        db.query(IndexedDocument).filter(IndexedDocument.doc_id == doc_id).delete()
+        self._persist_terms(db, terms)
+    
+    def corpus_stats(self, file_type: Optional[str] = None) -> Tuple[int, float]:
+        """(number of documents, average length) over the indexed documents of file_type (all if None)."""
+        if file_type is None:
+            n_docs, tokens = sum(self.type_docs.values()), sum(self.type_tokens.values())
+        else:
+            n_docs, tokens = self.type_docs[file_type], self.type_tokens[file_type]
+        return n_docs, (tokens / n_docs if n_docs else 0) or 1.0
+    
+    def doc_frequency(self, term: str, file_type: Optional[str] = None) -> int:
+        """Number of indexed documents of file_type (all if None) containing term."""
+        if file_type is None:
+            return len(self.postings.get(term, ())) // 2
+        return self.doc_freq.get(file_type, Counter())[term]
+    
+    def posting_pairs(self, term: str) -> Optional[np.ndarray]:
+        """(n, 2) array of (doc id, term frequency) for term, or None if no document contains it."""
+        postings = self.postings.get(term)
+        return _pairs(postings) if postings else None
+    
+    def length_array(self) -> np.ndarray:
+        """Document lengths as a float array indexed by doc id (0 where not indexed)."""
+        if self._lengths is None:
+            lengths = np.zeros(max(self.doc_lengths, default=0) + 1)
+            if self.doc_lengths:
+                lengths[list(self.doc_lengths)] = list(self.doc_lengths.values())
+            self._lengths = lengths
+        return self._lengths
+    
+    def doc_ids(self, file_type: Optional[str] = None) -> List[int]:
+        if file_type is None:
+            return list(self.doc_lengths)
+        return [doc_id for doc_id, doc_type in self.doc_types.items() if doc_type == file_type]
+
+
+# Singleton instance
+text_index = InvertedIndex()
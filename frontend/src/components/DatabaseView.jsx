@@ -12,6 +12,9 @@ const DatabaseView = () => {
     const [searchQuery, setSearchQuery] = useState('');
     const [viewingDocument, setViewingDocument] = useState(null);
     const [loading, setLoading] = useState(true);
+    const [total, setTotal] = useState(0);
+    const [nextCursor, setNextCursor] = useState(null);
+    const [loadingMore, setLoadingMore] = useState(false);
 
     useEffect(() => {
         loadData();
@@ -29,6 +32,8 @@ const DatabaseView = () => {
             ]);
 
             setDocuments(docsData.documents || []);
+            setTotal(docsData.total || 0);
+            setNextCursor(docsData.next_cursor);
             setCategories(catsData.categories || []);
         } catch (error) {
             console.error('Error loading data:', error);
@@ -37,6 +42,23 @@ const DatabaseView = () => {
         }
     };
 
+    const loadMore = async () => {
+        setLoadingMore(true);
+        try {
+            const docsData = await getDocuments(
+                selectedType === 'all' ? null : selectedType,
+                selectedCategory,
+                nextCursor
+            );
+            setDocuments(prev => [...prev, ...(docsData.documents || [])]);
+            setNextCursor(docsData.next_cursor);
+        } catch (error) {
+            console.error('Error loading more documents:', error);
+        } finally {
+            setLoadingMore(false);
+        }
+    };
+
     const handleDelete = async (id) => {
         if (window.confirm('Are you sure you want to delete this document?')) {
             try {
@@ -195,6 +217,16 @@ const DatabaseView = () => {
                             </div>
                         ))
                     )}
+
+                    {!loading && nextCursor && (
+                        <button
+                            className="btn btn-secondary load-more-btn"
+                            onClick={loadMore}
+                            disabled={loadingMore}
+                        >
+                            {loadingMore ? 'Loading...' : `Load more (${documents.length} of ${total})`}
+                        </button>
+                    )}
                 </div>
             </div>
 
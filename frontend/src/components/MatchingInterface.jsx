@@ -7,6 +7,9 @@ import './MatchingInterface.css';
 const MatchingInterface = () => {
     const [jds, setJds] = useState([]);
     const [cvs, setCvs] = useState([]);
+    const [jdCursor, setJdCursor] = useState(null);
+    const [cvCursor, setCvCursor] = useState(null);
+    const [cvTotal, setCvTotal] = useState(0);
     const [filteredCvs, setFilteredCvs] = useState([]);
     const [selectedJD, setSelectedJD] = useState(null);
     const [selectedCVs, setSelectedCVs] = useState([]);
@@ -41,6 +44,9 @@ const MatchingInterface = () => {
 
             setJds(jdData.documents || []);
             setCvs(cvData.documents || []);
+            setJdCursor(jdData.next_cursor);
+            setCvCursor(cvData.next_cursor);
+            setCvTotal(cvData.total || 0);
 
             if (jdData.documents && jdData.documents.length > 0) {
                 setSelectedJD(jdData.documents[0].id);
@@ -50,6 +56,27 @@ const MatchingInterface = () => {
         }
     };
 
+    // Further pages are fetched only when asked for
+    const loadMoreJDs = async () => {
+        try {
+            const jdData = await getDocuments('jd', null, jdCursor);
+            setJds(prev => [...prev, ...(jdData.documents || [])]);
+            setJdCursor(jdData.next_cursor);
+        } catch (error) {
+            console.error('Error loading more JDs:', error);
+        }
+    };
+
+    const loadMoreCVs = async () => {
+        try {
+            const cvData = await getDocuments('cv', null, cvCursor);
+            setCvs(prev => [...prev, ...(cvData.documents || [])]);
+            setCvCursor(cvData.next_cursor);
+        } catch (error) {
+            console.error('Error loading more CVs:', error);
+        }
+    };
+
     const filterCVs = () => {
         let filtered = cvs;
 
@@ -214,6 +241,11 @@ const MatchingInterface = () => {
                             ))
                         )}
                     </select>
+                    {jdCursor && (
+                        <button onClick={loadMoreJDs} className="btn-secondary load-more-btn">
+                            Load more JDs
+                        </button>
+                    )}
                 </div>
 
                 {/* Model Selection */}
@@ -337,6 +369,11 @@ const MatchingInterface = () => {
                             ))
                         )}
                     </div>
+                    {cvCursor && (
+                        <button onClick={loadMoreCVs} className="btn-secondary load-more-btn">
+                            Load more CVs ({cvs.length} of {cvTotal})
+                        </button>
+                    )}
                 </div>
 
                 <button
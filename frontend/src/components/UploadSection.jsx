@@ -229,6 +229,12 @@ const UploadSection = ({ onUploadComplete, onSwitchToMatch }) => {
                             <span className="stat-value">{cvUploadResults.uploaded}</span>
                             <span className="stat-label">CVs Uploaded</span>
                         </div>
+                        {cvUploadResults.duplicates > 0 && (
+                            <div className="stat">
+                                <span className="stat-value">{cvUploadResults.duplicates}</span>
+                                <span className="stat-label">Already Stored</span>
+                            </div>
+                        )}
                         {cvUploadResults.failed > 0 && (
                             <div className="stat error">
                                 <span className="stat-value">{cvUploadResults.failed}</span>
@@ -46,11 +46,13 @@ export const uploadJD = async (file) => {
 };
 
 // Document APIs
-export const getDocuments = async (fileType = null, category = null) => {
-  const params = {};
+export const getDocuments = async (fileType = null, category = null, cursor = null, limit = 200) => {
+  const params = { limit };
   if (fileType) params.file_type = fileType;
   if (category) params.category = category;
+  if (cursor) params.cursor = cursor;
 
+  // One keyset-paginated page; pass its next_cursor back to load the next page on demand
   const response = await api.get('documents', { params });
   return response.data;
 };